@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import time
+
+from csv_validator.config import S3JsonLoader
+from csv_validator.notifications import CsvEmailNotifier
+from csv_validator.rules import FileFormatValidator, ValidateSchema, ValidationSuite
+
+from .bench_ranged_read import make_csv, paths
+from .local_s3 import latency_proxy, local_s3, s3_client, s3_filesystem
+
+
+BUCKET = "bench-bucket"
+CONFIG_KEY = "config/schema.json"
+SENDER = "validator@example.com"
+
+
+def event(files):
+    return {"Records": [{"s3": {"bucket": {"name": BUCKET},
+                                "object": {"key": f"reports/{i}.csv"}}}
+                        for i in range(files)]}
+
+
+def suite(session, s3fs, concurrency):
+    rules = [
+        FileFormatValidator("FileFormatValidator", "", concurrency=concurrency),
+        ValidateSchema("ValidateSchema", "", S3JsonLoader(BUCKET, CONFIG_KEY),
+                       filesystem=s3fs, concurrency=concurrency)
+    ]
+    return ValidationSuite(rules, CsvEmailNotifier(SENDER, [SENDER], session))
+
+
+def run_sync(session, s3fs, files, concurrency):
+    start = time.perf_counter()
+    suite(session, s3fs, concurrency).validate(event(files), session)
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed
+
+
+def run_async(session, s3fs, files, concurrency):
+    async def main():
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(2 * concurrency + files + 2))
+        runner = suite(session, s3fs, concurrency)
+        start = time.perf_counter()
+        await runner.validate_async(event(files), session)
+        results = time.perf_counter() - start
+        await runner.wait_for_notification()
+        return results, time.perf_counter() - start
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-f", "--files", type=int, default=8,
+                        help="Records in the event")
+    parser.add_argument("-s", "--size-mb", type=int, default=2,
+                        help="Size of each generated csv")
+    parser.add_argument("-l", "--latency-ms", type=float, default=20,
+                        help="Latency added to every request to the stand-in")
+    parser.add_argument("-c", "--concurrency", type=int, default=4)
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="Runs of each, the fastest is reported")
+    parser.add_argument("-e", "--endpoint",
+                        help="S3/SES compatible endpoint, moto's server if not given")
+    args = parser.parse_args()
+
+    content = make_csv(args.size_mb)
+    with local_s3(args.endpoint) as (session, _, endpoint):
+        client = s3_client(session, endpoint)
+        client.create_bucket(Bucket=BUCKET)
+        client.put_object(Bucket=BUCKET, Key=CONFIG_KEY,
+                          Body=json.dumps({"paths": paths(False)}).encode("utf-8"))
+        for i in range(args.files):
+            body = content
+            if i == args.files - 1:
+                # A failure, so the notifier has an email to send.
+                body = content + b"x|bad|row|0\n"
+            client.put_object(Bucket=BUCKET, Key=f"reports/{i}.csv", Body=body)
+        session.client("ses", endpoint_url=endpoint).verify_email_identity(
+            EmailAddress=SENDER)
+        with latency_proxy(endpoint, args.latency_ms) as proxy:
+            # Config and notifications go through boto3, which picks this up.
+            os.environ["AWS_ENDPOINT_URL"] = proxy
+            s3fs = s3_filesystem(proxy)
+            sync = min(run_sync(session, s3fs, args.files, args.concurrency)
+                       for _ in range(args.repeat))
+            asynchronous = min(run_async(session, s3fs, args.files, args.concurrency)
+                               for _ in range(args.repeat))
+    print(f"files x size (MB):          {args.files} x {len(content) / 1024 / 1024:.1f}")
+    print(f"latency per request (ms):   {args.latency_ms:.0f}")
+    print(f"sync (s):                   {sync[1]:.3f}")
+    print(f"async, results (s):         {asynchronous[0]:.3f}")
+    print(f"async, notified (s):        {asynchronous[1]:.3f} "
+          f"({(1 - asynchronous[1] / sync[1]) * 100:.0f}% faster)")
+
+
+if __name__ == '__main__':
+    main()
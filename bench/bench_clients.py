@@ -0,0 +1,87 @@
+import argparse
+import os
+import time
+
+import boto3
+import pyarrow.fs as fs
+
+from csv_validator.clients import clear_pools, log_setup, pool, setup_stats
+
+from .local_s3 import ACCESS_KEY, REGION, SECRET_KEY, latency_proxy, local_s3
+from .local_s3 import s3_client
+
+
+BUCKET = "bench-bucket"
+CONFIG_KEY = "config/schema.json"
+DATA_KEY = "reports/a.csv"
+
+
+def fresh_setup(endpoint):
+    # What every invocation did before: a new session, clients and
+    # filesystem, with the region left to be worked out.
+    session = boto3.session.Session()
+    s3 = session.client("s3")
+    session.client("sesv2")
+    scheme, _, host = endpoint.partition("://")
+    return s3, fs.S3FileSystem(scheme=scheme, endpoint_override=host)
+
+
+def pooled_setup():
+    clients = pool()
+    session = clients.session()
+    s3 = session.client("s3")
+    session.client("sesv2")
+    return s3, clients.filesystem()
+
+
+def invocation(setup):
+    start = time.perf_counter()
+    s3, filesystem = setup()
+    setup_seconds = time.perf_counter() - start
+    s3.get_object(Bucket=BUCKET, Key=CONFIG_KEY)["Body"].read()
+    with filesystem.open_input_stream(f"{BUCKET}/{DATA_KEY}") as stream:
+        stream.read()
+    return setup_seconds, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--invocations", type=int, default=20,
+                        help="Warm invocations to simulate")
+    parser.add_argument("-l", "--latency-ms", type=float, default=10,
+                        help="Latency added to every request to the stand-in")
+    parser.add_argument("-e", "--endpoint",
+                        help="S3 compatible endpoint, moto's server if not given")
+    args = parser.parse_args()
+
+    with local_s3(args.endpoint) as (session, _, endpoint):
+        client = s3_client(session, endpoint)
+        client.create_bucket(Bucket=BUCKET)
+        client.put_object(Bucket=BUCKET, Key=CONFIG_KEY, Body=b'{"paths": []}')
+        client.put_object(Bucket=BUCKET, Key=DATA_KEY, Body=b"id|name\n1|a\n")
+        with latency_proxy(endpoint, args.latency_ms) as proxy:
+            os.environ.update(AWS_ENDPOINT_URL=proxy, AWS_ACCESS_KEY_ID=ACCESS_KEY,
+                              AWS_SECRET_ACCESS_KEY=SECRET_KEY, AWS_REGION=REGION,
+                              AWS_DEFAULT_REGION=REGION)
+            fresh = [invocation(lambda: fresh_setup(proxy))
+                     for _ in range(args.invocations)]
+            clear_pools()
+            pooled = []
+            for _ in range(args.invocations):
+                before = setup_stats()
+                pooled.append(invocation(pooled_setup))
+                log_setup(before)
+    print(f"invocations:                    {args.invocations}")
+    print(f"latency per request (ms):       {args.latency_ms:.0f}")
+    for name, runs in [("fresh", fresh), ("pooled", pooled)]:
+        first_setup, first_total = runs[0]
+        warm = runs[1:] or runs
+        setup = sum(run[0] for run in warm) / len(warm) * 1000
+        total = sum(run[1] for run in warm) / len(warm) * 1000
+        print(f"{name + ' first (ms):':32}setup {first_setup * 1000:.1f}, "
+              f"total {first_total * 1000:.1f}")
+        print(f"{name + ' warm (ms):':32}setup {setup:.1f}, total {total:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import time
+import unittest.mock as mock
+
+import pyarrow
+
+from csv_validator.rules import SUCCESS, ValidateSchema
+
+from .bench_ranged_read import make_csv, paths
+from .local_s3 import local_s3, s3_client
+
+
+BUCKET = "bench-bucket"
+CODECS = [(None, "csv"), ("gzip", "csv.gz"), ("zstd", "csv.zst"),
+          ("bz2", "csv.bz2")]
+
+
+def compress(content, codec):
+    if codec is None:
+        return content
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.CompressedOutputStream(sink, codec) as out:
+        out.write(content)
+    return sink.getvalue().to_pybytes()
+
+
+def run(s3fs, key):
+    rule = ValidateSchema("bench", "", mock.MagicMock(), filesystem=s3fs)
+    rule.paths = paths(False)
+    start = time.perf_counter()
+    status, message = rule.check_file(BUCKET, key)
+    elapsed = time.perf_counter() - start
+    if status != SUCCESS:
+        raise RuntimeError(message)
+    return elapsed, rule.stats[f"{BUCKET}/{key}"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--size-mb", type=int, default=128,
+                        help="Size of the generated csv, uncompressed")
+    parser.add_argument("-e", "--endpoint", default=None,
+                        help="S3 compatible endpoint (default: start moto)")
+    args = parser.parse_args()
+
+    content = make_csv(args.size_mb)
+    size_mb = len(content) / 1024 / 1024
+    print(f"csv size (MB): {size_mb:.1f}")
+    print(f"{'codec':<8}{'object MB':>12}{'seconds':>10}{'csv MB/s':>10}")
+    with local_s3(args.endpoint) as (session, s3fs, endpoint):
+        client = s3_client(session, endpoint)
+        client.create_bucket(Bucket=BUCKET)
+        for codec, extension in CODECS:
+            key = f"reports/bench.{extension}"
+            body = compress(content, codec)
+            client.put_object(Bucket=BUCKET, Key=key, Body=body)
+            elapsed, stats = run(s3fs, key)
+            fetched_mb = stats["bytes_fetched"] / 1024 / 1024
+            print(f"{codec or 'none':<8}{fetched_mb:>12.1f}{elapsed:>10.2f}"
+                  f"{size_mb / elapsed:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import json
+import re
+import statistics
+import time
+
+from csv_validator.compiled import compile_config, read_artifact
+from csv_validator.patterns import compile_paths
+
+
+def make_config(paths, fields):
+    """
+    A config with a mix of prefixed and unprefixed patterns, like one
+    grown over time for many feeds.
+    """
+    return {"paths": [
+        {
+            "pattern": (f"feeds/team{index}/.*\\.csv" if index % 3
+                        else f".*/feed{index}_[0-9]+\\.csv"),
+            "delimiter": ",",
+            "primary_key": "c0",
+            "fields": [{"name": f"c{column}", "type": "int64", "nullable": column > 0}
+                       for column in range(fields)]
+        }
+        for index in range(paths)
+    ]}
+
+
+def cold_load(load, data, key):
+    # Python caches compiled regexes, which a cold start wouldn't have.
+    re.purge()
+    start = time.perf_counter()
+    config = load(data)
+    compile_paths(config["paths"]).match(key).schema
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--paths", type=int, default=2000)
+    parser.add_argument("-f", "--fields", type=int, default=20)
+    parser.add_argument("-n", "--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    config = make_config(args.paths, args.fields)
+    raw = json.dumps(config, indent=4).encode("utf-8")
+    start = time.perf_counter()
+    artifact = compile_config(config, raw)
+    compile_seconds = time.perf_counter() - start
+    key = f"feeds/team{args.paths - 1}/a.csv"
+    # Each load gets a new config object, as after a cold start.
+    plain = [cold_load(json.loads, raw, key) for _ in range(args.repeat)]
+    compiled = [cold_load(read_artifact, artifact, key) for _ in range(args.repeat)]
+    print(f"paths:                    {args.paths}")
+    print(f"json lines:               {len(raw.splitlines())}")
+    print(f"json bytes:               {len(raw)}")
+    print(f"artifact bytes:           {len(artifact)}")
+    print(f"compile (ms):             {compile_seconds * 1000:.1f}")
+    print(f"json load+match (ms):     {statistics.median(plain) * 1000:.1f}")
+    print(f"compiled load+match (ms): {statistics.median(compiled) * 1000:.1f}")
+
+
+if __name__ == '__main__':
+    main()
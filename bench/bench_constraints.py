@@ -0,0 +1,72 @@
+import argparse
+import tempfile
+import time
+import unittest.mock as mock
+
+import pyarrow.fs
+
+from csv_validator.rules import SUCCESS, ValidateSchema
+
+from .bench_ranged_read import make_csv, paths
+
+
+KEY = "reports/constraints.csv"
+
+
+def constrained_paths():
+    config = paths(False)
+    fields = {field["name"]: field for field in config[0]["fields"]}
+    fields["id"]["constraints"] = {"non_negative": True}
+    fields["name"]["constraints"] = {"regex": "name-[0-9]+", "max_length": 32}
+    fields["amount"]["constraints"] = {"min": 0, "max": 1e12}
+    fields["score"]["constraints"] = {"enum": list(range(97))}
+    config[0]["constraints"] = [
+        {"name": "amount_follows_id",
+         "when": {"column": "score", "gt": 0},
+         "check": {"column": "amount", "le": {"column": "id"}}}
+    ]
+    return config
+
+
+def run(filesystem, config):
+    rule = ValidateSchema("bench", "", mock.MagicMock(), filesystem=filesystem)
+    rule.paths = config
+    start = time.perf_counter()
+    status, message = rule.check_file("bench", KEY)
+    elapsed = time.perf_counter() - start
+    if status != SUCCESS:
+        raise RuntimeError(message)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--size-mb", type=int, default=128,
+                        help="Size of the generated csv")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="Runs of each, the fastest is reported")
+    parser.add_argument("-m", "--max-overhead", type=float, default=100,
+                        help="Percent the constraints may add to the plain "
+                             "scan before the benchmark fails")
+    args = parser.parse_args()
+
+    content = make_csv(args.size_mb)
+    size_mb = len(content) / 1024 / 1024
+    with tempfile.TemporaryDirectory() as tmp:
+        filesystem = pyarrow.fs.SubTreeFileSystem(tmp, pyarrow.fs.LocalFileSystem())
+        filesystem.create_dir("bench/reports")
+        with filesystem.open_output_stream(f"bench/{KEY}") as out:
+            out.write(content)
+        plain = min(run(filesystem, paths(False)) for _ in range(args.repeat))
+        constrained = min(run(filesystem, constrained_paths())
+                          for _ in range(args.repeat))
+    overhead = (constrained / plain - 1) * 100
+    print(f"csv size (MB):              {size_mb:.1f}")
+    print(f"plain scan (s):             {plain:.2f}")
+    print(f"with constraints (s):       {constrained:.2f} (+{overhead:.0f}%)")
+    if overhead > args.max_overhead:
+        raise SystemExit(f"constraint overhead is over {args.max_overhead}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import time
+
+import pyarrow
+
+from csv_validator.rules import missing_key_mask, primary_key_columns
+
+
+def make_batches(rows, batch_size):
+    keys = pyarrow.array([f"key-{i}" for i in range(batch_size)])
+    values = pyarrow.array([float(i) for i in range(batch_size)])
+    batch = pyarrow.record_batch([keys, values], names=["id", "value"])
+    return [batch] * (rows // batch_size)
+
+
+def legacy_check(batches, primary_key):
+    # The old per-value loop, kept here for comparison.
+    for batch in batches:
+        table = pyarrow.Table.from_batches([batch])
+        for val in table[primary_key]:
+            if val.as_py() == "":
+                return True
+    return False
+
+
+def vectorized_check(batches, primary_key):
+    columns = primary_key_columns(primary_key)
+    for batch in batches:
+        if missing_key_mask(batch, columns).true_count:
+            return True
+    return False
+
+
+def timed(func, batches, rows):
+    start = time.perf_counter()
+    func(batches, "id")
+    elapsed = time.perf_counter() - start
+    return elapsed * 1_000_000 / rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--rows", type=int, default=1_000_000,
+                        help="Number of rows to check")
+    parser.add_argument("-b", "--batch-size", type=int, default=65536,
+                        help="Rows per record batch")
+    args = parser.parse_args()
+
+    batches = make_batches(args.rows, args.batch_size)
+    rows = sum(batch.num_rows for batch in batches)
+    legacy = timed(legacy_check, batches, rows)
+    vectorized = timed(vectorized_check, batches, rows)
+    print(f"rows checked:               {rows}")
+    print(f"as_py() loop (s/1M rows):   {legacy:.4f}")
+    print(f"compute kernel (s/1M rows): {vectorized:.4f}")
+    print(f"speedup:                    {legacy / vectorized:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
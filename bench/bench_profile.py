@@ -0,0 +1,61 @@
+import argparse
+import tempfile
+import time
+import unittest.mock as mock
+
+import pyarrow.fs
+
+from csv_validator.rules import SUCCESS, ValidateSchema
+
+from .bench_ranged_read import make_csv, paths
+
+
+KEY = "reports/profile.csv"
+
+
+def run(filesystem, profile):
+    rule = ValidateSchema("bench", "", mock.MagicMock(), filesystem=filesystem)
+    rule.paths = paths(False)
+    rule.paths[0]["profile"] = profile
+    start = time.perf_counter()
+    status, message = rule.check_file("bench", KEY)
+    elapsed = time.perf_counter() - start
+    if status != SUCCESS:
+        raise RuntimeError(message)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--size-mb", type=int, default=128,
+                        help="Size of the generated csv")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="Runs of each, the fastest is reported")
+    parser.add_argument("-m", "--max-overhead", type=float, default=300,
+                        help="Percent profiling every column may add to the "
+                             "plain scan before the benchmark fails")
+    args = parser.parse_args()
+
+    content = make_csv(args.size_mb)
+    size_mb = len(content) / 1024 / 1024
+    with tempfile.TemporaryDirectory() as tmp:
+        filesystem = pyarrow.fs.SubTreeFileSystem(tmp, pyarrow.fs.LocalFileSystem())
+        filesystem.create_dir("bench/reports")
+        with filesystem.open_output_stream(f"bench/{KEY}") as out:
+            out.write(content)
+        plain = min(run(filesystem, False) for _ in range(args.repeat))
+        numeric = min(run(filesystem, {"columns": ["id", "amount", "score"]})
+                      for _ in range(args.repeat))
+        full = min(run(filesystem, True) for _ in range(args.repeat))
+    print(f"csv size (MB):              {size_mb:.1f}")
+    print(f"plain scan (s):             {plain:.2f}")
+    print(f"profile numeric (s):        {numeric:.2f} "
+          f"(+{(numeric / plain - 1) * 100:.0f}%)")
+    print(f"profile all columns (s):    {full:.2f} "
+          f"(+{(full / plain - 1) * 100:.0f}%)")
+    if (full / plain - 1) * 100 > args.max_overhead:
+        raise SystemExit(f"profile overhead is over {args.max_overhead}%")
+
+
+if __name__ == '__main__':
+    main()
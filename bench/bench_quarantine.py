@@ -0,0 +1,64 @@
+import argparse
+import tempfile
+import time
+import unittest.mock as mock
+
+import pyarrow.fs
+
+from csv_validator.rules import ValidateSchema
+
+from .bench_ranged_read import make_csv, paths
+
+
+KEY = "reports/quarantine.csv"
+
+
+def add_bad_rows(content, every):
+    lines = content.split(b"\n")
+    for index in range(1, len(lines) - 1, every):
+        lines[index] = b"x" + lines[index]
+    return b"\n".join(lines)
+
+
+def run(filesystem, quarantine):
+    rule = ValidateSchema("bench", "", mock.MagicMock(), filesystem=filesystem)
+    rule.paths = paths(False)
+    rule.paths[0]["quarantine"] = quarantine
+    start = time.perf_counter()
+    status, message = rule.check_file("bench", KEY)
+    elapsed = time.perf_counter() - start
+    return elapsed, status, rule.stats[f"bench/{KEY}"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--size-mb", type=int, default=128,
+                        help="Size of the generated csv")
+    parser.add_argument("-b", "--bad-every", type=int, default=10000,
+                        help="Make every nth row fail to convert")
+    args = parser.parse_args()
+
+    content = make_csv(args.size_mb)
+    size_mb = len(content) / 1024 / 1024
+    with tempfile.TemporaryDirectory() as tmp:
+        filesystem = pyarrow.fs.SubTreeFileSystem(tmp, pyarrow.fs.LocalFileSystem())
+        filesystem.create_dir("bench/reports")
+        with filesystem.open_output_stream(f"bench/{KEY}") as out:
+            out.write(content)
+        fail_fast, _, _ = run(filesystem, False)
+        clean, _, _ = run(filesystem, {"max_rows": 0})
+        with filesystem.open_output_stream(f"bench/{KEY}") as out:
+            out.write(add_bad_rows(content, args.bad_every))
+        dirty, _, stats = run(filesystem, {"max_rows": len(content)})
+        stopped, _, stopped_stats = run(filesystem, {"max_rows": 0})
+    print(f"csv size (MB):             {size_mb:.1f}")
+    print(f"fail fast (s):             {fail_fast:.2f} ({size_mb / fail_fast:.1f} MB/s)")
+    print(f"quarantine, clean (s):     {clean:.2f} ({size_mb / clean:.1f} MB/s)")
+    print(f"quarantine, dirty (s):     {dirty:.2f} ({size_mb / dirty:.1f} MB/s, "
+          f"{stats['quarantined_rows']} rows quarantined)")
+    print(f"quarantine, over limit (s): {stopped:.2f} (stopped after "
+          f"{stopped_stats['quarantine_stopped_at']} rows)")
+
+
+if __name__ == '__main__':
+    main()
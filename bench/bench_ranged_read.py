@@ -0,0 +1,86 @@
+import argparse
+import io
+import time
+import unittest.mock as mock
+
+from csv_validator.rules import SUCCESS, ValidateSchema
+
+from .local_s3 import local_s3, s3_client
+
+
+BUCKET = "bench-bucket"
+KEY = "reports/ranged.csv"
+
+
+def make_csv(size_mb):
+    buffer = io.StringIO()
+    buffer.write("id|name|amount|score\n")
+    row = 0
+    target = size_mb * 1024 * 1024
+    while buffer.tell() < target:
+        lines = [f"{i}|name-{i}|{i * 0.25}|{i % 97}\n"
+                 for i in range(row, row + 10000)]
+        buffer.write("".join(lines))
+        row += 10000
+    return buffer.getvalue().encode("utf-8")
+
+
+def paths(ranged_read):
+    return [{
+        "pattern": "reports/.*",
+        "delimiter": "|",
+        "primary_key": "id",
+        "ranged_read": ranged_read,
+        "fields": [
+            {"name": "id", "type": "int64", "nullable": False},
+            {"name": "name", "type": "string", "nullable": True},
+            {"name": "amount", "type": "double", "nullable": True},
+            {"name": "score", "type": "int64", "nullable": True}
+        ]
+    }]
+
+
+def run(s3fs, ranged_read):
+    rule = ValidateSchema("bench", "", mock.MagicMock(), filesystem=s3fs)
+    rule.paths = paths(ranged_read)
+    start = time.perf_counter()
+    status, message = rule.check_file(BUCKET, KEY)
+    elapsed = time.perf_counter() - start
+    if status != SUCCESS:
+        raise RuntimeError(message)
+    return elapsed, rule.stats[f"{BUCKET}/{KEY}"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--size-mb", type=int, default=256,
+                        help="Size of the generated csv")
+    parser.add_argument("-p", "--part-size-mb", type=float, default=16,
+                        help="Bytes per ranged GET")
+    parser.add_argument("-c", "--concurrency", type=int, default=8,
+                        help="Ranged GETs/parses in flight")
+    parser.add_argument("-e", "--endpoint", default=None,
+                        help="S3 compatible endpoint (default: start moto)")
+    args = parser.parse_args()
+
+    content = make_csv(args.size_mb)
+    with local_s3(args.endpoint) as (session, s3fs, endpoint):
+        client = s3_client(session, endpoint)
+        client.create_bucket(Bucket=BUCKET)
+        client.put_object(Bucket=BUCKET, Key=KEY, Body=content)
+        stream_time, stream_stats = run(s3fs, False)
+        ranged = {"part_size_mb": args.part_size_mb,
+                  "concurrency": args.concurrency}
+        ranged_time, ranged_stats = run(s3fs, ranged)
+    size_mb = len(content) / 1024 / 1024
+    print(f"object size (MB):        {size_mb:.1f}")
+    print(f"single stream (s):       {stream_time:.2f} "
+          f"({size_mb / stream_time:.1f} MB/s)")
+    print(f"ranged (s):              {ranged_time:.2f} "
+          f"({size_mb / ranged_time:.1f} MB/s, "
+          f"{ranged_stats['ranged_gets']} GETs)")
+    print(f"speedup:                 {stream_time / ranged_time:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import json
+import subprocess
+import sys
+
+
+MODULE = "csv_validator.handler"
+# Only loaded when a feature that needs them is used.
+LAZY_MODULES = ["asyncio", "email.mime", "pyarrow.acero", "pyarrow.dataset",
+                "pyarrow.parquet", "sqlite3"]
+
+
+def import_times(module):
+    """
+    Import a module in a fresh interpreter with -X importtime.
+
+    :returns: tuple of (dict of module to cumulative microseconds, list of
+              the lazy modules that were loaded)
+    """
+    check = f"import sys, {module}; print([m for m in {LAZY_MODULES!r} if m in sys.modules])"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", check],
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times, json.loads(result.stdout.strip().replace("'", '"'))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--repeat", type=int, default=5,
+                        help="Fresh interpreters to import in, the fastest "
+                             "time per module is reported")
+    parser.add_argument("-t", "--top", type=int, default=15,
+                        help="Slowest modules to list")
+    parser.add_argument("-b", "--baseline",
+                        help="Json file of a previous run's times to compare to")
+    parser.add_argument("-s", "--save", help="Write this run's times to a json file")
+    parser.add_argument("-m", "--max-regression", type=float, default=25,
+                        help="Percent the handler's import time may grow over "
+                             "the baseline before the benchmark fails")
+    args = parser.parse_args()
+
+    best = {}
+    for _ in range(args.repeat):
+        times, loaded = import_times(MODULE)
+        for name, value in times.items():
+            best[name] = min(value, best.get(name, value))
+    total = best[MODULE]
+    print(f"{MODULE} (ms):{total / 1000:>28.1f}")
+    ours = sorted(((value, name) for name, value in best.items()
+                   if name.startswith("csv_validator")), reverse=True)
+    others = sorted(((value, name) for name, value in best.items()
+                     if "." not in name), reverse=True)
+    for title, rows in [("csv_validator modules", ours),
+                        ("top level packages", others[:args.top])]:
+        print(f"\n{title} (cumulative ms):")
+        for value, name in rows:
+            print(f"  {name:40}{value / 1000:8.1f}")
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(best, f, indent=2, sort_keys=True)
+    if loaded:
+        raise SystemExit(f"Loaded at import, should be lazy: {', '.join(loaded)}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        growth = (total / baseline[MODULE] - 1) * 100
+        print(f"\nchange from baseline: {growth:+.0f}%")
+        for name in sorted(set(best) - set(baseline)):
+            if "." not in name:
+                print(f"  new: {name} ({best[name] / 1000:.1f} ms)")
+        if growth > args.max_regression:
+            raise SystemExit(f"import time grew over {args.max_regression}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import pyarrow
+
+from csv_validator.config import S3JsonLoader
+from csv_validator.memory import peak_rss
+from csv_validator.notifications import CollectingNotifier
+from csv_validator.rules import FileFormatValidator, ValidateSchema, ValidationSuite
+
+from .generate import generate_csv, load_path
+from .local_s3 import latency_proxy, local_s3, s3_client, s3_filesystem
+
+
+BUCKET = "bench-bucket"
+CONFIG_KEY = "config/schema.json"
+PERCENTILES = [50, 90, 99]
+
+
+def percentiles(values):
+    """
+    Nearest rank percentiles of some values.
+
+    :returns: dict of "p50", "p90" etc. to the value.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+    return {f"p{p}": ordered[min(len(ordered) - 1, max(0, -(-p * len(ordered) // 100) - 1))]
+            for p in PERCENTILES}
+
+
+def event(keys):
+    return {"Records": [{"s3": {"bucket": {"name": BUCKET}, "object": {"key": key}}}
+                        for key in keys]}
+
+
+def run(session, s3fs, keys, concurrency):
+    """
+    Validate every file in one event, as the handler would.
+
+    :returns: tuple of (seconds, results, ValidateSchema's per file stats)
+    """
+    schema = ValidateSchema("ValidateSchema", "", S3JsonLoader(BUCKET, CONFIG_KEY),
+                            filesystem=s3fs, concurrency=concurrency)
+    rules = [FileFormatValidator("FileFormatValidator", "", concurrency=concurrency),
+             schema]
+    notifier = CollectingNotifier()
+    start = time.perf_counter()
+    ValidationSuite(rules, notifier).validate(event(keys), session)
+    return time.perf_counter() - start, notifier.results, schema.stats
+
+
+def summarize(args, content, runs):
+    """
+    Build the machine readable report of the runs.
+
+    :returns: dict
+    """
+    walls = [seconds for seconds, _, _ in runs]
+    files = [stats for _, _, run_stats in runs for stats in run_stats.values()]
+    total_bytes = len(content) * args.files
+    total_rows = sum(stats.get("rows", 0) for stats in runs[0][2].values())
+    best = min(walls)
+    statuses = {}
+    for status, *_ in runs[-1][1]:
+        statuses[status] = statuses.get(status, 0) + 1
+    return {
+        "config": {
+            "files": args.files,
+            "file_bytes": len(content),
+            "rows_per_file": total_rows // args.files if args.files else 0,
+            "error_rate": args.error_rate,
+            "quarantine": args.quarantine,
+            "latency_ms": args.latency_ms,
+            "concurrency": args.concurrency,
+            "repeat": args.repeat
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "pyarrow": pyarrow.__version__,
+            "cpus": os.cpu_count()
+        },
+        "throughput": {
+            "mb_per_second": total_bytes / 1024 / 1024 / best,
+            "rows_per_second": total_rows / best
+        },
+        "suite_seconds": dict(percentiles(walls), min=best, max=max(walls)),
+        "file_seconds": percentiles([stats["seconds"] for stats in files
+                                     if "seconds" in stats]),
+        "scan_seconds": percentiles([stats["scan_seconds"] for stats in files
+                                     if "scan_seconds" in stats]),
+        "memory": {
+            "peak_rss": max((stats.get("peak_rss", 0) for stats in files), default=0),
+            "arrow_peak_bytes": max((stats.get("arrow_peak_bytes", 0) for stats in files),
+                                    default=0),
+            "process_peak_rss": peak_rss()
+        },
+        "results": statuses
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the validation suite end to end against a local S3 "
+                    "stand-in on generated csvs and write a json report.")
+    parser.add_argument("--schema",
+                        help="Schema file to generate from, as written by "
+                             "bin/schema_from_file.py (made up if not given)")
+    parser.add_argument("--path-index", type=int, default=0,
+                        help="Which of the schema file's paths to use")
+    parser.add_argument("--columns", type=int, default=8,
+                        help="Columns besides the key, without --schema")
+    parser.add_argument("--types", default="int64,double,string,date32[day],bool",
+                        help="Comma separated column types, without --schema")
+    parser.add_argument("--delimiter", default="|", help="Delimiter, without --schema")
+    parser.add_argument("-s", "--size-mb", type=float, default=8,
+                        help="Size of each generated csv")
+    parser.add_argument("-f", "--files", type=int, default=4, help="Records in the event")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Share of rows with a bad value")
+    parser.add_argument("-q", "--quarantine", action="store_true",
+                        help="Quarantine bad rows instead of failing on the first")
+    parser.add_argument("-l", "--latency-ms", type=float, default=0,
+                        help="Latency added to every request to the stand-in")
+    parser.add_argument("-c", "--concurrency", type=int, default=4)
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Runs of the suite")
+    parser.add_argument("-e", "--endpoint",
+                        help="S3 compatible endpoint, moto's server if not given. "
+                             "Moto runs in this process, so peak_rss includes "
+                             "the files it holds.")
+    parser.add_argument("-o", "--output", help="Write the report here, not stdout")
+    args = parser.parse_args()
+
+    path = dict(load_path(args.schema, args.path_index, args.columns, args.types,
+                          args.delimiter), pattern="reports/.*")
+    if args.quarantine:
+        # Files with bad rows still fail, but only after a full scan.
+        path["quarantine"] = True
+    content = generate_csv(path, size_mb=args.size_mb, error_rate=args.error_rate)
+    keys = [f"reports/{i}.csv" for i in range(args.files)]
+    with local_s3(args.endpoint) as (session, _, endpoint):
+        client = s3_client(session, endpoint)
+        client.create_bucket(Bucket=BUCKET)
+        client.put_object(Bucket=BUCKET, Key=CONFIG_KEY,
+                          Body=json.dumps({"paths": [path]}).encode("utf-8"))
+        for key in keys:
+            client.put_object(Bucket=BUCKET, Key=key, Body=content)
+        with latency_proxy(endpoint, args.latency_ms) as proxy:
+            os.environ["AWS_ENDPOINT_URL"] = proxy
+            s3fs = s3_filesystem(proxy)
+            runs = [run(session, s3fs, keys, args.concurrency) for _ in range(args.repeat)]
+    report = json.dumps(summarize(args, content, runs), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        sys.stdout.write(report + "\n")
+
+
+if __name__ == '__main__':
+    main()
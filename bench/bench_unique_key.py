@@ -0,0 +1,60 @@
+import argparse
+import resource
+import time
+
+import pyarrow
+import pyarrow.compute as pc
+
+from csv_validator.uniqueness import UniqueKeyTracker
+
+
+def key_batches(rows, batch_size, key_type, shuffled):
+    for start in range(0, rows, batch_size):
+        stop = min(start + batch_size, rows)
+        keys = pyarrow.array(range(start, stop), pyarrow.int64())
+        if shuffled:
+            # Scramble the order so spilled runs overlap and get merged.
+            keys = pc.multiply(keys, 2654435761)
+            keys = pc.bit_wise_and(keys, (1 << 40) - 1)
+        if key_type == "string":
+            keys = pc.cast(keys, pyarrow.string())
+        yield keys
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--rows", type=int, default=10_000_000,
+                        help="Number of keys to check")
+    parser.add_argument("-b", "--batch-size", type=int, default=65536,
+                        help="Keys per batch")
+    parser.add_argument("-m", "--memory-budget-mb", type=float, default=64,
+                        help="Memory budget before spilling to disk")
+    parser.add_argument("-t", "--key-type", choices=["int64", "string"],
+                        default="string", help="Type of the key column")
+    parser.add_argument("--sequential", action="store_true",
+                        help="Use increasing keys so runs never overlap")
+    parser.add_argument("--spill-dir", default=None,
+                        help="Directory to spill to (default: system temp)")
+    args = parser.parse_args()
+
+    budget = int(args.memory_budget_mb * 1024 * 1024)
+    tracker = UniqueKeyTracker(budget, args.spill_dir)
+    start = time.perf_counter()
+    for keys in key_batches(args.rows, args.batch_size, args.key_type,
+                            not args.sequential):
+        tracker.add(keys)
+    added = time.perf_counter()
+    counter = tracker.finish()
+    finished = time.perf_counter()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"rows:              {tracker.rows}")
+    print(f"spilled runs:      {tracker.spills}")
+    print(f"duplicate rows:    {counter.duplicate_rows}")
+    print(f"add time (s):      {added - start:.2f}")
+    print(f"finish time (s):   {finished - added:.2f}")
+    print(f"s per 1M rows:     {(finished - start) * 1_000_000 / tracker.rows:.4f}")
+    print(f"peak rss (MB):     {peak / 1024:.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+import argparse
+import json
+
+import pyarrow
+import pyarrow.compute as pc
+import pyarrow.csv as csv
+
+from csv_validator.patterns import PathEntry, primary_key_columns
+from csv_validator.profile import hash_values
+
+
+CHUNK_ROWS = 100000
+BAD_VALUE = "not-a-value"
+# Parts per million, for picking the rows with errors.
+PPM = 1000000
+
+
+def synthetic_path(columns=4, types=("int64", "double", "string"), delimiter="|"):
+    """
+    Make up a path in the format bin/schema_from_file.py writes: an "id"
+    primary key and `columns` more fields, cycling through `types`.
+
+    :returns: dict
+    """
+    fields = [{"name": "id", "type": "int64", "nullable": False}]
+    for index in range(columns):
+        fields.append({"name": f"col_{index}", "type": types[index % len(types)],
+                       "nullable": True})
+    return {
+        "delimiter": delimiter,
+        "primary_key": "id",
+        "pattern": "reports/.*",
+        "fields": fields
+    }
+
+
+def _mix(rows, seed):
+    # Pseudo random, but repeatable, non-negative int64 per row.
+    mixed = hash_values(pc.add(rows, seed * 0x9E3779B9))
+    return pc.cast(pc.shift_right(mixed, pyarrow.scalar(1, pyarrow.uint64())),
+                   pyarrow.int64())
+
+
+def column_values(field_type, rows, seed, key=False):
+    """
+    Generate the values of one column, as the strings written to the csv.
+
+    :param field_type: The column's type.
+    :type  field_type: pyarrow.DataType
+
+    :param rows: The row numbers to generate values for.
+    :type  rows: pyarrow.Int64Array
+
+    :param seed: Varies the values between columns and runs.
+    :type  seed: int
+
+    :param key: Whether the column is part of the primary key, in which
+                case the values are unique.
+    :type  key: bool
+
+    :returns: pyarrow.StringArray
+    """
+    mixed = rows if key else _mix(rows, seed)
+    if pyarrow.types.is_string(field_type) or pyarrow.types.is_large_string(field_type):
+        prefix = "key-" if key else "v-"
+        if not key:
+            mixed = pc.bit_wise_and(mixed, 0xFFFFF)
+        return pc.binary_join_element_wise(prefix, pc.cast(mixed, pyarrow.string()), "")
+    if pyarrow.types.is_boolean(field_type):
+        values = pc.equal(pc.bit_wise_and(mixed, 1), 0)
+    elif pyarrow.types.is_integer(field_type):
+        if not key:
+            # Small enough for any integer type.
+            mixed = pc.bit_wise_and(mixed, 0x3F)
+        values = pc.cast(mixed, field_type)
+    elif pyarrow.types.is_floating(field_type):
+        values = pc.divide(pc.cast(pc.bit_wise_and(mixed, 0xFFFFFF), pyarrow.float64()), 100)
+    elif pyarrow.types.is_date(field_type):
+        days = pc.cast(pc.bit_wise_and(mixed, 0x3FFF), pyarrow.int32())
+        values = pc.cast(days, pyarrow.date32())
+    elif pyarrow.types.is_timestamp(field_type):
+        seconds = pc.bit_wise_and(mixed, 0x3FFFFFFF)
+        values = pc.cast(pc.cast(seconds, pyarrow.timestamp("s")), field_type)
+    else:
+        raise ValueError(f"Can't generate values of type {field_type}")
+    return pc.cast(values, pyarrow.string())
+
+
+def generate_csv(path, rows=None, size_mb=None, error_rate=0.0, seed=0,
+                 chunk_rows=CHUNK_ROWS):
+    """
+    Generate a csv for a path from the schema config, either a number of
+    rows or roughly a size in MB.
+
+    :param path: The path from the config, e.g. from synthetic_path().
+    :type  path: dict
+
+    :param error_rate: Share of rows with a value that doesn't convert to
+                       its column's type (only columns that aren't
+                       strings or part of the primary key get errors).
+    :type  error_rate: float
+
+    :returns: bytes
+    """
+    if rows is None and size_mb is None:
+        raise ValueError("Either rows or size_mb is needed")
+    schema = PathEntry(0, path).schema
+    delimiter = path["delimiter"]
+    keys = set(primary_key_columns(path["primary_key"]))
+    erroring = [index for index, field in enumerate(schema)
+                if field.name not in keys and not pyarrow.types.is_string(field.type)]
+    if error_rate and not erroring:
+        raise ValueError("No columns to put errors in, they are all strings or keys")
+    threshold = int(error_rate * PPM)
+    sink = pyarrow.BufferOutputStream()
+    sink.write((delimiter.join(schema.names) + "\n").encode("utf-8"))
+    options = csv.WriteOptions(include_header=False, delimiter=delimiter,
+                               quoting_style="none")
+    target = None if size_mb is None else int(size_mb * 1024 * 1024)
+    start = 0
+    while (rows is None or start < rows) and (target is None or sink.tell() < target):
+        count = chunk_rows if rows is None else min(chunk_rows, rows - start)
+        numbers = pyarrow.array(range(start, start + count), pyarrow.int64())
+        columns = [column_values(field.type, numbers, seed + index,
+                                 field.name in keys)
+                   for index, field in enumerate(schema)]
+        if threshold:
+            # The low 20 bits pick the rows, the next 16 which column.
+            picked = _mix(numbers, seed - 1)
+            share = pc.divide(pc.multiply(pc.bit_wise_and(picked, 0xFFFFF), PPM), 0x100000)
+            bad = pc.less(share, threshold)
+            which = pc.divide(pc.multiply(pc.bit_wise_and(pc.shift_right(picked, 20), 0xFFFF),
+                                          len(erroring)), 0x10000)
+            for position, index in enumerate(erroring):
+                here = pc.and_(bad, pc.equal(which, position))
+                columns[index] = pc.if_else(here, BAD_VALUE, columns[index])
+        csv.write_csv(pyarrow.table(columns, names=schema.names), sink, options)
+        start += count
+    return sink.getvalue().to_pybytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate a csv from a schema file (as written by "
+                    "bin/schema_from_file.py) or a made up schema.")
+    parser.add_argument("-o", "--output-file", required=True, help="CSV file to write")
+    parser.add_argument("--schema", help="Schema file to generate from")
+    parser.add_argument("--path-index", type=int, default=0,
+                        help="Which of the schema file's paths to use")
+    parser.add_argument("-c", "--columns", type=int, default=4,
+                        help="Columns besides the key, without --schema")
+    parser.add_argument("-t", "--types", default="int64,double,string",
+                        help="Comma separated column types, without --schema")
+    parser.add_argument("-d", "--delimiter", default="|",
+                        help="Delimiter, without --schema")
+    parser.add_argument("-r", "--rows", type=int, help="Rows to generate")
+    parser.add_argument("-s", "--size-mb", type=float, help="Size to generate")
+    parser.add_argument("-e", "--error-rate", type=float, default=0.0,
+                        help="Share of rows with a bad value")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    path = load_path(args.schema, args.path_index, args.columns, args.types,
+                     args.delimiter)
+    content = generate_csv(path, args.rows, args.size_mb, args.error_rate, args.seed)
+    with open(args.output_file, "wb") as f:
+        f.write(content)
+
+
+def load_path(schema_file, path_index, columns, types, delimiter):
+    """
+    Get the path to generate for: from a schema file if one is given,
+    otherwise made up by synthetic_path().
+
+    :returns: dict
+    """
+    if schema_file:
+        with open(schema_file) as f:
+            return json.load(f)["paths"][path_index]
+    return synthetic_path(columns, types.split(","), delimiter)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import contextlib
+import socket
+import threading
+import time
+
+import boto3
+import pyarrow.fs as fs
+
+
+ACCESS_KEY = "bench"
+SECRET_KEY = "bench"
+REGION = "us-east-1"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def local_s3(endpoint=None):
+    """
+    Local S3 stand-in for the benchmarks. Points at an existing endpoint
+    (e.g. MinIO) when one is given, otherwise starts moto's server, which
+    needs `pip install "moto[server]"`.
+
+    :param endpoint: Url of an S3 compatible server, e.g. http://localhost:9000
+    :type  endpoint: string
+
+    :returns: tuple of (boto3 session, pyarrow S3FileSystem, endpoint url)
+    """
+    server = None
+    if endpoint is None:
+        from moto.server import ThreadedMotoServer
+        port = _free_port()
+        server = ThreadedMotoServer(ip_address="127.0.0.1", port=port,
+                                    verbose=False)
+        server.start()
+        endpoint = f"http://127.0.0.1:{port}"
+    try:
+        session = boto3.session.Session(aws_access_key_id=ACCESS_KEY,
+                                        aws_secret_access_key=SECRET_KEY,
+                                        region_name=REGION)
+        yield session, s3_filesystem(endpoint), endpoint
+    finally:
+        if server is not None:
+            server.stop()
+
+
+def s3_filesystem(endpoint):
+    scheme = endpoint.split("://")[0]
+    return fs.S3FileSystem(access_key=ACCESS_KEY, secret_key=SECRET_KEY,
+                           region=REGION, scheme=scheme,
+                           endpoint_override=endpoint)
+
+
+def s3_client(session, endpoint):
+    return session.client("s3", endpoint_url=endpoint)
+
+
+def _pipe(source, sink, delay):
+    try:
+        while True:
+            data = source.recv(65536)
+            if not data:
+                break
+            if delay:
+                time.sleep(delay)
+            sink.sendall(data)
+    except OSError:
+        pass
+    finally:
+        for sock in (source, sink):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+@contextlib.contextmanager
+def latency_proxy(endpoint, latency_ms):
+    """
+    Put a TCP proxy in front of an endpoint that holds every chunk sent
+    to it for `latency_ms`, standing in for the round trip to a real S3
+    or SES endpoint.
+
+    :returns: url of the proxy
+    """
+    host, port = endpoint.split("://")[1].split(":")
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(64)
+    delay = latency_ms / 1000
+
+    def accept():
+        while True:
+            try:
+                client, _ = listener.accept()
+            except OSError:
+                return
+            upstream = socket.create_connection((host, int(port)))
+            threading.Thread(target=_pipe, args=(client, upstream, delay),
+                             daemon=True).start()
+            threading.Thread(target=_pipe, args=(upstream, client, 0),
+                             daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{listener.getsockname()[1]}"
+    finally:
+        listener.close()
@@ -1,36 +1,53 @@
 import argparse
 import json
 import os
+import sys
 
-import pyarrow.csv as csv
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from csv_validator.inference import infer_schema  # noqa: E402
 
-def main():
+
+def main(argv=None):
     parser = argparse.ArgumentParser()
-    parser.add_argument("-i", "--input-file", help="CSV file to scan")
-    parser.add_argument("-o", "--output-file", help="Schema file to create or modify")
-    parser.add_argument("-d", "--delimiter", help="delimiter for the file")
-    parser.add_argument("-k", "--primary-key", help="Field name that is the primary key")
+    parser.add_argument("-i", "--input-file", nargs="+", required=True,
+                        help="CSV files to scan, local or uris (e.g. s3://bucket/key.csv)")
+    parser.add_argument("-o", "--output-file", default="schema.json",
+                        help="Schema file to create or modify")
+    parser.add_argument("-d", "--delimiter", default=",", help="delimiter for the file")
+    parser.add_argument("-k", "--primary-key",
+                        help="Field name that is the primary key, defaults to the "
+                             "first column whose values were all unique")
     parser.add_argument("-p", "--pattern",
                         help=("pattern to match the schema to file. "
                               "Example: 'reports/.*' will match 'reports/john.csv"))
+    parser.add_argument("--sample-rows", type=int,
+                        help="Only scan this many rows of each file")
+    parser.add_argument("--sample-mb", type=float,
+                        help="Only scan this many megabytes of each file")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="Processes to scan the files in")
 #    parser.add_argument("-e", "--extension", help="File extension expected (e.g. .csv)")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
-    # Parse the input file.
-    df = csv.read_csv(args.input_file,
-                      parse_options=csv.ParseOptions(delimiter=args.delimiter))
-    fields = []
-    for field in df.schema:
-        item = {
-            "name": field.name,
-            "type": str(field.type),
-            "nullable": field.nullable
-        }
+    # Scan the input files.
+    sample_bytes = int(args.sample_mb * 1024 * 1024) if args.sample_mb else None
+    inferred = infer_schema(args.input_file, args.delimiter, args.sample_rows,
+                            sample_bytes, args.workers)
+    candidates = inferred["primary_key_candidates"]
+    print(f"Scanned {inferred['rows']} rows, primary key candidates: "
+          f"{', '.join(candidates) or 'none'}", file=sys.stderr)
+    primary_key = args.primary_key
+    if primary_key is None and candidates:
+        primary_key = candidates[0]
+    elif primary_key is not None and primary_key not in candidates:
+        print(f"Warning: {primary_key} had nulls or duplicates in the files scanned",
+              file=sys.stderr)
+    fields = inferred["fields"]
+    for item in fields:
         # Force primary key to be not-null.
-        if field.name == args.primary_key:
+        if item["name"] == primary_key:
             item["nullable"] = False
-        fields.append(item)
     # Prepare the output.
     root = {"paths": []}
     if os.path.exists(args.output_file):
@@ -39,13 +56,13 @@ def main():
     root["paths"].append(
         {
             "delimiter": args.delimiter,
-            "primary_key": args.primary_key,
+            "primary_key": primary_key,
             "pattern": args.pattern,
 #            "extension": args.extension,
             "fields": fields
         }
     )
-    with open("schema.json", "w") as f:
+    with open(args.output_file, "w") as f:
         f.write(json.dumps(root, indent=4))
 
 if __name__ == '__main__':
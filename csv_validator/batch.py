@@ -0,0 +1,265 @@
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+import pyarrow.fs as fs
+
+from .clients import pool
+from .config import CachedLoader, FileJsonLoader, S3JsonLoader
+from .notifications import RESULT_COLUMNS, CollectingNotifier
+from .patterns import compile_paths
+from .rules import FAILED, FileFormatValidator, ValidateSchema, ValidationSuite
+
+
+# Set up in each worker process by _init_worker().
+_WORKER = {}
+
+
+def open_source(source):
+    """
+    Get the filesystem and location of a local directory or S3 prefix.
+    Files are validated with keys relative to the directory, or the full
+    object key under a prefix, which is what the schema patterns match.
+
+    :param source: A directory, or "s3://bucket/prefix".
+    :type  source: string
+
+    :returns: tuple of (pyarrow.fs.FileSystem, bucket, prefix), files
+              being read from the filesystem as "bucket/key".
+    """
+    if source.startswith("s3://"):
+        bucket, _, prefix = source[len("s3://"):].partition("/")
+        return pool().filesystem(), bucket, prefix
+    root = os.path.abspath(source)
+    local = fs.SubTreeFileSystem(os.path.dirname(root), fs.LocalFileSystem())
+    return local, os.path.basename(root), ""
+
+
+def config_loader(schema):
+    """
+    Get the loader of a schema file, local or "s3://bucket/key".
+
+    :returns: ConfigLoader
+    """
+    if schema.startswith("s3://"):
+        bucket, _, key = schema[len("s3://"):].partition("/")
+        return S3JsonLoader(bucket, key)
+    return FileJsonLoader(schema)
+
+
+def list_keys(filesystem, bucket, prefix, paths):
+    """
+    List the files under a prefix that a path of the schema matches.
+
+    :returns: tuple of (sorted list of keys, number of files skipped)
+    """
+    root = f"{bucket}/{prefix}".rstrip("/")
+    infos = filesystem.get_file_info(fs.FileSelector(root, recursive=True))
+    index = compile_paths(paths)
+    keys = []
+    skipped = 0
+    for info in infos:
+        if info.type != fs.FileType.File:
+            continue
+        key = info.path[len(bucket) + 1:]
+        if index.match(key) is None:
+            skipped += 1
+        else:
+            keys.append(key)
+    return sorted(keys), skipped
+
+
+def _init_worker(source, schema, sampling, log_level):
+    logging.basicConfig(level=log_level)
+    logging.getLogger().setLevel(log_level)
+    filesystem, bucket, _ = open_source(source)
+    session = pool().session() if schema.startswith("s3://") else None
+    _WORKER.update(
+        filesystem=filesystem,
+        bucket=bucket,
+        session=session,
+        sampling=sampling,
+        # Loaded once per worker, not once per file.
+        loader=CachedLoader(config_loader(schema), float("inf"))
+    )
+
+
+def validate_key(key):
+    """
+    Run the rules over one file, in a worker set up by _init_worker().
+
+    :returns: tuple of (key, list of result tuples)
+    """
+    bucket = _WORKER["bucket"]
+    rules = [
+        FileFormatValidator("FileFormatValidator",
+                            "File format must end in .csv or .csv.gz/.zst/.bz2",
+                            concurrency=1),
+        ValidateSchema("ValidateSchema", "Validate the schema of the file is correct",
+                       _WORKER["loader"], filesystem=_WORKER["filesystem"],
+                       concurrency=1, sampling=_WORKER["sampling"])
+    ]
+    notifier = CollectingNotifier()
+    event = {"Records": [{"s3": {"bucket": {"name": bucket}, "object": {"key": key}}}]}
+    ValidationSuite(rules, notifier).validate(event, _WORKER["session"])
+    return key, notifier.results
+
+
+class Checkpoint:
+    """
+    Keys of the files already validated, one per line, appended to as
+    each file's results are written to the report.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.done = {line.rstrip("\n") for line in f if line.strip()}
+        self._file = open(path, "a") if path else None
+
+    def mark(self, key):
+        if self._file is not None:
+            self._file.write(key + "\n")
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class Report:
+    """
+    Writes results as they come in, as csv (with the columns of the email
+    notifier's report) or as json lines if the path ends in ".jsonl".
+    """
+    def __init__(self, path, append=False):
+        self.jsonl = path.endswith(".jsonl")
+        new = not append or not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a" if append else "w", newline="")
+        self._writer = None
+        if not self.jsonl:
+            self._writer = csv.writer(self._file)
+            if new:
+                self._writer.writerow(RESULT_COLUMNS)
+
+    def write(self, results):
+        for row in results:
+            if self.jsonl:
+                self._file.write(json.dumps(dict(zip(RESULT_COLUMNS, row))) + "\n")
+            else:
+                self._writer.writerow(row)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def run(source, schema, report_path, checkpoint_path=None, workers=None,
+        sampling=False, log_level="WARNING"):
+    """
+    Validate every file under a directory or S3 prefix that the schema
+    matches, across a pool of processes.
+
+    :param source: A directory, or "s3://bucket/prefix".
+    :type  source: string
+
+    :param schema: Schema file, local or "s3://bucket/key".
+    :type  schema: string
+
+    :param report_path: Where to write the results, csv or ".jsonl".
+    :type  report_path: string
+
+    :param checkpoint_path: File of the keys done so far. If it exists,
+                            those are skipped and the report appended to.
+    :type  checkpoint_path: string
+
+    :param workers: Processes to use, every core by default. With 1 the
+                    files are validated in this process.
+    :type  workers: int
+
+    :param sampling: Honour "sample" in the schema, off by default so
+                     whole files are checked.
+    :type  sampling: bool
+
+    :returns: dict of files, failed, skipped, resumed and seconds
+    """
+    start = time.perf_counter()
+    filesystem, bucket, prefix = open_source(source)
+    session = pool().session() if schema.startswith("s3://") else None
+    paths = config_loader(schema).load(session)["paths"]
+    keys, skipped = list_keys(filesystem, bucket, prefix, paths)
+    checkpoint = Checkpoint(checkpoint_path)
+    todo = [key for key in keys if key not in checkpoint.done]
+    report = Report(report_path, append=bool(checkpoint.done))
+    workers = min(workers or os.cpu_count() or 1, max(len(todo), 1))
+    initargs = (source, schema, sampling, log_level)
+    failed = 0
+    try:
+        if workers == 1:
+            _init_worker(*initargs)
+            outcomes = map(validate_key, todo)
+            executor = None
+        else:
+            # Spawned rather than forked: the AWS SDK behind pyarrow's S3
+            # filesystem doesn't survive a fork.
+            executor = multiprocessing.get_context("spawn").Pool(
+                workers, initializer=_init_worker, initargs=initargs)
+            outcomes = executor.imap_unordered(validate_key, todo)
+        try:
+            for key, results in outcomes:
+                report.write(results)
+                checkpoint.mark(key)
+                if any(row[0] == FAILED for row in results):
+                    failed += 1
+        finally:
+            if executor is not None:
+                executor.terminate()
+                executor.join()
+    finally:
+        report.close()
+        checkpoint.close()
+    return {
+        "files": len(todo),
+        "failed": failed,
+        "skipped": skipped,
+        "resumed": len(keys) - len(todo),
+        "seconds": time.perf_counter() - start
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Validate every file under a directory or S3 prefix that "
+                    "a path of the schema matches.")
+    parser.add_argument("source", help="Directory, or s3://bucket/prefix")
+    parser.add_argument("-s", "--schema", required=True,
+                        help="Schema file, local or s3://bucket/key")
+    parser.add_argument("-r", "--report", required=True,
+                        help="Report to write, csv or .jsonl")
+    parser.add_argument("-c", "--checkpoint",
+                        help="File of the files done, to resume from if it exists")
+    parser.add_argument("-w", "--workers", type=int,
+                        help="Processes to use, defaults to the number of cores")
+    parser.add_argument("--sample", action="store_true",
+                        help="Only check the sample of files the schema asks for")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    log_level = args.log_level.upper()
+    logging.basicConfig(level=log_level)
+    summary = run(args.source, args.schema, args.report, args.checkpoint,
+                  args.workers, args.sample, log_level)
+    print(f"Validated {summary['files']} files in {summary['seconds']:.1f}s: "
+          f"{summary['failed']} failed, {summary['resumed']} done before, "
+          f"{summary['skipped']} not matching the schema", file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
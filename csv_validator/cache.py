@@ -0,0 +1,309 @@
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+
+# Bump when a change to the checks could change the result for the same
+# file and config, so results cached by older code are not reused.
+CACHE_VERSION = 1
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_SQLITE_PATH = "/tmp/csv-validator-results.sqlite"
+
+# Caches kept for the life of the container, keyed by their spec.
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def result_key(rule, etag, fingerprint, sampling):
+    """
+    Build the cache key of a rule's result for a file: the same content
+    (by ETag) checked against the same config entry the same way.
+
+    :param rule: Name of the rule.
+    :type  rule: string
+
+    :param etag: ETag of the object, from the event.
+    :type  etag: string
+
+    :param fingerprint: Fingerprint of the config entry the key resolved to.
+    :type  fingerprint: string
+
+    :param sampling: Whether sampling was allowed.
+    :type  sampling: bool
+
+    :returns: string
+    """
+    raw = json.dumps([CACHE_VERSION, rule, etag.strip('"'), fingerprint, bool(sampling)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Base class for caches of validation results. Subclasses implement
+    lookup() and store(); this class counts hits, misses and evictions.
+    """
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        """
+        Get a cached result.
+
+        :param key: Key from result_key().
+        :type  key: string
+
+        :returns: dict, or None if it isn't cached.
+        """
+        value = self.lookup(key)
+        with self._stats_lock:
+            self._stats["hits" if value is not None else "misses"] += 1
+        return value
+
+    def put(self, key, value):
+        """
+        Cache a result, evicting the least recently used ones past the
+        cache's size.
+
+        :param key: Key from result_key().
+        :type  key: string
+
+        :param value: The result, json serializable.
+        :type  value: dict
+        """
+        evicted = self.store(key, value)
+        with self._stats_lock:
+            self._stats["evictions"] += evicted
+
+    def stats(self):
+        """
+        :returns: dict of hits, misses and evictions since the cache was
+                  created.
+        """
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def lookup(self, key):
+        """
+        :returns: dict, or None
+        """
+        raise NotImplementedError()
+
+    def store(self, key, value):
+        """
+        :returns: number of results evicted.
+        """
+        raise NotImplementedError()
+
+    def flush(self):
+        """
+        Write out anything held back, called once the rule is done.
+        """
+        pass
+
+
+class MemoryCache(ResultCache):
+    """
+    LRU cache in memory, shared by the invocations a container serves.
+    """
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        super().__init__()
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def store(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+
+class SqliteCache(ResultCache):
+    """
+    LRU cache in a SQLite file, by default under /tmp, which outlives the
+    process on a warm lambda container (and can be put on a shared mount).
+    """
+    def __init__(self, path=DEFAULT_SQLITE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        super().__init__()
+        # Only needed with this cache, keep it off the cold start.
+        import sqlite3
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS results "
+                             "(key TEXT PRIMARY KEY, value TEXT, used REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+
+    def lookup(self, key):
+        with self._lock, self._db:
+            row = self._db.execute("SELECT value FROM results WHERE key = ?",
+                                   (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE results SET used = ? WHERE key = ?",
+                             (time.time(), key))
+            return json.loads(row[0])
+
+    def store(self, key, value):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                             (key, json.dumps(value), time.time()))
+            count = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            if count <= self.max_entries:
+                return 0
+            return self._db.execute(
+                "DELETE FROM results WHERE key IN "
+                "(SELECT key FROM results ORDER BY used LIMIT ?)",
+                (count - self.max_entries,)).rowcount
+
+    def close(self):
+        self._db.close()
+
+
+class S3IndexCache(ResultCache):
+    """
+    Cache in one json object in S3, shared by every container. The index
+    is read on first use and written back by flush() if anything was
+    added, merged with what other invocations wrote since (if two write
+    at once, the entries one of them added are lost, which only costs
+    misses).
+    """
+    def __init__(self, bucket, key, session, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        Constructor.
+
+        :param bucket: Bucket of the index.
+        :type  bucket: string
+
+        :param key: Key of the index, e.g. "cache/results.json"
+        :type  key: string
+
+        :param session: Boto3 session
+        :type  session: boto3 session
+
+        :param max_entries: Results kept, the least recently used are
+                            evicted past this.
+        :type  max_entries: int
+        """
+        super().__init__()
+        self.bucket = bucket
+        self.key = key
+        self.session = session
+        self.max_entries = max_entries
+        self._entries = None
+        self._added = {}
+        self._lock = threading.Lock()
+
+    def _read(self):
+        client = self.session.client("s3")
+        try:
+            result = client.get_object(Bucket=self.bucket, Key=self.key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return {}
+            raise
+        return json.loads(result["Body"].read()).get("entries", {})
+
+    def _loaded(self):
+        if self._entries is None:
+            self._entries = self._read()
+        return self._entries
+
+    def lookup(self, key):
+        with self._lock:
+            entry = self._loaded().get(key)
+            if entry is None:
+                return None
+            entry["used"] = time.time()
+            return entry["value"]
+
+    def store(self, key, value):
+        with self._lock:
+            entry = {"value": value, "used": time.time()}
+            self._loaded()[key] = entry
+            self._added[key] = entry
+            return self._evict(self._entries)
+
+    def _evict(self, entries):
+        excess = len(entries) - self.max_entries
+        if excess <= 0:
+            return 0
+        oldest = sorted(entries, key=lambda name: entries[name]["used"])[:excess]
+        for name in oldest:
+            del entries[name]
+        return excess
+
+    def flush(self):
+        with self._lock:
+            if not self._added:
+                return
+            entries = self._read()
+            entries.update(self._added)
+            self._evict(entries)
+            body = json.dumps({"version": CACHE_VERSION, "entries": entries})
+            self.session.client("s3").put_object(Bucket=self.bucket, Key=self.key,
+                                                 Body=body.encode("utf-8"))
+            logging.info(f"Wrote {len(self._added)} results to the cache index "
+                         f"s3://{self.bucket}/{self.key}")
+            self._entries = entries
+            self._added = {}
+
+
+def result_cache(spec, session, max_entries=DEFAULT_MAX_ENTRIES):
+    """
+    Make a result cache from a spec, as given in the RESULT_CACHE
+    environment variable:
+
+    * "memory" -> MemoryCache, kept for the life of the container.
+    * "sqlite" or "sqlite:/path/to/file" -> SqliteCache, also kept.
+    * "s3://bucket/key.json" -> S3IndexCache, read again per invocation.
+    * "none" or empty -> None, no cache.
+
+    :returns: ResultCache or None
+    """
+    spec = (spec or "none").strip()
+    if spec.lower() == "none":
+        return None
+    if spec.startswith("s3://"):
+        bucket, _, key = spec[len("s3://"):].partition("/")
+        return S3IndexCache(bucket, key, session, max_entries)
+    with _CACHES_LOCK:
+        if spec not in _CACHES:
+            kind, _, path = spec.partition(":")
+            if kind.lower() == "memory":
+                _CACHES[spec] = MemoryCache(max_entries)
+            elif kind.lower() == "sqlite":
+                _CACHES[spec] = SqliteCache(path or DEFAULT_SQLITE_PATH, max_entries)
+            else:
+                raise ValueError(f"Unknown result cache: {spec}")
+        return _CACHES[spec]
+
+
+def clear_caches():
+    """
+    Drop every cache kept for the container.
+    """
+    with _CACHES_LOCK:
+        for cache in _CACHES.values():
+            if isinstance(cache, SqliteCache):
+                cache.close()
+        _CACHES.clear()
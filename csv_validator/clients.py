@@ -0,0 +1,183 @@
+import logging
+import os
+import threading
+import time
+
+import boto3
+import pyarrow.fs as fs
+
+
+DEFAULT_REGION = "us-east-1"
+
+# Pools kept for the life of the container, keyed by (region, endpoint).
+_POOLS = {}
+_POOL_LOCK = threading.Lock()
+SETUP_STATS = {"created": 0, "reused": 0, "seconds": 0.0}
+
+
+def default_region():
+    """
+    Region from the lambda's environment (AWS_REGION), falling back to
+    AWS_DEFAULT_REGION and then us-east-1.
+
+    :returns: string
+    """
+    return os.environ.get("AWS_REGION") or \
+        os.environ.get("AWS_DEFAULT_REGION") or DEFAULT_REGION
+
+
+def default_endpoint():
+    """
+    S3 endpoint from AWS_ENDPOINT_URL_S3 or AWS_ENDPOINT_URL (e.g. a local
+    stand-in), None for AWS.
+
+    :returns: string or None
+    """
+    return os.environ.get("AWS_ENDPOINT_URL_S3") or \
+        os.environ.get("AWS_ENDPOINT_URL") or None
+
+
+def _record_setup(created, start):
+    with _POOL_LOCK:
+        if created:
+            SETUP_STATS["created"] += 1
+            SETUP_STATS["seconds"] += time.perf_counter() - start
+        else:
+            SETUP_STATS["reused"] += 1
+
+
+class PooledSession(boto3.session.Session):
+    """
+    A boto3 session that hands out the same client for the same service
+    and arguments every time, so code calling session.client() per use
+    (the loaders and notifiers) shares one client and its connections.
+    Clients are thread safe once created; creating them isn't, so that
+    happens under a lock.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def client(self, service_name, **kwargs):
+        key = (service_name, tuple(sorted(kwargs.items())))
+        start = time.perf_counter()
+        with self._lock:
+            client = self._clients.get(key)
+            created = client is None
+            if created:
+                client = super().client(service_name, **kwargs)
+                self._clients[key] = client
+        _record_setup(created, start)
+        return client
+
+
+class ClientPool:
+    """
+    The boto3 session, clients and pyarrow S3 filesystem for a region and
+    endpoint, created on first use and reused after, across the records
+    of an event and across warm invocations. Get one with pool().
+    """
+    def __init__(self, region, endpoint=None):
+        """
+        Constructor.
+
+        :param region: AWS region, given explicitly so it is never looked
+                       up again.
+        :type  region: string
+
+        :param endpoint: Url of an S3 compatible endpoint, None for AWS.
+        :type  endpoint: string
+        """
+        self.region = region
+        self.endpoint = endpoint
+        self._session = None
+        self._filesystem = None
+        self._lock = threading.Lock()
+
+    def session(self):
+        """
+        :returns: PooledSession
+        """
+        start = time.perf_counter()
+        with self._lock:
+            created = self._session is None
+            if created:
+                self._session = PooledSession(region_name=self.region)
+        _record_setup(created, start)
+        return self._session
+
+    def filesystem(self):
+        """
+        :returns: pyarrow.fs.S3FileSystem
+        """
+        start = time.perf_counter()
+        with self._lock:
+            created = self._filesystem is None
+            if created:
+                kwargs = {"region": self.region}
+                if self.endpoint:
+                    scheme, _, host = self.endpoint.partition("://")
+                    kwargs.update(scheme=scheme, endpoint_override=host)
+                self._filesystem = fs.S3FileSystem(**kwargs)
+        _record_setup(created, start)
+        return self._filesystem
+
+
+def pool(region=None, endpoint=None):
+    """
+    Get the pool for a region and endpoint, shared by every invocation in
+    this container.
+
+    :param region: AWS region, None for default_region().
+    :type  region: string
+
+    :param endpoint: S3 endpoint url, None for default_endpoint().
+    :type  endpoint: string
+
+    :returns: ClientPool
+    """
+    region = region or default_region()
+    endpoint = endpoint or default_endpoint()
+    with _POOL_LOCK:
+        key = (region, endpoint)
+        if key not in _POOLS:
+            _POOLS[key] = ClientPool(region, endpoint)
+        return _POOLS[key]
+
+
+def setup_stats():
+    """
+    Get how many sessions, clients and filesystems were created and
+    reused in this container, and the seconds spent creating them.
+
+    :returns: dict of created, reused and seconds
+    """
+    with _POOL_LOCK:
+        return dict(SETUP_STATS)
+
+
+def log_setup(before):
+    """
+    Log the setup done since an earlier setup_stats(), e.g. for one
+    invocation.
+
+    :param before: What setup_stats() returned at the start.
+    :type  before: dict
+    """
+    after = setup_stats()
+    created = after["created"] - before["created"]
+    reused = after["reused"] - before["reused"]
+    seconds = after["seconds"] - before["seconds"]
+    logging.info(f"Client setup took {seconds:.3f}s ({created} created, "
+                 f"{reused} reused)")
+    return {"created": created, "reused": reused, "seconds": seconds}
+
+
+def clear_pools():
+    """
+    Drop every pool and reset the counters.
+    """
+    with _POOL_LOCK:
+        _POOLS.clear()
+        SETUP_STATS.update(created=0, reused=0, seconds=0.0)
@@ -0,0 +1,314 @@
+import argparse
+from collections.abc import Sequence
+import hashlib
+import json
+import logging
+import re
+import sys
+
+from botocore.exceptions import ClientError
+import pyarrow
+
+from .constraints import ConstraintSet
+from .patterns import PathEntry, PathIndex, primary_key_columns
+
+
+# Bump whenever the layout changes, so artifacts written by older code are
+# compiled again rather than misread.
+ARTIFACT_VERSION = 1
+ARTIFACT_SCHEMA = pyarrow.schema([
+    ("pattern", pyarrow.string()),
+    ("prefix", pyarrow.string()),
+    ("fingerprint", pyarrow.string()),
+    ("schema", pyarrow.binary()),
+    ("path", pyarrow.string()),
+])
+REQUIRED_KEYS = ["pattern", "delimiter", "primary_key", "fields"]
+MISSING = ("NoSuchKey", "404", "NotFound")
+
+
+def config_errors(config):
+    """
+    Check a config has everything the rules need, in the shape they need
+    it: valid patterns, known field types, primary keys and constraints on
+    fields that exist.
+
+    :param config: The schema config.
+    :type  config: dict
+
+    :returns: list of strings, one per problem, empty if it is valid.
+    """
+    paths = config.get("paths") if isinstance(config, dict) else None
+    if not isinstance(paths, list):
+        return ['"paths" must be a list']
+    errors = []
+    for index, path in enumerate(paths):
+        where = f"paths[{index}]"
+        if not isinstance(path, dict):
+            errors.append(f"{where} must be an object")
+            continue
+        missing = [key for key in REQUIRED_KEYS if key not in path]
+        if missing:
+            errors.append(f"{where} is missing {', '.join(missing)}")
+            continue
+        where = f"{where} ({path['pattern']})"
+        try:
+            re.compile(path["pattern"])
+        except (re.error, TypeError) as e:
+            errors.append(f"{where} has an invalid pattern: {e}")
+        if not isinstance(path["delimiter"], str) or len(path["delimiter"]) != 1:
+            errors.append(f"{where} delimiter must be a single character")
+        fields = []
+        names = set()
+        for field in path["fields"]:
+            try:
+                fields.append(pyarrow.field(field["name"], field["type"],
+                                            field["nullable"]))
+            except (KeyError, TypeError, ValueError) as e:
+                errors.append(f"{where} has an invalid field {field}: {e}")
+                continue
+            if field["name"] in names:
+                errors.append(f"{where} has field {field['name']} more than once")
+            names.add(field["name"])
+        for name in primary_key_columns(path["primary_key"]):
+            if name not in names:
+                errors.append(f"{where} primary key {name} is not a field")
+        try:
+            ConstraintSet(path, pyarrow.schema(fields))
+        except (KeyError, TypeError, ValueError) as e:
+            errors.append(f"{where} has an invalid constraint: {e}")
+    return errors
+
+
+def content_hash(source):
+    """
+    Hash of a config file's bytes, which an artifact records to say what it
+    was compiled from.
+
+    :returns: string
+    """
+    return hashlib.sha256(source).hexdigest()
+
+
+def compile_config(config, source=None):
+    """
+    Compile a config into an artifact: an Arrow IPC file with a row per
+    path holding its pattern, the pattern's literal prefix, the path's
+    fingerprint, its serialized Arrow schema and its config as json.
+
+    :param config: The schema config.
+    :type  config: dict
+
+    :param source: The bytes the config was parsed from, to hash. Defaults
+                   to the config as canonical json.
+    :type  source: bytes
+
+    :returns: bytes of the artifact.
+    """
+    errors = config_errors(config)
+    if errors:
+        raise ValueError("Invalid config: " + "; ".join(errors))
+    if source is None:
+        source = json.dumps(config, sort_keys=True).encode("utf-8")
+    paths = config["paths"]
+    entries = [PathEntry(index, path) for index, path in enumerate(paths)]
+    batch = pyarrow.record_batch([
+        [entry.pattern for entry in entries],
+        [entry.prefix for entry in entries],
+        [entry.fingerprint for entry in entries],
+        [entry.schema.serialize().to_pybytes() for entry in entries],
+        [json.dumps(path) for path in paths],
+    ], schema=ARTIFACT_SCHEMA)
+    rest = {key: value for key, value in config.items() if key != "paths"}
+    schema = ARTIFACT_SCHEMA.with_metadata({
+        "version": str(ARTIFACT_VERSION),
+        "content_hash": content_hash(source),
+        "config": json.dumps(rest),
+    })
+    sink = pyarrow.BufferOutputStream()
+    options = pyarrow.ipc.IpcWriteOptions(compression="zstd")
+    with pyarrow.ipc.new_file(sink, schema, options=options) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+class CompiledPathEntry(PathEntry):
+    """
+    A path loaded from an artifact. Its config is only parsed, and its
+    schema deserialized, once a key matches it.
+    """
+    def __init__(self, index, pattern, prefix, fingerprint, schema, raw):
+        """
+        Constructor.
+
+        :param schema: The serialized Arrow schema.
+        :type  schema: bytes
+
+        :param raw: The path's config as json.
+        :type  raw: string
+        """
+        super().__init__(index, None, pattern, prefix)
+        self._fingerprint = fingerprint
+        self._serialized_schema = schema
+        self._raw = raw
+
+    @property
+    def path(self):
+        if self._path is None:
+            self._path = json.loads(self._raw)
+        return self._path
+
+    @property
+    def schema(self):
+        if self._schema is None:
+            self._schema = pyarrow.ipc.read_schema(
+                pyarrow.py_buffer(self._serialized_schema))
+        return self._schema
+
+
+class CompiledPaths(Sequence):
+    """
+    The "paths" of a compiled config. Reads like the list of path dicts,
+    and carries its PathIndex so compile_paths() doesn't rebuild it.
+    """
+    def __init__(self, entries, content_hash):
+        self.entries = entries
+        self.content_hash = content_hash
+        self.index = PathIndex(self, entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [entry.path for entry in self.entries[index]]
+        return self.entries[index].path
+
+
+def read_artifact(data):
+    """
+    Load a compiled config.
+
+    :param data: Bytes of the artifact, see compile_config().
+    :type  data: bytes
+
+    :returns: configuration dict, its "paths" a CompiledPaths.
+    """
+    reader = pyarrow.ipc.open_file(pyarrow.py_buffer(data))
+    metadata = reader.schema.metadata or {}
+    version = metadata.get(b"version", b"").decode("utf-8")
+    if version != str(ARTIFACT_VERSION):
+        raise ValueError(f"Unsupported compiled config version: {version!r}")
+    table = reader.read_all()
+    columns = [table.column(name).to_pylist() for name in ARTIFACT_SCHEMA.names]
+    entries = [CompiledPathEntry(index, *row) for index, row in enumerate(zip(*columns))]
+    config = json.loads(metadata[b"config"])
+    config["paths"] = CompiledPaths(entries, metadata[b"content_hash"].decode("utf-8"))
+    return config
+
+
+def artifact_key(key, etag):
+    """
+    Key of the artifact compiled from a version of a config file, next to
+    it in the same bucket. S3 ETags are a hash of the content (for files
+    not uploaded in parts, the MD5), so every container asking for the same
+    config content finds the same artifact.
+
+    :returns: string
+    """
+    return f"{key}.compiled/v{ARTIFACT_VERSION}-{etag.strip(chr(34))}.arrow"
+
+
+def _missing(error):
+    return error.response.get("Error", {}).get("Code") in MISSING
+
+
+def fetch_compiled(client, bucket, key, etag):
+    """
+    Load the artifact of a config file's current version, compiling and
+    uploading it if no container has yet. A config that doesn't compile
+    is returned as plain json, so its paths keep failing only the files
+    they match, as they would without compiling.
+
+    :param client: S3 client.
+    :type  client: boto3 client
+
+    :param etag: ETag of the config file.
+    :type  etag: string
+
+    :returns: tuple of (configuration dict, ETag of the version loaded),
+              which is a newer version than asked for if the file changed
+              since its ETag was looked up.
+    """
+    compiled_key = artifact_key(key, etag)
+    try:
+        result = client.get_object(Bucket=bucket, Key=compiled_key)
+        logging.info(f"Loaded compiled schema from s3://{bucket}/{compiled_key}")
+        return read_artifact(result["Body"].read()), etag
+    except ClientError as e:
+        if not _missing(e):
+            raise
+    result = client.get_object(Bucket=bucket, Key=key)
+    source = result["Body"].read()
+    # File the artifact under the version actually read, the file may
+    # have been replaced since the ETag was looked up.
+    etag = result.get("ETag", etag)
+    compiled_key = artifact_key(key, etag)
+    config = json.loads(source)
+    try:
+        data = compile_config(config, source)
+    except ValueError as e:
+        logging.warning(f"Not compiling s3://{bucket}/{key}: {e}")
+        return config, etag
+    try:
+        client.put_object(Bucket=bucket, Key=compiled_key, Body=data)
+        logging.info(f"Compiled schema to s3://{bucket}/{compiled_key}")
+    except ClientError as e:
+        logging.warning(f"Could not upload the compiled schema: {e}")
+    return read_artifact(data), etag
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check a schema file and compile it for faster loading.")
+    parser.add_argument("source", help="Schema file, local or s3://bucket/key")
+    parser.add_argument("-o", "--output",
+                        help="File to write the artifact to. Defaults to next to an "
+                             "S3 schema file, where S3JsonLoader looks for it, or "
+                             "<source>.arrow for a local one")
+    parser.add_argument("--check", action="store_true",
+                        help="Only check the schema file")
+    args = parser.parse_args(argv)
+
+    client = etag = None
+    if args.source.startswith("s3://"):
+        from .clients import pool
+        bucket, _, key = args.source[len("s3://"):].partition("/")
+        client = pool().session().client("s3")
+        result = client.get_object(Bucket=bucket, Key=key)
+        source, etag = result["Body"].read(), result["ETag"]
+    else:
+        with open(args.source, "rb") as f:
+            source = f.read()
+    config = json.loads(source)
+    errors = config_errors(config)
+    for error in errors:
+        print(error, file=sys.stderr)
+    if errors or args.check:
+        return 1 if errors else 0
+    data = compile_config(config, source)
+    if args.output is None and client is not None:
+        output = artifact_key(key, etag)
+        client.put_object(Bucket=bucket, Key=output, Body=data)
+        output = f"s3://{bucket}/{output}"
+    else:
+        output = args.output or f"{args.source}.arrow"
+        with open(output, "wb") as f:
+            f.write(data)
+    print(f"Compiled {len(config['paths'])} paths ({content_hash(source)[:12]}) "
+          f"to {output}, {len(data)} bytes", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
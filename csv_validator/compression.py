@@ -0,0 +1,98 @@
+import re
+
+import pyarrow
+
+
+# Extensions (after .csv) of the compressed files we accept, by codec.
+COMPRESSED_EXTENSIONS = {
+    "gz": "gzip",
+    "gzip": "gzip",
+    "zst": "zstd",
+    "zstd": "zstd",
+    "bz2": "bz2"
+}
+# Binary, so a plain csv can't start with them.
+MAGIC_BYTES = [
+    (b"\x1f\x8b", "gzip"),
+    (b"\x28\xb5\x2f\xfd", "zstd")
+]
+# "BZh", the block size and the magic of the first block (or of the end of
+# an empty stream). It is all printable text a csv header could start
+# with, so it is only believed of keys with a compressed extension.
+BZ2_MAGIC = re.compile(rb"BZh[1-9](1AY&SY|\x17\x72\x45\x38\x50\x90)")
+MAGIC_SIZE = 10
+
+
+def split_extension(key):
+    """
+    Split a key into its file extension and compression extension, e.g.
+    "a/b.csv.gz" gives ("csv", "gz") and "a/b.csv" gives ("csv", None).
+
+    :returns: tuple of (extension, compression extension or None)
+    """
+    parts = key.split("/")[-1].split(".")
+    if len(parts) > 2 and parts[-1].lower() in COMPRESSED_EXTENSIONS:
+        return parts[-2], parts[-1].lower()
+    return parts[-1], None
+
+
+def codec_from_magic(data, printable=False):
+    """
+    Get the codec a file is compressed with from its first bytes.
+
+    :param data: The first MAGIC_SIZE bytes of the file.
+    :type  data: bytes
+
+    :param printable: Also check for magic bytes that are printable text
+                      (bz2's), for files named as compressed.
+    :type  printable: bool
+
+    :returns: codec name or None if it isn't a compressed file we know.
+    """
+    for magic, codec in MAGIC_BYTES:
+        if data.startswith(magic):
+            return codec
+    if printable and BZ2_MAGIC.match(data):
+        return "bz2"
+    return None
+
+
+def detect_codec(key, data):
+    """
+    Pick the codec for a file. The extension is trusted first, the magic
+    bytes only decide when they contradict it: a ".csv" that is really
+    gzip or zstd, a ".gz" that is really another codec, or one that isn't
+    compressed at all.
+
+    :param key: The s3 key of the file.
+    :type  key: string
+
+    :param data: The first MAGIC_SIZE bytes of the file.
+    :type  data: bytes
+
+    :returns: codec name or None for an uncompressed file.
+    """
+    named = COMPRESSED_EXTENSIONS.get(split_extension(key)[1])
+    if named is None:
+        return codec_from_magic(data)
+    if not data:
+        # Too short to tell.
+        return named
+    return codec_from_magic(data, printable=True)
+
+
+def decompressing_stream(raw, codec):
+    """
+    Wrap a stream so it is decompressed as it is read.
+
+    :param raw: The compressed stream.
+    :type  raw: file-like object
+
+    :param codec: Name of the codec.
+    :type  codec: string
+
+    :returns: pyarrow.CompressedInputStream
+    """
+    if not isinstance(raw, pyarrow.NativeFile):
+        raw = pyarrow.PythonFile(raw, mode="r")
+    return pyarrow.CompressedInputStream(raw, codec)
@@ -1,5 +1,20 @@
 import json
 import logging
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+from .compiled import fetch_compiled
+
+
+DEFAULT_CACHE_TTL = 300
+
+# Configs cached for the life of the container, keyed by loader.cache_key().
+_CONFIG_CACHE = {}
+_CACHE_LOCK = threading.Lock()
+_FETCHING = {}
+CACHE_STATS = {"hits": 0, "misses": 0, "revalidations": 0}
 
 
 class ConfigLoader:
@@ -19,12 +34,37 @@ class ConfigLoader:
         """
         raise NotImplementedError()
 
+    def cache_key(self):
+        """
+        Key identifying the configuration this loader returns, used to
+        share it across invocations in a warm container.
+
+        :returns: hashable key
+        """
+        return (type(self).__name__, repr(sorted(vars(self).items())))
+
+    def load_if_changed(self, session, version):
+        """
+        Load the configuration unless it is still at the given version.
+        Override this to support cheap revalidation, the default always
+        reloads.
+
+        :param session: Boto3 session
+        :type  session: boto3 session
+
+        :param version: Version returned by the last load, or None.
+        :type  version: string
+
+        :returns: tuple of (configuration dict, version), or None if unchanged
+        """
+        return self.load(session), None
+
 
 class S3JsonLoader(ConfigLoader):
     """
     Loads the configuration from a json file in s3.
     """
-    def __init__(self, bucket, key):
+    def __init__(self, bucket, key, compiled=False):
         """
         Constructor.
 
@@ -33,10 +73,16 @@ class S3JsonLoader(ConfigLoader):
 
         :param key: The key name of the json file.
         :type  key: string
+
+        :param compiled: Load the compiled artifact of the file's current
+                         version instead, compiling and uploading it first
+                         if there isn't one yet (see compiled.py).
+        :type  compiled: bool
         """
         self.bucket = bucket
         self.key = key
-    
+        self.compiled = compiled
+
     def load(self, session):
         """
         Load the configuration using whatever logic needed.
@@ -46,8 +92,174 @@ class S3JsonLoader(ConfigLoader):
 
         :returns: configuration dict
         """
+        if self.compiled:
+            return self.load_if_changed(session, None)[0]
         client = session.client("s3")
         logging.info(f"Loading schema from s3://{self.bucket}/{self.key}")
         result = client.get_object(Bucket=self.bucket, Key=self.key)
         body = result["Body"].read()
         return json.loads(body)
+
+    def cache_key(self):
+        return ("s3", self.bucket, self.key, self.compiled)
+
+    def load_if_changed(self, session, version):
+        """
+        Load the configuration unless its ETag still matches.
+
+        :param session: Boto3 session
+        :type  session: boto3 session
+
+        :param version: ETag returned by the last load, or None.
+        :type  version: string
+
+        :returns: tuple of (configuration dict, ETag), or None if unchanged
+        """
+        client = session.client("s3")
+        kwargs = {"Bucket": self.bucket, "Key": self.key}
+        if version is not None:
+            kwargs["IfNoneMatch"] = version
+        try:
+            if self.compiled:
+                # Only the ETag is needed to find the artifact.
+                result = client.head_object(**kwargs)
+            else:
+                result = client.get_object(**kwargs)
+        except ClientError as e:
+            status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+            if status == 304:
+                return None
+            raise
+        if self.compiled:
+            return fetch_compiled(client, self.bucket, self.key, result["ETag"])
+        logging.info(f"Loaded schema from s3://{self.bucket}/{self.key}")
+        body = result["Body"].read()
+        return json.loads(body), result.get("ETag")
+
+
+class FileJsonLoader(ConfigLoader):
+    """
+    Loads the configuration from a local json file, e.g. for batch runs.
+    """
+    def __init__(self, path):
+        """
+        Constructor.
+
+        :param path: Path of the json file.
+        :type  path: string
+        """
+        self.path = path
+
+    def load(self, session):
+        """
+        Load the configuration from the file.
+
+        :param session: Not used, for the same interface as the others.
+        :type  session: boto3 session
+
+        :returns: configuration dict
+        """
+        logging.info(f"Loading schema from {self.path}")
+        with open(self.path) as f:
+            return json.load(f)
+
+    def cache_key(self):
+        return ("file", self.path)
+
+
+class CachedLoader(ConfigLoader):
+    """
+    Wraps another loader and keeps its configuration at module scope, so
+    warm invocations skip the download and parse. Once the ttl expires the
+    configuration is revalidated with the wrapped loader's
+    load_if_changed (an If-None-Match request for S3JsonLoader).
+
+    The cache lock is only held to read and update entries; the fetch runs
+    outside it, one at a time per key, and concurrent loads of that key
+    wait for its result.
+    """
+    def __init__(self, loader, ttl=DEFAULT_CACHE_TTL):
+        """
+        Constructor.
+
+        :param loader: The loader to cache.
+        :type  loader: ConfigLoader
+
+        :param ttl: Seconds to trust a cached config before revalidating.
+        :type  ttl: float
+        """
+        self.loader = loader
+        self.ttl = ttl
+
+    def cache_key(self):
+        return self.loader.cache_key()
+
+    def load(self, session):
+        """
+        Load the configuration from the cache if it is fresh.
+
+        :param session: Boto3 session
+        :type  session: boto3 session
+
+        :returns: configuration dict
+        """
+        key = self.cache_key()
+        started = time.monotonic()
+        while True:
+            with _CACHE_LOCK:
+                entry = _CONFIG_CACHE.get(key)
+                now = time.monotonic()
+                # A config fetched while this call waited counts as fresh,
+                # even with a ttl of zero.
+                if entry is not None and (now - entry["loaded_at"] < self.ttl
+                                          or entry["loaded_at"] >= started):
+                    CACHE_STATS["hits"] += 1
+                    return entry["config"]
+                fetching = _FETCHING.get(key)
+                if fetching is None:
+                    fetching = _FETCHING[key] = threading.Event()
+                    break
+            # Another thread is fetching this key; wait for it, not the lock.
+            fetching.wait()
+
+        try:
+            version = entry["version"] if entry is not None else None
+            loaded = self.loader.load_if_changed(session, version)
+            now = time.monotonic()
+            with _CACHE_LOCK:
+                if loaded is None:
+                    CACHE_STATS["revalidations"] += 1
+                    _CONFIG_CACHE[key] = dict(entry, loaded_at=now)
+                    return entry["config"]
+                CACHE_STATS["misses"] += 1
+                config, version = loaded
+                _CONFIG_CACHE[key] = {
+                    "config": config,
+                    "version": version,
+                    "loaded_at": now
+                }
+                return config
+        finally:
+            with _CACHE_LOCK:
+                del _FETCHING[key]
+            fetching.set()
+
+
+def cache_stats():
+    """
+    Get the config cache hit/miss counters for this container.
+
+    :returns: dict of hits, misses and revalidations
+    """
+    with _CACHE_LOCK:
+        return dict(CACHE_STATS)
+
+
+def clear_cache():
+    """
+    Drop every cached configuration and reset the counters.
+    """
+    with _CACHE_LOCK:
+        _CONFIG_CACHE.clear()
+        for name in CACHE_STATS:
+            CACHE_STATS[name] = 0
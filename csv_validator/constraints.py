@@ -0,0 +1,174 @@
+import operator
+
+import pyarrow
+import pyarrow.compute as pc
+
+
+COMPARISONS = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "lt": operator.lt,
+    "le": operator.le,
+    "gt": operator.gt,
+    "ge": operator.ge
+}
+# Field level shorthands and the expression each one stands for.
+FIELD_CONSTRAINTS = {
+    "min": "ge",
+    "max": "le",
+    "enum": "in",
+    "regex": "regex",
+    "min_length": "min_length",
+    "max_length": "max_length",
+    "not_null": "not_null"
+}
+
+
+class ConstraintSet:
+    """
+    The value level constraints of a path, compiled once into arrow
+    compute expressions and evaluated a whole batch at a time.
+
+    Fields declare their own constraints, e.g.
+    {"name": "amount", ..., "constraints": {"min": 0, "max": 1000}}, with
+    min, max, non_negative, enum, regex (matched against the whole value),
+    min_length, max_length and not_null. Conditions across columns go in
+    the path's "constraints" list, e.g.
+    {"name": "ends_after_start", "check": {"column": "end", "ge": {"column": "start"}}}
+    with an optional "when" the check only applies to. Expressions are a
+    column with one operator (eq, ne, lt, le, gt, ge, in, not_in, regex,
+    min_length, max_length, not_null, is_null), whose operand is a value
+    or {"column": name}, or "all", "any" and "not" of other expressions.
+
+    A value that is null passes every constraint but not_null, so
+    nullability is only checked where it is asked for.
+    """
+    def __init__(self, path, schema):
+        """
+        Constructor.
+
+        :param path: The path from the config.
+        :type  path: dict
+
+        :param schema: The arrow schema of the path.
+        :type  schema: pyarrow.Schema
+        """
+        self.schema = schema
+        self.columns = set()
+        self.names = []
+        self.violations = []
+        for field in path["fields"]:
+            for name, value in field.get("constraints", {}).items():
+                self.names.append(f"{field['name']}.{name}")
+                self.violations.append(
+                    ~self.field_expression(field["name"], name, value))
+        for index, constraint in enumerate(path.get("constraints", [])):
+            violation = ~self.expression(constraint["check"])
+            if "when" in constraint:
+                violation = self.expression(constraint["when"]) & violation
+            self.names.append(constraint.get("name", f"constraint {index}"))
+            self.violations.append(violation)
+
+    def __len__(self):
+        return len(self.names)
+
+    def field_expression(self, column, name, value):
+        """
+        Compile one of a field's constraints, e.g. ("amount", "min", 0).
+
+        :returns: pyarrow.compute.Expression that is true for valid values.
+        """
+        if name == "non_negative":
+            return self.expression({"column": column, "ge": 0}) if value \
+                else pc.scalar(True)
+        if name not in FIELD_CONSTRAINTS:
+            raise ValueError(f"Unknown constraint on {column}: {name}")
+        return self.expression({"column": column, FIELD_CONSTRAINTS[name]: value})
+
+    def expression(self, spec):
+        """
+        Compile an expression from the config.
+
+        :param spec: e.g. {"column": "amount", "gt": 0}
+        :type  spec: dict
+
+        :returns: pyarrow.compute.Expression
+        """
+        if "all" in spec:
+            return self._combine(spec["all"], operator.and_)
+        if "any" in spec:
+            return self._combine(spec["any"], operator.or_)
+        if "not" in spec:
+            return ~self.expression(spec["not"])
+        column = self._column(spec.get("column"))
+        ops = [key for key in spec if key != "column"]
+        if len(ops) != 1:
+            raise ValueError(f"Constraint needs exactly one operator: {spec}")
+        op = ops[0]
+        operand = spec[op]
+        target_type = self.schema.field(spec["column"]).type
+        if op in COMPARISONS:
+            return COMPARISONS[op](column, self._operand(operand, target_type))
+        if op in ("in", "not_in"):
+            values = pyarrow.array(operand).cast(target_type)
+            # is_in is false for nulls, make it null like the comparisons
+            # so nulls pass whether or not it is negated.
+            found = pc.if_else(column.is_valid(), column.isin(values),
+                               pyarrow.scalar(None, pyarrow.bool_()))
+            return found if op == "in" else ~found
+        if op == "regex":
+            return pc.match_substring_regex(column, pattern=f"^(?:{operand})$")
+        if op == "min_length":
+            return pc.utf8_length(column) >= operand
+        if op == "max_length":
+            return pc.utf8_length(column) <= operand
+        if op in ("not_null", "is_null"):
+            valid = column.is_valid() if op == "not_null" else column.is_null()
+            return valid if operand else pc.scalar(True)
+        raise ValueError(f"Unknown constraint operator: {op}")
+
+    def _combine(self, specs, combine):
+        expressions = [self.expression(spec) for spec in specs]
+        if not expressions:
+            raise ValueError("Constraint has nothing to combine")
+        combined = expressions[0]
+        for expression in expressions[1:]:
+            combined = combine(combined, expression)
+        return combined
+
+    def _column(self, name):
+        if name is None or self.schema.get_field_index(name) < 0:
+            raise ValueError(f"Constraint on unknown column: {name}")
+        self.columns.add(name)
+        return pc.field(name)
+
+    def _operand(self, operand, target_type):
+        if isinstance(operand, dict):
+            return self._column(operand.get("column"))
+        # Literals take the column's type, so "2024-01-01" compares
+        # against a date column as a date.
+        return pc.scalar(pyarrow.scalar(operand).cast(target_type))
+
+    def evaluate(self, batch):
+        """
+        Evaluate every constraint against a batch in one pass.
+
+        :param batch: The converted batch.
+        :type  batch: pyarrow.RecordBatch
+
+        :returns: list of (name, pyarrow.BooleanArray), true where a row
+                  breaks the constraint.
+        """
+        # Acero pulls in pyarrow.dataset, only load it for paths that
+        # have constraints.
+        import pyarrow.acero as acero
+        source = acero.TableSourceNodeOptions(pyarrow.Table.from_batches([batch]))
+        # Names in the config may repeat, so the projection numbers them.
+        project = acero.ProjectNodeOptions(
+            self.violations, [str(index) for index in range(len(self.names))])
+        result = acero.Declaration.from_sequence([
+            acero.Declaration("table_source", source),
+            acero.Declaration("project", project)
+        ]).to_table(use_threads=False)
+        return [(name, pc.fill_null(result.column(index).combine_chunks(), False))
+                for index, name in enumerate(self.names)]
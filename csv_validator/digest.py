@@ -0,0 +1,477 @@
+import csv
+import io
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from botocore.exceptions import ClientError
+
+from .notifications import RESULT_COLUMNS, CsvEmailNotifier
+
+
+DEFAULT_WINDOW_SECONDS = 300
+DEFAULT_MAX_FAILURES = 1000
+DEFAULT_SPOOL_PATH = "/tmp/csv-validator-digest.jsonl"
+# A flush lock older than this was left by a flush that died.
+LOCK_SECONDS = 300
+# What S3 answers a conditional takeover of the lock that someone else won:
+# the lock changed, was deleted, or is being written at the same time.
+LOST_LOCK_CODES = ("PreconditionFailed", "NoSuchKey", "404", "ConditionalRequestConflict")
+DIGEST_COLUMNS = ("name", "pattern", "files", "failures", "first_seen", "last_seen",
+                  "example_key", "example_output")
+SUMMARY_GROUPS = 20
+
+# Spools kept for the life of the container, keyed by spec, so failures
+# buffered by one invocation are still there for the next.
+_SPOOLS = {}
+_SPOOLS_LOCK = threading.Lock()
+
+
+class Spool:
+    """
+    Base class of the stores failures wait in until the next digest. To
+    keep them somewhere else, subclass this and implement append, summary,
+    take and remove.
+    """
+    def append(self, records):
+        """
+        Add failures to the spool.
+
+        :param records: The failures, see DigestNotifier.records().
+        :type  records: list of dicts
+        """
+        raise NotImplementedError()
+
+    def summary(self):
+        """
+        :returns: tuple of (number of failures waiting, time the oldest was
+                  added or None)
+        """
+        raise NotImplementedError()
+
+    def take(self):
+        """
+        Read every failure waiting, without removing them.
+
+        :returns: tuple of (list of records, token to pass to remove())
+        """
+        raise NotImplementedError()
+
+    def remove(self, token):
+        """
+        Remove the failures read by take(), once they have been sent.
+        """
+        raise NotImplementedError()
+
+    def lock(self):
+        """
+        Stop anything else sharing the spool from flushing it at the same
+        time. Spools only used by one process don't need to.
+
+        :returns: bool, False if something else is flushing.
+        """
+        return True
+
+    def unlock(self):
+        pass
+
+
+class MemorySpool(Spool):
+    """
+    Failures kept in memory, for the life of the container.
+    """
+    def __init__(self):
+        self._records = []
+        self._lock = threading.Lock()
+
+    def append(self, records):
+        with self._lock:
+            self._records += records
+
+    def summary(self):
+        with self._lock:
+            if not self._records:
+                return 0, None
+            return len(self._records), self._records[0]["at"]
+
+    def take(self):
+        with self._lock:
+            return list(self._records), len(self._records)
+
+    def remove(self, token):
+        with self._lock:
+            del self._records[:token]
+
+
+class FileSpool(MemorySpool):
+    """
+    Failures kept in memory and appended to a json lines file, by default
+    under /tmp, so they survive the process (e.g. a lambda restarted after
+    a timeout) as long as the container does.
+    """
+    def __init__(self, path=DEFAULT_SPOOL_PATH):
+        super().__init__()
+        self.path = path
+        if os.path.exists(path):
+            with open(path) as f:
+                self._records = [json.loads(line) for line in f if line.strip()]
+
+    def append(self, records):
+        with self._lock:
+            with open(self.path, "a") as f:
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+            self._records += records
+
+    def remove(self, token):
+        with self._lock:
+            del self._records[:token]
+            with open(self.path, "w") as f:
+                for record in self._records:
+                    f.write(json.dumps(record) + "\n")
+
+
+class S3Spool(Spool):
+    """
+    Failures kept in S3, shared by every container, an object per
+    invocation under the prefix. The object names hold when and how many
+    failures they have, so checking whether a digest is due is one list.
+    A lock object, created with a conditional put, stops two containers
+    sending the same digest.
+    """
+    def __init__(self, bucket, prefix, session):
+        """
+        Constructor.
+
+        :param bucket: Bucket of the spool.
+        :type  bucket: string
+
+        :param prefix: Prefix of the spool, e.g. "digest/"
+        :type  prefix: string
+
+        :param session: Boto3 session
+        :type  session: boto3 session
+        """
+        self.bucket = bucket
+        self.prefix = prefix if not prefix or prefix.endswith("/") else prefix + "/"
+        self.session = session
+
+    @property
+    def _lock_key(self):
+        return f"{self.prefix}flush.lock"
+
+    def append(self, records):
+        # Millisecond time and count first, to find them without reading.
+        at = int(records[0]["at"] * 1000)
+        key = f"{self.prefix}pending/{at:013d}-{len(records)}-{uuid.uuid4().hex}.jsonl"
+        body = "".join(json.dumps(record) + "\n" for record in records)
+        self.session.client("s3").put_object(Bucket=self.bucket, Key=key,
+                                             Body=body.encode("utf-8"))
+
+    def _keys(self):
+        paginator = self.session.client("s3").get_paginator("list_objects_v2")
+        keys = []
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{self.prefix}pending/"):
+            keys += [item["Key"] for item in page.get("Contents", [])]
+        return keys
+
+    def summary(self):
+        count = 0
+        oldest = None
+        for key in self._keys():
+            at, records, _ = key.rsplit("/", 1)[1].split("-", 2)
+            count += int(records)
+            at = int(at) / 1000
+            oldest = at if oldest is None else min(oldest, at)
+        return count, oldest
+
+    def take(self):
+        client = self.session.client("s3")
+        records = []
+        keys = self._keys()
+        for key in keys:
+            body = client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+            records += [json.loads(line) for line in body.decode("utf-8").splitlines()
+                        if line.strip()]
+        return records, keys
+
+    def remove(self, token):
+        client = self.session.client("s3")
+        for start in range(0, len(token), 1000):
+            client.delete_objects(Bucket=self.bucket, Delete={
+                "Objects": [{"Key": key} for key in token[start:start + 1000]],
+                "Quiet": True
+            })
+
+    def lock(self):
+        client = self.session.client("s3")
+        # A body of its own, so every holder's lock has a different ETag.
+        body = uuid.uuid4().hex.encode("utf-8")
+        for _ in range(2):
+            try:
+                client.put_object(Bucket=self.bucket, Key=self._lock_key,
+                                  Body=body, IfNoneMatch="*")
+                return True
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") != "PreconditionFailed":
+                    raise
+            try:
+                held = client.head_object(Bucket=self.bucket, Key=self._lock_key)
+            except ClientError:
+                # Released since, try again.
+                continue
+            if time.time() - held["LastModified"].timestamp() < LOCK_SECONDS:
+                return False
+            logging.warning("Taking over a stale digest flush lock")
+            try:
+                # Only replaces the stale lock if nobody took it over first.
+                client.put_object(Bucket=self.bucket, Key=self._lock_key,
+                                  Body=body, IfMatch=held["ETag"])
+                return True
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") not in LOST_LOCK_CODES:
+                    raise
+                return False
+        return False
+
+    def unlock(self):
+        self.session.client("s3").delete_object(Bucket=self.bucket, Key=self._lock_key)
+
+
+def digest_spool(spec, session):
+    """
+    Make a spool from a spec, as given in the DIGEST_SPOOL environment
+    variable:
+
+    * "s3://bucket/prefix/" -> S3Spool, shared by every container.
+    * "memory" -> MemorySpool, kept for the life of the container.
+    * "file" or "file:/path/to/file" -> FileSpool, also kept.
+
+    Without a spec it is "memory": an S3 spool needs the role to write to
+    and delete from its bucket, so it has to be asked for. Only an S3
+    spool batches failures across containers. With the others,
+    concurrent containers each send their own digests, a scheduled flush
+    only reaches one container, and failures waiting in a container that
+    is recycled are never sent.
+
+    :returns: Spool
+    """
+    if not (spec or "").strip():
+        logging.warning("DIGEST_SPOOL isn't set, keeping digest failures in memory. Set it to "
+                        "s3://bucket/prefix/ to share them between containers")
+        spec = "memory"
+    spec = spec.strip()
+    if spec.startswith("s3://"):
+        bucket, _, prefix = spec[len("s3://"):].partition("/")
+        return S3Spool(bucket, prefix, session)
+    with _SPOOLS_LOCK:
+        if spec not in _SPOOLS:
+            logging.warning(f"Digest spool {spec} is only seen by this container, failures "
+                            "waiting in it are lost if the container is recycled")
+            kind, _, path = spec.partition(":")
+            if kind.lower() == "memory":
+                _SPOOLS[spec] = MemorySpool()
+            elif kind.lower() == "file":
+                _SPOOLS[spec] = FileSpool(path or DEFAULT_SPOOL_PATH)
+            else:
+                raise ValueError(f"Unknown digest spool: {spec}")
+        return _SPOOLS[spec]
+
+
+def clear_spools():
+    """
+    Drop every spool kept for the container.
+    """
+    with _SPOOLS_LOCK:
+        _SPOOLS.clear()
+
+
+def digest_rows(records):
+    """
+    Group failures by rule and schema pattern.
+
+    :param records: The failures, deduplicated.
+    :type  records: list of dicts
+
+    :returns: list of tuples in the order of DIGEST_COLUMNS, most files first.
+    """
+    groups = {}
+    for record in records:
+        group = groups.setdefault((record["name"], record["pattern"]), {
+            "files": set(), "failures": 0, "first": record, "last": record})
+        group["files"].add((record["bucket"], record["key"]))
+        group["failures"] += 1
+        if record["at"] < group["first"]["at"]:
+            group["first"] = record
+        if record["at"] > group["last"]["at"]:
+            group["last"] = record
+    rows = []
+    for (name, pattern), group in groups.items():
+        first = group["first"]
+        rows.append((name, pattern, len(group["files"]), group["failures"],
+                     _timestamp(first["at"]), _timestamp(group["last"]["at"]),
+                     first["key"], first["output"]))
+    return sorted(rows, key=lambda row: (-row[2], row[0], row[1]))
+
+
+def _timestamp(at):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(at))
+
+
+def _csv(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    writer.writerows(rows)
+    return buffer
+
+
+class DigestNotifier(CsvEmailNotifier):
+    """
+    Buffers failures in a spool instead of emailing each invocation's, and
+    sends one digest email when the oldest has waited a window or enough
+    have piled up. The digest groups the failures by rule and schema
+    pattern, and attaches the failures themselves with repeats (the same
+    file failing the same way again) dropped.
+    """
+    def __init__(self, sender, recipients, session, spool=None,
+                 window_seconds=DEFAULT_WINDOW_SECONDS, max_failures=DEFAULT_MAX_FAILURES,
+                 pattern_of=None):
+        """
+        Constructor.
+
+        :param spool: Where failures wait for the digest, a MemorySpool by
+                      default.
+        :type  spool: Spool
+
+        :param window_seconds: Longest a failure waits before a digest is
+                               sent (at the next invocation after).
+        :type  window_seconds: float
+
+        :param max_failures: Send a digest as soon as this many failures
+                             are waiting.
+        :type  max_failures: int
+
+        :param pattern_of: Gets the schema pattern of a key, or None if no
+                           path matches (e.g. ValidateSchema.pattern_of).
+                           Failures are grouped by the key's directory when
+                           there isn't one.
+        :type  pattern_of: callable
+        """
+        super().__init__(sender, recipients, session)
+        self.spool = spool if spool is not None else MemorySpool()
+        self.window_seconds = window_seconds
+        self.max_failures = max_failures
+        self.pattern_of = pattern_of
+
+    def _pattern(self, key):
+        pattern = self.pattern_of(key) if self.pattern_of is not None else None
+        if pattern is None:
+            return os.path.dirname(key) + "/"
+        return pattern
+
+    def records(self, results, at=None):
+        """
+        Turn the failures among results into records for the spool.
+
+        :returns: list of dicts
+        """
+        at = time.time() if at is None else at
+        records = []
+        for result in results:
+            if result[0] != "FAILED":
+                continue
+            record = dict(zip(RESULT_COLUMNS, result))
+            record["pattern"] = self._pattern(record["key"])
+            record["at"] = at
+            records.append(record)
+        return records
+
+    def notify(self, results):
+        """
+        Add the failures to the spool, then send a digest if one is due.
+        Call with no results (e.g. from a scheduled invocation) to only
+        send a digest that is due.
+
+        :param results: The results in tuple form for each rule.
+                        The tuple has the format (status, name, description, output, bucket, key)
+        :type  results: List of tuples of (string, string, string, string, string, string)
+        """
+        records = self.records(results)
+        if records:
+            self.spool.append(records)
+        self.flush_if_due()
+
+    def due(self, now=None):
+        """
+        :returns: bool, whether a digest should be sent.
+        """
+        count, oldest = self.spool.summary()
+        if not count:
+            return False
+        now = time.time() if now is None else now
+        return count >= self.max_failures or now - oldest >= self.window_seconds
+
+    def flush_if_due(self, now=None):
+        """
+        Send a digest if one is due.
+
+        :returns: int, failures sent.
+        """
+        if not self.due(now):
+            return 0
+        return self.flush()
+
+    def flush(self):
+        """
+        Send a digest of every failure waiting and remove them from the
+        spool, unless another flush holds the spool's lock.
+
+        :returns: int, failures sent.
+        """
+        if not self.spool.lock():
+            logging.info("Digest is being sent by another invocation")
+            return 0
+        try:
+            records, token = self.spool.take()
+            if not records:
+                return 0
+            self._send(self.digest(records))
+            self.spool.remove(token)
+            logging.info(f"Sent a digest of {len(records)} failures")
+            return len(records)
+        finally:
+            self.spool.unlock()
+
+    def digest(self, records):
+        """
+        Build the digest email.
+
+        :returns: string, the raw email.
+        """
+        unique = {}
+        for record in sorted(records, key=lambda record: record["at"]):
+            # The same file failing the same way, e.g. an event delivered twice.
+            identity = (record["name"], record["bucket"], record["key"], record["output"])
+            unique.setdefault(identity, record)
+        failures = list(unique.values())
+        rows = digest_rows(failures)
+        files = len({(record["bucket"], record["key"]) for record in failures})
+        since = _timestamp(failures[0]["at"])
+        lines = [f"{len(failures)} failures in {files} files since {since}.", ""]
+        for row in rows[:SUMMARY_GROUPS]:
+            lines.append(f"{row[0]} on {row[1]}: {row[2]} files, e.g. {row[6]}: {row[7]}")
+        if len(rows) > SUMMARY_GROUPS:
+            lines.append(f"... and {len(rows) - SUMMARY_GROUPS} more, see digest.csv")
+        failures_csv = _csv(RESULT_COLUMNS + ("pattern", "at"), [
+            tuple(record[column] for column in RESULT_COLUMNS)
+            + (record["pattern"], _timestamp(record["at"]))
+            for record in failures])
+        return self._email(
+            f"S3 File Notification Digest: {len(failures)} failures in {files} files",
+            "\n".join(lines),
+            [("digest.csv", _csv(DIGEST_COLUMNS, rows)), ("failures.csv", failures_csv)]
+        )
@@ -3,21 +3,52 @@ import logging
 
 from .notifications import CsvEmailNotifier, DebugNotifier, AtddNotifier
 from .rules import FileFormatValidator, ValidateSchema
-from .rules import ValidationSuite
-from .config import S3JsonLoader
+from .rules import DEFAULT_CONCURRENCY, ValidationSuite
+from .cache import DEFAULT_MAX_ENTRIES, result_cache
+from .clients import log_setup, pool, setup_stats
+from .config import CachedLoader, DEFAULT_CACHE_TTL, S3JsonLoader
+from .digest import DEFAULT_MAX_FAILURES, DEFAULT_WINDOW_SECONDS, DigestNotifier
+from .digest import digest_spool
+from .metrics import MetricsEmitter
 
-import boto3
 
-
-logging.basicConfig(level=logging.DEBUG,
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(level=LOG_LEVEL,
                     format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
                     datefmt='%m-%d %H:%M')
+# The lambda runtime has set up the root logger already, in which case
+# basicConfig leaves its level alone.
+logging.getLogger().setLevel(LOG_LEVEL)
+
+
+async def validate_async(runner, event, session, workers):
+    """
+    Run the suite's async path, with enough threads for every record's
+    check plus the files, config and notification fetched alongside.
+    """
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=workers))
+    await runner.validate_async(event, session)
+    await runner.wait_for_notification()
 
 
 def handle(event, context):
     schema_bucket = os.environ["CONFIG_BUCKET"]
     schema_key = os.environ["CONFIG_KEY"]
-    session = boto3.session.Session()
+    cache_ttl = float(os.environ.get("CONFIG_CACHE_TTL", DEFAULT_CACHE_TTL))
+    concurrency = int(os.environ.get("MAX_CONCURRENCY", DEFAULT_CONCURRENCY))
+    full_scan = os.environ.get("FULL_SCAN", "false").lower() == "true"
+    async_io = os.environ.get("ASYNC_IO", "false").lower() == "true"
+    compiled = os.environ.get("COMPILED_CONFIG", "false").lower() == "true"
+    metrics = None
+    if os.environ.get("METRICS", "emf").lower() == "emf":
+        metrics = MetricsEmitter(os.environ.get("METRICS_NAMESPACE",
+                                                "CsvValidator"))
+    setup = setup_stats()
+    clients = pool()
+    session = clients.session()
     notifier_type = os.environ.get("NOTIFIER_TYPE", "debug")
     notifier = None
     if notifier_type.lower() == "debug":
@@ -30,13 +61,38 @@ def handle(event, context):
         sender = os.environ["EMAIL_SENDER"]
         recipients = os.environ["EMAIL_RECIPIENTS"].split(",")
         notifier = CsvEmailNotifier(sender, recipients, session)
+    elif notifier_type.lower() == "digest":
+        sender = os.environ["EMAIL_SENDER"]
+        recipients = os.environ["EMAIL_RECIPIENTS"].split(",")
+        notifier = DigestNotifier(
+            sender, recipients, session,
+            digest_spool(os.environ.get("DIGEST_SPOOL"), session),
+            float(os.environ.get("DIGEST_WINDOW_SECONDS", DEFAULT_WINDOW_SECONDS)),
+            int(os.environ.get("DIGEST_MAX_FAILURES", DEFAULT_MAX_FAILURES)))
     rules = [
-        FileFormatValidator("FileFormatValidator", "File format must end in .csv"),
+        FileFormatValidator("FileFormatValidator", "File format must end in .csv or .csv.gz/.zst/.bz2",
+                            concurrency=concurrency),
         ValidateSchema(
             "ValidateSchema",
             "Validate the schema of the file is correct",
-            S3JsonLoader(schema_bucket, schema_key)
+            CachedLoader(S3JsonLoader(schema_bucket, schema_key, compiled), cache_ttl),
+            filesystem=clients.filesystem(),
+            concurrency=concurrency,
+            sampling=not full_scan,
+            result_cache=result_cache(
+                os.environ.get("RESULT_CACHE", "none"), session,
+                int(os.environ.get("RESULT_CACHE_SIZE", DEFAULT_MAX_ENTRIES)))
         )
     ]
-    runner = ValidationSuite(rules, notifier)
-    runner.validate(event, session)
+    if isinstance(notifier, DigestNotifier):
+        # Group the digest's failures by the schema path they matched.
+        notifier.pattern_of = rules[1].pattern_of
+    runner = ValidationSuite(rules, notifier, metrics)
+    if async_io:
+        workers = 2 * concurrency + len(event["Records"]) + 2
+        # Only imported when used, it adds to every cold start.
+        import asyncio
+        asyncio.run(validate_async(runner, event, session, workers))
+    else:
+        runner.validate(event, session)
+    log_setup(setup)
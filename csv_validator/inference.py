@@ -0,0 +1,263 @@
+import csv as csv_module
+import logging
+import multiprocessing
+import os
+import tempfile
+
+import pyarrow
+import pyarrow.compute as pc
+import pyarrow.csv as csv
+import pyarrow.fs as fs
+
+from .memory import DEFAULT_BLOCK_SIZE
+from .profile import hash_values
+from .quarantine import READER_ERRORS, convert_column
+from .rules import ScanStream
+from .uniqueness import DEFAULT_MEMORY_BUDGET, UniqueKeyTracker
+
+
+# Types tried for a column, narrowest first. Types only widen within a
+# family (int64 to double, date32 to timestamps); anything else mixed is
+# a string.
+KINDS = ["null", "int64", "bool", "double", "date32[day]", "timestamp[s]",
+         "timestamp[ns]", "string"]
+FAMILIES = [["int64", "double"], ["date32[day]", "timestamp[s]", "timestamp[ns]"]]
+KEY_SCHEMA = pyarrow.schema([("key", pyarrow.uint64())])
+
+
+def join_kinds(a, b):
+    """
+    Get the narrowest type both types' values convert to.
+
+    :returns: string, one of KINDS
+    """
+    if a == b or b == "null":
+        return a
+    if a == "null":
+        return b
+    for family in FAMILIES:
+        if a in family and b in family:
+            return family[max(family.index(a), family.index(b))]
+    return "string"
+
+
+def fits(kind, values):
+    """
+    Check every value converts to a type, the way the csv reader the
+    validator uses would convert it (e.g. " 1" is an int64, "tRue" isn't a
+    bool), so a schema inferred from a file validates that file.
+
+    :param kind: One of KINDS.
+    :type  kind: string
+
+    :param values: Values without nulls.
+    :type  values: pyarrow.StringArray
+
+    :returns: bool
+    """
+    if kind == "string":
+        return True
+    if kind == "null":
+        return len(values) == 0
+    try:
+        convert_column(values, pyarrow.type_for_alias(kind))
+    except READER_ERRORS:
+        return False
+    return True
+
+
+def widen(kind, values):
+    """
+    Widen a column's type so the next values convert to it too.
+
+    :param kind: The type so far, one of KINDS.
+    :type  kind: string
+
+    :param values: The next values, without nulls.
+    :type  values: pyarrow.StringArray
+
+    :returns: string, one of KINDS
+    """
+    if fits(kind, values):
+        return kind
+    narrowest = next(candidate for candidate in KINDS if fits(candidate, values))
+    return join_kinds(kind, narrowest)
+
+
+def _open(path):
+    if "://" in path:
+        filesystem, location = fs.FileSystem.from_uri(path)
+    else:
+        filesystem, location = fs.LocalFileSystem(), os.path.abspath(path)
+    # Decompressed by extension, e.g. ".csv.gz".
+    return filesystem.open_input_stream(location, compression="detect")
+
+
+def infer_file(path, delimiter, sample_rows=None, sample_bytes=None, key_dir=None,
+               block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Infer the types and nullability of a file's columns one batch at a
+    time, so memory doesn't grow with the file. Every value is read as a
+    string and each column's type widened until all its values convert.
+    Columns that could be a primary key so far (no nulls, no duplicates
+    within a batch) have the hashes of their values written to key_dir,
+    for merge_inferences to check across batches and files.
+
+    :param path: Local path or uri (e.g. "s3://bucket/key.csv").
+    :type  path: string
+
+    :param sample_rows: Only read this many rows, None for all.
+    :type  sample_rows: int
+
+    :param sample_bytes: Only read the whole rows within this many bytes,
+                         None for all.
+    :type  sample_bytes: int
+
+    :param key_dir: Directory for the key hashes, None to not look for
+                    primary key candidates.
+    :type  key_dir: string
+
+    :returns: dict of path, names, kinds, nulls, rows and keys (column name
+              to its hash file), picklable to come back from a worker.
+    """
+    with _open(path) as source:
+        raw = ScanStream(source, max_lines=sample_rows + 1 if sample_rows else None,
+                         max_bytes=sample_bytes)
+        header = raw.peek_header().decode("utf-8").rstrip("\r\n")
+        names = next(csv_module.reader([header], delimiter=delimiter))
+        reader = csv.open_csv(
+            raw,
+            read_options=csv.ReadOptions(block_size=block_size),
+            parse_options=csv.ParseOptions(delimiter=delimiter),
+            convert_options=csv.ConvertOptions(
+                column_types={name: pyarrow.string() for name in names},
+                strings_can_be_null=True)
+        )
+        kinds = ["null"] * len(names)
+        nulls = [0] * len(names)
+        rows = 0
+        writers = {}
+        keys = {}
+        if key_dir is not None:
+            stem = os.path.join(key_dir, f"{os.getpid()}-{id(raw)}")
+            for index, name in enumerate(names):
+                keys[name] = f"{stem}-{index}.arrow"
+                writers[name] = pyarrow.ipc.new_file(keys[name], KEY_SCHEMA)
+        try:
+            for batch in reader:
+                rows += batch.num_rows
+                for index, column in enumerate(batch.columns):
+                    nulls[index] += column.null_count
+                    values = column.drop_null() if column.null_count else column
+                    if kinds[index] != "string" and len(values):
+                        kinds[index] = widen(kinds[index], values)
+                    name = names[index]
+                    if name not in writers:
+                        continue
+                    if column.null_count or pc.count_distinct(values).as_py() < len(values):
+                        writers.pop(name).close()
+                        os.remove(keys.pop(name))
+                        continue
+                    writers[name].write_batch(pyarrow.record_batch(
+                        [hash_values(values)], schema=KEY_SCHEMA))
+        finally:
+            for writer in writers.values():
+                writer.close()
+    logging.info(f"Inferred types from {rows} rows of {path}")
+    return {"path": path, "names": names, "kinds": kinds, "nulls": nulls,
+            "rows": rows, "keys": keys}
+
+
+def _infer_file(args):
+    return infer_file(*args)
+
+
+def unique_columns(inferences, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """
+    Find the columns whose values were unique across every file, from the
+    key hashes infer_file wrote. Hashes that collide only lose a
+    candidate, never make a column look unique.
+
+    :returns: list of column names, in column order.
+    """
+    unique = []
+    if not sum(inference["rows"] for inference in inferences):
+        return unique
+    for name in inferences[0]["names"]:
+        if not all(name in inference["keys"] for inference in inferences):
+            continue
+        tracker = UniqueKeyTracker(memory_budget)
+        for inference in inferences:
+            reader = pyarrow.ipc.open_file(pyarrow.memory_map(inference["keys"][name]))
+            for index in range(reader.num_record_batches):
+                tracker.add(reader.get_batch(index).column(0))
+        if tracker.finish().duplicate_keys == 0:
+            unique.append(name)
+    return unique
+
+
+def merge_inferences(inferences, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """
+    Merge the inferences of several files with the same columns.
+
+    :returns: dict of fields (as in the schema config), rows and
+              primary_key_candidates
+    """
+    names = inferences[0]["names"]
+    for inference in inferences[1:]:
+        if inference["names"] != names:
+            raise ValueError(f"{inference['path']} has different columns to "
+                             f"{inferences[0]['path']}")
+    fields = []
+    for index, name in enumerate(names):
+        kind = "null"
+        for inference in inferences:
+            kind = join_kinds(kind, inference["kinds"][index])
+        nulls = sum(inference["nulls"][index] for inference in inferences)
+        fields.append({
+            "name": name,
+            # Nothing but nulls seen, so anything goes.
+            "type": "string" if kind == "null" else kind,
+            "nullable": nulls > 0
+        })
+    return {
+        "fields": fields,
+        "rows": sum(inference["rows"] for inference in inferences),
+        "primary_key_candidates": unique_columns(inferences, memory_budget)
+    }
+
+
+def infer_schema(paths, delimiter, sample_rows=None, sample_bytes=None, workers=1,
+                 memory_budget=DEFAULT_MEMORY_BUDGET):
+    """
+    Infer the fields of a schema path from sample files, reading them in
+    parallel and merging the results.
+
+    :param paths: Local paths or uris of the sample files.
+    :type  paths: list of strings
+
+    :param sample_rows: Rows to read from each file, None for all.
+    :type  sample_rows: int
+
+    :param sample_bytes: Bytes to read from each file, None for all.
+    :type  sample_bytes: int
+
+    :param workers: Processes to read the files in.
+    :type  workers: int
+
+    :param memory_budget: Bytes of key hashes held in memory when checking
+                          the primary key candidates, past which they are
+                          spilled to disk.
+    :type  memory_budget: int
+
+    :returns: dict of fields, rows and primary_key_candidates
+    """
+    with tempfile.TemporaryDirectory() as key_dir:
+        tasks = [(path, delimiter, sample_rows, sample_bytes, key_dir) for path in paths]
+        workers = min(workers or 1, len(paths))
+        if workers <= 1:
+            inferences = [_infer_file(task) for task in tasks]
+        else:
+            with multiprocessing.get_context("spawn").Pool(workers) as executor:
+                inferences = executor.map(_infer_file, tasks)
+        return merge_inferences(inferences, memory_budget)
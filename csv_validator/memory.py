@@ -0,0 +1,193 @@
+import logging
+import os
+import resource
+import sys
+import threading
+
+import pyarrow
+
+
+MIN_BLOCK_SIZE = 64 * 1024
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+# Rough number of blocks' worth of memory the csv reader holds per thread
+# (the raw block, parsed fields and converted arrays).
+BLOCK_MEMORY_FACTOR = 4
+# Share of the lambda's memory used as the budget when none is given.
+LAMBDA_MEMORY_SHARE = 0.8
+
+
+def current_rss():
+    """
+    Get the resident set size of this process.
+
+    :returns: bytes, or None where /proc isn't available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def peak_rss():
+    """
+    Get the highest resident set size of this process so far. On a warm
+    lambda container this covers every invocation it has served.
+
+    :returns: bytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def default_budget():
+    """
+    Default memory budget: the MEMORY_BUDGET_MB environment variable, or
+    a share of the lambda's configured memory.
+
+    :returns: bytes, or None for no budget.
+    """
+    if os.environ.get("MEMORY_BUDGET_MB"):
+        return int(float(os.environ["MEMORY_BUDGET_MB"]) * 1024 * 1024)
+    if os.environ.get("AWS_LAMBDA_FUNCTION_MEMORY_SIZE"):
+        size = int(os.environ["AWS_LAMBDA_FUNCTION_MEMORY_SIZE"]) * 1024 * 1024
+        return int(size * LAMBDA_MEMORY_SHARE)
+    return None
+
+
+class MemoryWatermark:
+    """
+    Tracks the high-water marks of RSS and the arrow memory pool while a
+    file is scanned. sample() is cheap enough to call once per batch. Both
+    are the process's, not the file's: files scanned at the same time
+    (MAX_CONCURRENCY) count towards each other's peaks.
+    """
+    def __init__(self, pool=None):
+        self.pool = pool or pyarrow.default_memory_pool()
+        self.rss = current_rss() or 0
+        self.arrow = self.pool.bytes_allocated()
+
+    def sample(self):
+        rss = current_rss()
+        if rss is not None and rss > self.rss:
+            self.rss = rss
+        allocated = self.pool.bytes_allocated()
+        if allocated > self.arrow:
+            self.arrow = allocated
+
+    def as_stats(self):
+        """
+        :returns: dict of peak_rss (the process's highest RSS seen during
+                  the scan), arrow_peak_bytes, process_peak_rss (the highest
+                  since the process started) and arrow_pool_max_memory.
+        """
+        self.sample()
+        return {
+            "peak_rss": self.rss,
+            "arrow_peak_bytes": self.arrow,
+            "process_peak_rss": peak_rss(),
+            "arrow_pool_max_memory": self.pool.max_memory()
+        }
+
+
+class MemoryBudget:
+    """
+    Fits csv readers into a memory budget by picking their block size and
+    threading from the memory left when a scan starts. Under pressure
+    threads are turned off first, then the block size is halved until the
+    reader fits in what is left (down to MIN_BLOCK_SIZE). What each scan
+    is sized for is reserved until it calls release(), so files scanned at
+    the same time split the headroom rather than each being sized for all
+    of it. Reservations belong to the thread that made them, the one
+    scanning the file.
+    """
+    def __init__(self, budget=None):
+        """
+        Constructor.
+
+        :param budget: Bytes the process should stay under, None for no
+                       limit.
+        :type  budget: int
+        """
+        self.budget = budget
+        self.reserved = 0
+        self._lock = threading.Lock()
+        self._scans = threading.local()
+
+    def used(self):
+        rss = current_rss()
+        if rss is None:
+            return pyarrow.total_allocated_bytes()
+        return rss
+
+    def _headroom(self):
+        # Called with the lock held. What other scans reserved is counted
+        # on top of the memory in use, which is on the safe side once they
+        # have allocated some of it.
+        return max(self.budget - self.used() - self.reserved, 0)
+
+    def _reserve(self, nbytes):
+        # Called with the lock held.
+        self.reserved += nbytes
+        self._scans.reserved = getattr(self._scans, "reserved", 0) + nbytes
+
+    def release(self):
+        """
+        Give back what this thread's scan reserved, once it is over.
+        """
+        nbytes = getattr(self._scans, "reserved", 0)
+        if nbytes:
+            with self._lock:
+                self.reserved -= nbytes
+            self._scans.reserved = 0
+
+    def reader_settings(self, block_size=None, use_threads=True):
+        """
+        Fit a reader's block size and threading into the budget.
+
+        :param block_size: Requested block size, None for the default.
+        :type  block_size: int
+
+        :param use_threads: Whether threads were requested.
+        :type  use_threads: bool
+
+        :returns: tuple of (block size, use threads)
+        """
+        block_size = block_size or DEFAULT_BLOCK_SIZE
+        if self.budget is None:
+            return block_size, use_threads
+        with self._lock:
+            headroom = self._headroom()
+            threads = pyarrow.cpu_count() if use_threads else 1
+            if block_size * BLOCK_MEMORY_FACTOR * threads <= headroom:
+                self._reserve(block_size * BLOCK_MEMORY_FACTOR * threads)
+                return block_size, use_threads
+            requested = block_size
+            use_threads = False
+            while block_size > MIN_BLOCK_SIZE and \
+                    block_size * BLOCK_MEMORY_FACTOR > headroom:
+                block_size //= 2
+            block_size = max(block_size, MIN_BLOCK_SIZE)
+            self._reserve(block_size * BLOCK_MEMORY_FACTOR)
+        logging.info(f"Memory pressure ({headroom} bytes left of {self.budget}), "
+                     f"reading with block size {block_size} instead of "
+                     f"{requested} and no threads")
+        return block_size, use_threads
+
+    def ranged_concurrency(self, part_size, concurrency):
+        """
+        Fit the parts a ranged read holds at once into the budget.
+
+        :returns: concurrency to use, at least 1.
+        """
+        if self.budget is None:
+            return concurrency
+        with self._lock:
+            # Each part is held raw and parsed, once for fetching and once
+            # for parsing.
+            fits = self._headroom() // (part_size * BLOCK_MEMORY_FACTOR)
+            concurrency = max(1, min(concurrency, fits))
+            self._reserve(concurrency * part_size * BLOCK_MEMORY_FACTOR)
+        return concurrency
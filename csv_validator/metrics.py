@@ -0,0 +1,118 @@
+import json
+import sys
+import time
+
+
+NAMESPACE = "CsvValidator"
+# Stats recorded by the rules that are emitted as metrics, with their
+# units. Anything else recorded goes in the record as a property.
+METRIC_UNITS = {
+    "seconds": "Seconds",
+    "validate_seconds": "Seconds",
+    "config_seconds": "Seconds",
+    "resolve_seconds": "Seconds",
+    "header_seconds": "Seconds",
+    "scan_seconds": "Seconds",
+    "notify_seconds": "Seconds",
+    "rows": "Count",
+    "batches": "Count",
+    "quarantined_rows": "Count",
+    "bytes_fetched": "Bytes",
+    "bytes_decompressed": "Bytes",
+    "bytes_materialized": "Bytes",
+    "peak_rss": "Bytes",
+    "arrow_peak_bytes": "Bytes",
+    "cache_hits": "Count",
+    "cache_misses": "Count",
+    "cache_evictions": "Count",
+    "cache_hit_rate": "Percent",
+    "rows_per_second": "Count/Second",
+    "bytes_per_second": "Bytes/Second"
+}
+
+
+def with_throughput(stats):
+    """
+    Add rows and bytes per second to a file's stats, over the time spent
+    scanning it (or checking it, for rules that don't scan).
+
+    :param stats: The stats recorded for a file.
+    :type  stats: dict
+
+    :returns: dict
+    """
+    stats = dict(stats)
+    seconds = stats.get("scan_seconds") or stats.get("seconds")
+    if seconds:
+        if "rows" in stats:
+            stats["rows_per_second"] = stats["rows"] / seconds
+        if "bytes_fetched" in stats:
+            stats["bytes_per_second"] = stats["bytes_fetched"] / seconds
+    return stats
+
+
+def emf_record(values, dimensions, namespace=NAMESPACE, timestamp=None):
+    """
+    Build a CloudWatch Embedded Metric Format record. Numeric values named
+    in METRIC_UNITS become metrics, everything else is kept as a property
+    (searchable in logs insights, but not a metric).
+
+    :param values: Stats to put in the record.
+    :type  values: dict
+
+    :param dimensions: Dimension names and values, e.g. {"Rule": "ValidateSchema"}
+    :type  dimensions: dict
+
+    :returns: dict, ready to be written as one line of json.
+    """
+    metrics = [
+        {"Name": name, "Unit": METRIC_UNITS[name]}
+        for name, value in values.items()
+        if name in METRIC_UNITS and isinstance(value, (int, float))
+        and not isinstance(value, bool)
+    ]
+    record = dict(values)
+    record.update(dimensions)
+    record["_aws"] = {
+        "Timestamp": int((timestamp or time.time()) * 1000),
+        "CloudWatchMetrics": [{
+            "Namespace": namespace,
+            "Dimensions": [sorted(dimensions)],
+            "Metrics": metrics
+        }]
+    }
+    return record
+
+
+class MetricsEmitter:
+    """
+    Writes EMF records as json lines to stdout, where the lambda runtime
+    picks them up and CloudWatch turns them into metrics.
+    """
+    def __init__(self, namespace=NAMESPACE, stream=None):
+        """
+        Constructor.
+
+        :param namespace: CloudWatch namespace of the metrics.
+        :type  namespace: string
+
+        :param stream: Where to write, stdout by default.
+        :type  stream: file-like object
+        """
+        self.namespace = namespace
+        self.stream = stream
+
+    def emit(self, values, dimensions):
+        """
+        Write one record.
+
+        :param values: Stats to put in the record.
+        :type  values: dict
+
+        :param dimensions: Dimension names and values.
+        :type  dimensions: dict
+        """
+        record = emf_record(values, dimensions, self.namespace)
+        stream = self.stream or sys.stdout
+        stream.write(json.dumps(record, default=str) + "\n")
+        stream.flush()
@@ -1,10 +1,12 @@
 import csv
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
 import io
 import json
 
 
+# Names of the fields of a result tuple, as the header of csv reports.
+RESULT_COLUMNS = ("status", "name", "description", "output", "bucket", "key")
+
+
 class Notifier:
     """
     Base notifier class. Inherit and implement notify function
@@ -36,6 +38,25 @@ class DebugNotifier(Notifier):
         print(results)
 
 
+class CollectingNotifier(Notifier):
+    """
+    Keeps the results of the last run instead of sending them, for callers
+    that report them their own way.
+    """
+    def __init__(self):
+        self.results = []
+
+    def notify(self, results):
+        """
+        Keep the results.
+
+        :param results: The results in tuple form for each rule.
+                        The tuple has the format (status, name, description, output, bucket, key)
+        :type  results: List of tuples of (string, string, string, string, string, string)
+        """
+        self.results = list(results)
+
+
 class CsvEmailNotifier(Notifier):
     """
     Sends csv as a notification via email.
@@ -51,30 +72,50 @@ class CsvEmailNotifier(Notifier):
         buffer = io.StringIO()
         writer = csv.writer(buffer)
         # Write the header.
-        header = ("status", "name", "description", "output", "bucket", "key")
-        writer.writerow(header)
+        writer.writerow(RESULT_COLUMNS)
         for row in results:
             writer.writerow(row)
         # Return the buffer.
         return buffer
 
-    def _buffer_to_attached_email(self, buffer):
+    def _email(self, subject, body, attachments):
+        # The email package is only needed here, keep it off the cold
+        # start of the other notifiers.
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
         # Create multipart email.
         msg = MIMEMultipart('mixed')
         msg["From"] = self.sender
-        msg["Subject"] = "S3 File Notification Report"
+        msg["Subject"] = subject
         # Add the body.
-        body = "S3 file notification report"
         msg.attach(MIMEText(body, "plain"))
-        # Add the csv file.
-        attachment = MIMEText(buffer.getvalue(), "csv")
-        attachment.add_header(
-            "Content-Disposition",
-            "attachment; filename= report.csv"
-        )
-        msg.attach(attachment)
+        # Add the csv files.
+        for filename, buffer in attachments:
+            attachment = MIMEText(buffer.getvalue(), "csv")
+            attachment.add_header(
+                "Content-Disposition",
+                f"attachment; filename= {filename}"
+            )
+            msg.attach(attachment)
         return msg.as_string()
 
+    def _buffer_to_attached_email(self, buffer):
+        return self._email("S3 File Notification Report", "S3 file notification report",
+                           [("report.csv", buffer)])
+
+    def _send(self, data):
+        client = self.session.client('sesv2')
+        client.send_email(
+            Destination={
+                "ToAddresses": self.recipients
+            },
+            Content={
+                "Raw": {
+                    "Data": data
+                }
+            }
+        )
+
     def notify(self, results):
         """
         Send a notification to the user when complete.
@@ -93,17 +134,7 @@ class CsvEmailNotifier(Notifier):
             return
         # Send an email
         buffer = CsvEmailNotifier._results_to_csv_buffer(results)
-        client = self.session.client('sesv2')
-        client.send_email(
-            Destination={
-                "ToAddresses": self.recipients
-            },
-            Content={
-                "Raw": {
-                    "Data": self._buffer_to_attached_email(buffer)
-                }
-            }
-        )
+        self._send(self._buffer_to_attached_email(buffer))
 
 
 class AtddNotifier(Notifier):
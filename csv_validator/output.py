@@ -0,0 +1,279 @@
+import logging
+import posixpath
+import uuid
+
+import pyarrow
+import pyarrow.fs as fs
+
+from .clients import pool
+from .compression import split_extension
+
+
+OUTPUT_FORMATS = {
+    "parquet": "parquet",
+    "arrow": "arrow"
+}
+DEFAULT_OUTPUT_FORMAT = "parquet"
+DEFAULT_PARQUET_COMPRESSION = "snappy"
+# S3 parts must be at least 5 MiB, except the last.
+PART_SIZE = 8 * 1024 * 1024
+
+
+def strip_extension(key):
+    """
+    Take the .csv and any compression extension off a key, e.g.
+    "reports/a.csv.gz" gives "reports/a".
+
+    :returns: string
+    """
+    extension, compression = split_extension(key)
+    if compression is not None:
+        key = key[:-len(compression) - 1]
+    if extension.lower() == "csv":
+        key = key[:-len(extension) - 1]
+    return key
+
+
+def output_key(key, fmt=DEFAULT_OUTPUT_FORMAT):
+    """
+    Name the output for a csv file, e.g. "reports/a.csv.gz" gives
+    "reports/a.parquet".
+
+    :param key: The s3 key of the csv file.
+    :type  key: string
+
+    :param fmt: The output format, a key of OUTPUT_FORMATS.
+    :type  fmt: string
+
+    :returns: string
+    """
+    return f"{strip_extension(key)}.{OUTPUT_FORMATS[fmt]}"
+
+
+def resolve_location(location, filesystem):
+    """
+    Get the filesystem and path for an output location. Locations with a
+    scheme (e.g. "s3://bucket/prefix" or "file:///data") get their own
+    filesystem, the container's shared one for s3, anything else is a
+    path on the filesystem being scanned.
+
+    :returns: tuple of (pyarrow.fs.FileSystem, path)
+    """
+    if location.startswith("s3://"):
+        return pool().filesystem(), location[len("s3://"):]
+    if "://" in location:
+        return fs.FileSystem.from_uri(location)
+    return filesystem, location
+
+
+class MultipartUpload:
+    """
+    A file-like sink writing straight to an S3 object, a part at a time.
+    The object only appears once complete() is called, and abort() throws
+    away the parts uploaded so far, so nothing has to be staged and
+    copied into place. Output under PART_SIZE is sent as one put.
+    """
+    def __init__(self, client, bucket, key, part_size=PART_SIZE):
+        """
+        Constructor.
+
+        :param client: S3 client.
+        :type  client: boto3 client
+
+        :param part_size: Bytes buffered before a part is uploaded.
+        :type  part_size: int
+        """
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.upload_id = None
+        self.parts = []
+        self.closed = False
+        self._buffer = bytearray()
+        self._position = 0
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        if len(self._buffer) >= self.part_size:
+            self._upload_part()
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        # The writers close their sink when they finish, the upload is
+        # only completed by complete().
+        self.closed = True
+
+    def _upload_part(self):
+        if self.upload_id is None:
+            self.upload_id = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key)["UploadId"]
+        number = len(self.parts) + 1
+        result = self.client.upload_part(Bucket=self.bucket, Key=self.key,
+                                         UploadId=self.upload_id, PartNumber=number,
+                                         Body=bytes(self._buffer))
+        self.parts.append({"ETag": result["ETag"], "PartNumber": number})
+        self._buffer = bytearray()
+
+    def complete(self):
+        """
+        Publish the object.
+        """
+        if self.upload_id is None:
+            self.client.put_object(Bucket=self.bucket, Key=self.key,
+                                   Body=bytes(self._buffer))
+            return
+        if self._buffer:
+            self._upload_part()
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts})
+
+    def abort(self):
+        """
+        Throw away the parts uploaded so far.
+        """
+        self._buffer = bytearray()
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key,
+                                               UploadId=self.upload_id)
+            self.upload_id = None
+
+
+class ValidatedOutput:
+    """
+    Writes the batches of a file to Parquet or Arrow IPC as they are
+    validated, so that a file that fails part way through never shows up
+    downstream. On S3 it is a multipart upload straight to the
+    destination, only completed by commit(). Elsewhere it is a hidden
+    staging file next to the destination, moved into place by commit().
+    """
+    def __init__(self, filesystem, path, fmt=DEFAULT_OUTPUT_FORMAT,
+                 compression=None, schema=None, client=None):
+        """
+        Constructor.
+
+        :param filesystem: Filesystem to write to.
+        :type  filesystem: pyarrow.fs.FileSystem
+
+        :param path: Destination path of the output.
+        :type  path: string
+
+        :param fmt: The output format, a key of OUTPUT_FORMATS.
+        :type  fmt: string
+
+        :param compression: Compression codec, None for the format's
+                            default (snappy for parquet, none for arrow).
+        :type  compression: string
+
+        :param schema: Schema to write if the file has no batches.
+        :type  schema: pyarrow.Schema
+
+        :param client: S3 client for an S3 filesystem, None for the
+                       container's client for the filesystem's region.
+        :type  client: boto3 client
+        """
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {fmt}")
+        self.filesystem = filesystem
+        self.path = path
+        self.fmt = fmt
+        self.compression = compression
+        self.schema = schema
+        self.client = client
+        self.upload = None
+        self.staging = None
+        if filesystem.type_name != "s3":
+            directory, name = posixpath.split(path)
+            self.staging = posixpath.join(directory,
+                                          f".{name}.{uuid.uuid4().hex}.inprogress")
+        self.rows = 0
+        self.committed = False
+        self.opened = False
+        self._stream = None
+        self._writer = None
+
+    def _open(self, schema):
+        if self.staging is None:
+            client = self.client
+            if client is None:
+                client = pool(self.filesystem.region).session().client("s3")
+            bucket, _, key = self.path.partition("/")
+            self.upload = MultipartUpload(client, bucket, key)
+            self._stream = pyarrow.PythonFile(self.upload, mode="w")
+        else:
+            self.filesystem.create_dir(posixpath.dirname(self.staging))
+            self._stream = self.filesystem.open_output_stream(self.staging)
+        self.opened = True
+        if self.fmt == "parquet":
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(
+                self._stream, schema,
+                compression=self.compression or DEFAULT_PARQUET_COMPRESSION)
+        else:
+            options = pyarrow.ipc.IpcWriteOptions(compression=self.compression)
+            self._writer = pyarrow.ipc.new_file(self._stream, schema,
+                                                options=options)
+
+    def write(self, batch):
+        """
+        Write the next validated batch.
+
+        :param batch: The converted batch.
+        :type  batch: pyarrow.RecordBatch
+        """
+        if self._writer is None:
+            self._open(batch.schema)
+        self._writer.write_batch(batch)
+        self.rows += batch.num_rows
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def commit(self):
+        """
+        Finish writing and publish the output.
+        """
+        if self._writer is None:
+            self._open(self.schema)
+        self._close_writer()
+        if self.upload is not None:
+            self.upload.complete()
+        else:
+            self.filesystem.move(self.staging, self.path)
+        self.committed = True
+        logging.info(f"Wrote {self.rows} validated rows to {self.path}")
+
+    def abort(self):
+        """
+        Throw away anything written, unless it was committed.
+        """
+        if self.committed or not self.opened:
+            return
+        try:
+            self._close_writer()
+        except Exception as e:
+            # Don't hide the error that caused the abort.
+            logging.warning(f"Failed to close output {self.staging or self.path}: {e}")
+        if self.upload is not None:
+            try:
+                self.upload.abort()
+            except Exception as e:
+                logging.warning(f"Failed to abort the upload of {self.path}: {e}")
+            return
+        try:
+            self.filesystem.delete_file(self.staging)
+        except OSError:
+            pass
@@ -0,0 +1,356 @@
+import hashlib
+import json
+import re
+import threading
+
+import pyarrow
+import pyarrow.csv as csv
+
+from .constraints import ConstraintSet
+
+
+REGEX_SPECIAL = set(".^$*+?{}[]\\|()")
+QUANTIFIERS = set("*?{")
+BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=")
+MAX_COMPILED_CONFIGS = 8
+PRESENCE_ONLY = "presence"
+
+# Compiled indexes for the configs seen by this container, so a config
+# served from the warm cache is only compiled once.
+_INDEX_CACHE = []
+_INDEX_LOCK = threading.Lock()
+
+
+def primary_key_columns(primary_key):
+    """
+    Normalize the primary key from the config into a list of column names.
+
+    :param primary_key: A single column name or a list of them for a
+                        composite key.
+    :type  primary_key: string or list of strings
+
+    :returns: list of column names.
+    """
+    if isinstance(primary_key, str):
+        return [primary_key]
+    return list(primary_key)
+
+
+def literal_prefix(pattern):
+    """
+    Get the literal text every key matched by a pattern has to start with.
+
+    :param pattern: Python regular expression, matched with re.match.
+    :type  pattern: string
+
+    :returns: string, empty if the pattern doesn't start with a literal.
+    """
+    if "|" in pattern:
+        # Alternation could apply to the whole pattern, so play it safe.
+        return ""
+    prefix = []
+    index = 1 if pattern.startswith("^") else 0
+    while index < len(pattern):
+        char = pattern[index]
+        step = 1
+        if char == "\\":
+            escaped = pattern[index + 1:index + 2]
+            if not escaped or escaped.isalnum():
+                break
+            char = escaped
+            step = 2
+        elif char in REGEX_SPECIAL:
+            break
+        following = pattern[index + step:index + step + 1]
+        if following and following in QUANTIFIERS:
+            # The character is optional or repeated, it isn't literal.
+            break
+        prefix.append(char)
+        index += step
+    return "".join(prefix)
+
+
+class PathEntry:
+    """
+    A path from the schema config with everything needed to scan a file
+    resolved once: the compiled pattern, the arrow schema and the csv
+    parse/convert options.
+    """
+    def __init__(self, index, path, pattern=None, prefix=None):
+        """
+        Constructor.
+
+        :param index: Position of the path in the config.
+        :type  index: int
+
+        :param path: The path from the config.
+        :type  path: dict
+
+        :param pattern: The path's pattern, if already known.
+        :type  pattern: string
+
+        :param prefix: The pattern's literal prefix, if already known.
+        :type  prefix: string
+        """
+        self.index = index
+        self._path = path
+        self.pattern = path["pattern"] if pattern is None else pattern
+        self.prefix = literal_prefix(self.pattern) if prefix is None else prefix
+        self._regex = None
+        self._schema = None
+        self._projected = None
+        self._parse_options = None
+        self._convert_options = None
+        self._string_convert_options = None
+        self._constraints = None
+        self._fingerprint = None
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def regex(self):
+        # Compiled on first use, most keys never get as far as trying
+        # most patterns.
+        if self._regex is None:
+            self._regex = re.compile(self.pattern)
+        return self._regex
+
+    @property
+    def delimiter(self):
+        return self.path["delimiter"]
+
+    @property
+    def primary_key(self):
+        return self.path["primary_key"]
+
+    @property
+    def unique_primary_key(self):
+        return self.path.get("unique_primary_key", False)
+
+    @property
+    def ranged_read(self):
+        return self.path.get("ranged_read", False)
+
+    @property
+    def reader(self):
+        return self.path.get("reader", {})
+
+    @property
+    def sample(self):
+        return self.path.get("sample")
+
+    @property
+    def output(self):
+        return self.path.get("output")
+
+    @property
+    def profile(self):
+        return self.path.get("profile", False)
+
+    @property
+    def quarantine(self):
+        return self.path.get("quarantine", False)
+
+    @property
+    def schema(self):
+        if self._schema is None:
+            fields = []
+            for field in self.path["fields"]:
+                fields.append(
+                    pyarrow.field(
+                        field["name"],
+                        field["type"],
+                        field["nullable"]
+                    )
+                )
+            self._schema = pyarrow.schema(fields)
+        return self._schema
+
+    @property
+    def fingerprint(self):
+        """
+        Hash of the path's config, which changes whenever anything about
+        how its files are checked does.
+        """
+        if self._fingerprint is None:
+            raw = json.dumps(self.path, sort_keys=True, default=str)
+            self._fingerprint = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+        return self._fingerprint
+
+    @property
+    def constraints(self):
+        """
+        The path's value level constraints, compiled, or None if it has
+        none.
+        """
+        if self._constraints is None:
+            constraints = ConstraintSet(self.path, self.schema)
+            self._constraints = constraints if len(constraints) else False
+        return self._constraints or None
+
+    @property
+    def projected(self):
+        """
+        Names of the columns that are converted and checked. Fields marked
+        "check": "presence" are only checked to be in the header, unless
+        they are part of the primary key or a constraint, or the path
+        writes an output, which holds every column.
+        """
+        if self._projected is None:
+            keys = set(primary_key_columns(self.primary_key))
+            if self.constraints is not None:
+                keys |= self.constraints.columns
+            self._projected = [
+                field["name"] for field in self.path["fields"]
+                if field.get("check") != PRESENCE_ONLY or field["name"] in keys
+                or self.output
+            ]
+        return self._projected
+
+    @property
+    def parse_options(self):
+        if self._parse_options is None:
+            self._parse_options = csv.ParseOptions(
+                delimiter=self.delimiter,
+                newlines_in_values=self.path.get("newlines_in_values", False)
+            )
+        return self._parse_options
+
+    @property
+    def convert_options(self):
+        if self._convert_options is None:
+            if len(self.projected) == len(self.schema):
+                self._convert_options = csv.ConvertOptions(
+                    column_types=self.schema)
+            else:
+                # Skip converting (and materializing) presence only columns.
+                types = {name: self.schema.field(name).type
+                         for name in self.projected}
+                self._convert_options = csv.ConvertOptions(
+                    column_types=types,
+                    include_columns=self.projected
+                )
+        return self._convert_options
+
+    @property
+    def string_convert_options(self):
+        """
+        Convert options that read every projected column as strings, for
+        converting to the schema's types after the fact.
+        """
+        if self._string_convert_options is None:
+            types = {name: pyarrow.string() for name in self.projected}
+            include = []
+            if len(self.projected) != len(self.schema):
+                include = self.projected
+            self._string_convert_options = csv.ConvertOptions(
+                column_types=types,
+                include_columns=include
+            )
+        return self._string_convert_options
+
+
+class PathIndex:
+    """
+    Finds the first path in config order whose pattern matches a key.
+    Patterns that start with literal text are filed in a trie by that
+    prefix, so only the few whose prefix the key starts with are tried.
+    The rest are combined into one regex, which tries them in order in a
+    single call.
+    """
+    def __init__(self, paths, entries=None):
+        """
+        Constructor.
+
+        :param paths: The "paths" list from the schema config.
+        :type  paths: list of dicts
+
+        :param entries: The entries of the paths, if already built (e.g.
+                        loaded from a compiled config).
+        :type  entries: list of PathEntry
+        """
+        self.paths = paths
+        if entries is None:
+            entries = [PathEntry(index, path) for index, path in enumerate(paths)]
+        self.entries = entries
+        self.trie = {}
+        self.unprefixed = []
+        for entry in self.entries:
+            if entry.prefix:
+                node = self.trie
+                for char in entry.prefix:
+                    node = node.setdefault(char, {})
+                node.setdefault(None, []).append(entry)
+            else:
+                self.unprefixed.append(entry)
+        self.combined = None
+        self.loose = self.unprefixed
+        combinable = not any(BACKREFERENCE.search(entry.pattern)
+                             for entry in self.unprefixed)
+        if self.unprefixed and combinable:
+            parts = [f"(?P<p{entry.index}>{entry.pattern})"
+                     for entry in self.unprefixed]
+            try:
+                self.combined = re.compile("|".join(parts))
+                self.loose = []
+            except re.error:
+                # Patterns with their own flags, group names or
+                # backreferences can't be combined, fall back to trying
+                # them one at a time.
+                self.combined = None
+
+    def _candidates(self, key):
+        candidates = list(self.loose)
+        node = self.trie
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                break
+            candidates += node.get(None, [])
+        return sorted(candidates, key=lambda entry: entry.index)
+
+    def match(self, key):
+        """
+        Find the first entry, in config order, matching the key.
+
+        :param key: The s3 key of the file.
+        :type  key: string
+
+        :returns: PathEntry or None
+        """
+        combined_entry = None
+        if self.combined is not None:
+            found = self.combined.match(key)
+            if found is not None:
+                combined_entry = self.entries[int(found.lastgroup[1:])]
+        for entry in self._candidates(key):
+            if combined_entry is not None and entry.index > combined_entry.index:
+                break
+            if entry.regex.match(key):
+                return entry
+        return combined_entry
+
+
+def compile_paths(paths):
+    """
+    Get the compiled index for a config's paths, reusing the one built for
+    the same paths object earlier in this container.
+
+    :param paths: The "paths" list from the schema config.
+    :type  paths: list of dicts
+
+    :returns: PathIndex
+    """
+    if isinstance(getattr(paths, "index", None), PathIndex):
+        # Compiled ahead of time, see compiled.CompiledPaths.
+        return paths.index
+    with _INDEX_LOCK:
+        for index in _INDEX_CACHE:
+            if index.paths is paths:
+                return index
+        index = PathIndex(paths)
+        _INDEX_CACHE.insert(0, index)
+        del _INDEX_CACHE[MAX_COMPILED_CONFIGS:]
+        return index
@@ -0,0 +1,419 @@
+import bisect
+import math
+import threading
+
+import pyarrow
+import pyarrow.compute as pc
+
+
+# 2^12 registers give distinct estimates within about 1.6%.
+HLL_PRECISION = 12
+HLL_REGISTERS = 1 << HLL_PRECISION
+# Quantiles kept from each batch's t-digest to merge across batches.
+SKETCH_POINTS = 101
+# Bigger batches are sampled down to this many values for the t-digest.
+SKETCH_SAMPLE = 4096
+# Digests kept before they are merged into one.
+MAX_SKETCH_DIGESTS = 10
+QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+# String lengths are counted in power of two buckets, up to LENGTH_BUCKETS.
+LENGTH_BUCKETS = 16
+
+_GRID = [i / (SKETCH_POINTS - 1) for i in range(SKETCH_POINTS)]
+_SAMPLE_INDICES = {}
+_UINT64 = pyarrow.uint64()
+_MIX_1 = pyarrow.scalar(0xbf58476d1ce4e5b9, _UINT64)
+_MIX_2 = pyarrow.scalar(0x94d049bb133111eb, _UINT64)
+_LOW_BITS = pyarrow.scalar((1 << (64 - HLL_PRECISION)) - 1, _UINT64)
+# Odd base for the polynomial string hash, and its inverse mod 2^64.
+_BASE = 0x100000001b3
+_BASE_INVERSE = pow(_BASE, -1, 1 << 64)
+# Strings are hashed in chunks of the values starting in half this many
+# bytes, so the tables of powers stay this long (2 MB each) however big
+# the batches get.
+HASH_CHUNK_BYTES = 256 * 1024
+_POWERS = None
+_POWERS_LOCK = threading.Lock()
+
+
+def _shift(bits):
+    return pyarrow.scalar(bits, _UINT64)
+
+
+def _sample_indices(length):
+    # Evenly spread indices, cached since batches tend to be the same
+    # length. The stride is odd so it doesn't line up with even patterns.
+    indices = _SAMPLE_INDICES.get(length)
+    if indices is None:
+        stride = (length // SKETCH_SAMPLE) | 1
+        indices = pyarrow.array(range(stride // 2, length, stride), pyarrow.int64())
+        if len(_SAMPLE_INDICES) > 64:
+            _SAMPLE_INDICES.clear()
+        _SAMPLE_INDICES[length] = indices
+    return indices
+
+
+def _power_table(base, length):
+    factors = pyarrow.concat_arrays([pyarrow.array([1], _UINT64),
+                                     pyarrow.repeat(pyarrow.scalar(base, _UINT64), length - 1)])
+    return pc.cumulative_prod(factors)
+
+
+def _powers(length):
+    # Powers of the base and its inverse, HASH_CHUNK_BYTES + 1 long, or
+    # built for the one chunk that needs more (it ends with a value longer
+    # than half that).
+    global _POWERS
+    if length > HASH_CHUNK_BYTES + 1:
+        return _power_table(_BASE, length), _power_table(_BASE_INVERSE, length)
+    with _POWERS_LOCK:
+        if _POWERS is None:
+            _POWERS = (_power_table(_BASE, HASH_CHUNK_BYTES + 1),
+                       _power_table(_BASE_INVERSE, HASH_CHUNK_BYTES + 1))
+        return _POWERS
+
+
+def _bit_length(values):
+    # Bits needed for each value. Values below 2^53 are exact as doubles,
+    # so it is the double's exponent (0 for zero, 1023 for one).
+    exponents = pc.shift_right(pc.cast(values, pyarrow.float64()).view(pyarrow.int64()), 52)
+    return pc.max_element_wise(pc.subtract(exponents, 1022), 0)
+
+
+def string_hashes(values):
+    """
+    Hash each value of a string (or binary) array with vectorized kernels.
+    The bytes are read in place, weighted by powers of an odd base and
+    summed cumulatively, so a value's hash is the difference of the sums
+    at its ends scaled back to its start. That makes it independent of
+    where the value is, so the array is hashed in chunks of about
+    HASH_CHUNK_BYTES / 2.
+
+    :param values: Values without nulls.
+    :type  values: pyarrow.StringArray or pyarrow.BinaryArray
+
+    :returns: pyarrow.UInt64Array
+    """
+    if values.nbytes <= HASH_CHUNK_BYTES or len(values) < 2:
+        return _chunk_hashes(values)
+    offsets = pyarrow.Array.from_buffers(pyarrow.int32(), len(values) + 1,
+                                         [None, values.buffers()[1]], offset=values.offset)
+    # Chunks start at the first value starting in each stretch of bytes.
+    windows = pc.divide(pc.subtract(offsets.slice(0, len(values)), offsets[0]),
+                        pyarrow.scalar(HASH_CHUNK_BYTES // 2, pyarrow.int32()))
+    starts = pc.indices_nonzero(pc.not_equal(windows.slice(1), windows.slice(0, len(values) - 1)))
+    bounds = [0] + [start + 1 for start in starts.to_pylist()] + [len(values)]
+    return pyarrow.concat_arrays([_chunk_hashes(values.slice(start, end - start))
+                                  for start, end in zip(bounds, bounds[1:])])
+
+
+def _chunk_hashes(values):
+    buffers = values.buffers()
+    offsets = pyarrow.Array.from_buffers(pyarrow.int32(), len(values) + 1,
+                                         [None, buffers[1]], offset=values.offset)
+    start = offsets[0].as_py()
+    size = offsets[len(values)].as_py() - start
+    powers, inverses = _powers(size + 1)
+    data = pyarrow.Array.from_buffers(pyarrow.uint8(), start + size,
+                                      [None, buffers[2]]).slice(start, size)
+    # Led by a zero byte, so the sum before the first value is there to
+    # take. Prepended to the bytes, it is an eighth of the copy.
+    data = pyarrow.concat_arrays([pyarrow.array([0], pyarrow.uint8()), data])
+    sums = pc.cumulative_sum(pc.multiply(pc.cast(data, _UINT64),
+                                         powers.slice(0, size + 1)))
+    ends = pc.subtract(offsets, pyarrow.scalar(start, pyarrow.int32()))
+    starts, ends = ends.slice(0, len(values)), ends.slice(1)
+    hashes = pc.multiply(pc.subtract(pc.take(sums, ends), pc.take(sums, starts)),
+                         pc.take(inverses, starts))
+    # Mix in the length, or trailing zero bytes wouldn't change the hash.
+    return pc.bit_wise_xor(hashes, pc.cast(pc.subtract(ends, starts), _UINT64))
+
+
+def hash_values(values):
+    """
+    Hash the non-null values of an array to 64 bits, finished with a
+    multiply-xorshift mixer. Fixed width values and strings are hashed with
+    vectorized kernels; anything else one distinct value at a time.
+
+    :param values: Values without nulls.
+    :type  values: pyarrow.Array
+
+    :returns: pyarrow.UInt64Array
+    """
+    kind = values.type
+    if pyarrow.types.is_floating(kind):
+        values = pc.cast(values, pyarrow.float64()).view(pyarrow.int64())
+    elif pyarrow.types.is_boolean(kind) or pyarrow.types.is_integer(kind):
+        values = pc.cast(values, pyarrow.int64())
+    elif pyarrow.types.is_temporal(kind) and kind.bit_width == 64:
+        values = values.view(pyarrow.int64())
+    elif pyarrow.types.is_temporal(kind):
+        values = pc.cast(values.view(pyarrow.int32()), pyarrow.int64())
+    elif pyarrow.types.is_string(kind) or pyarrow.types.is_binary(kind):
+        values = string_hashes(values)
+    else:
+        # No vectorized hash for variable width values, so hash each
+        # distinct one (within a process, which is all the sketch needs).
+        distinct = pc.unique(values)
+        values = pyarrow.array([hash(value) for value in distinct.to_pylist()],
+                               pyarrow.int64())
+    mixed = pc.multiply(pc.cast(values, _UINT64, safe=False), _MIX_1)
+    mixed = pc.bit_wise_xor(mixed, pc.shift_right(mixed, _shift(32)))
+    return pc.multiply(mixed, _MIX_2)
+
+
+class HyperLogLog:
+    """
+    Estimates the number of distinct values in a column. Registers are
+    kept in an array and updated a batch at a time with vectorized
+    kernels.
+    """
+    def __init__(self):
+        self.registers = pyarrow.array([0] * HLL_REGISTERS, pyarrow.int64())
+        self._thresholds = None
+        self._highest = None
+
+    def add(self, values):
+        """
+        :param values: Values without nulls.
+        :type  values: pyarrow.Array
+        """
+        if len(values) == 0:
+            return
+        hashes = hash_values(values)
+        index = pc.shift_right(hashes, _shift(64 - HLL_PRECISION))
+        rest = pc.bit_wise_and(hashes, _LOW_BITS)
+        # A hash only raises its register if its remaining bits are below
+        # the register's threshold, 2^(bits - register). Once the
+        # registers warm up that rules out all but a handful of values.
+        bits = 64 - HLL_PRECISION
+        if self._thresholds is None:
+            self._thresholds = pc.if_else(
+                pc.less_equal(self.registers, bits),
+                pc.shift_left(pyarrow.scalar(1, _UINT64),
+                              pc.cast(pc.subtract(bits, self.registers), _UINT64,
+                                      safe=False)),
+                pyarrow.scalar(0, _UINT64))
+            self._highest = pc.max(self._thresholds).as_py()
+        if self._highest < 1 << bits:
+            # No register is still empty, most values go on one compare.
+            keep = pc.less(rest, pyarrow.scalar(self._highest, _UINT64))
+            index, rest = index.filter(keep), rest.filter(keep)
+        keep = pc.less(rest, pc.take(self._thresholds, index, boundscheck=False))
+        index, rest = index.filter(keep), rest.filter(keep)
+        if len(index) == 0:
+            return
+        # Leading zeros of the remaining bits, plus one.
+        ranks = pc.subtract(bits + 1, _bit_length(rest))
+        ranks = pyarrow.table({"index": pc.cast(index, pyarrow.int64()), "rank": ranks})
+        maxima = ranks.group_by("index", use_threads=False).aggregate([("rank", "max")])
+        raised = pc.scatter(maxima.column("rank_max").combine_chunks(),
+                            maxima.column("index").combine_chunks(),
+                            max_index=HLL_REGISTERS - 1)
+        self.registers = pc.max_element_wise(self.registers, raised)
+        self._thresholds = None
+
+    def estimate(self):
+        alpha = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+        registers = pc.cast(self.registers, pyarrow.float64())
+        total = pc.sum(pc.power(2.0, pc.negate(registers))).as_py()
+        estimate = alpha * HLL_REGISTERS * HLL_REGISTERS / total
+        zeros = pc.sum(pc.equal(self.registers, 0)).as_py()
+        if estimate <= 2.5 * HLL_REGISTERS and zeros:
+            # Linear counting is more accurate for small cardinalities.
+            estimate = HLL_REGISTERS * math.log(HLL_REGISTERS / zeros)
+        return int(round(estimate))
+
+
+def _fraction_below(points, value):
+    # Fraction of a digest's values at or below a value, interpolating
+    # between the quantiles of the grid either side of it.
+    if value < points[0]:
+        return 0.0
+    i = bisect.bisect_right(points, value)
+    if i == len(points):
+        return 1.0
+    low, high = points[i - 1], points[i]
+    return _GRID[i - 1] + (_GRID[i] - _GRID[i - 1]) * (value - low) / (high - low)
+
+
+class QuantileSketch:
+    """
+    Approximates the quantiles of a numeric column by merging the
+    t-digest of each batch, kept as its quantiles on a grid of
+    SKETCH_POINTS. A quantile of the whole column is where the digests'
+    interpolated ranks add up to it.
+    """
+    def __init__(self):
+        self.digests = []
+        self.count = 0
+
+    def add(self, values):
+        """
+        :param values: Values without nulls.
+        :type  values: pyarrow.Array
+        """
+        if len(values) == 0:
+            return
+        sample = values
+        if len(values) > 2 * SKETCH_SAMPLE:
+            sample = values.take(_sample_indices(len(values)))
+        self.digests.append((pc.tdigest(sample, q=_GRID).to_pylist(), len(values)))
+        self.count += len(values)
+        if len(self.digests) > MAX_SKETCH_DIGESTS:
+            self.digests = [(self.quantiles(_GRID), self.count)]
+
+    def _rank(self, value):
+        return sum(count * _fraction_below(points, value)
+                   for points, count in self.digests)
+
+    def quantiles(self, qs):
+        """
+        :param qs: Quantiles to get, between 0 and 1.
+        :type  qs: list of floats
+
+        :returns: list of floats, empty if no values were seen.
+        """
+        if not self.digests:
+            return []
+        # The merged rank is linear between the digests' points, so find
+        # the two either side of each quantile and interpolate.
+        points = sorted({point for digest, _ in self.digests for point in digest})
+        ranks = {}
+        results = []
+        for q in qs:
+            target = q * self.count
+            low, high = 0, len(points) - 1
+            while low < high:
+                middle = (low + high) // 2
+                if middle not in ranks:
+                    ranks[middle] = self._rank(points[middle])
+                if ranks[middle] < target:
+                    low = middle + 1
+                else:
+                    high = middle
+            if low == 0:
+                results.append(points[0])
+                continue
+            for index in (low - 1, low):
+                if index not in ranks:
+                    ranks[index] = self._rank(points[index])
+            below, above = ranks[low - 1], ranks[low]
+            share = (target - below) / (above - below) if above > below else 1.0
+            results.append(points[low - 1] + share * (points[low] - points[low - 1]))
+        return results
+
+
+class ColumnProfile:
+    """
+    Profile of one column, merged across batches: nulls, min/max,
+    distinct estimate and, by type, quantiles or a histogram of string
+    lengths.
+    """
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+        self.count = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.distinct = HyperLogLog()
+        self.quantiles = None
+        self.lengths = None
+        if pyarrow.types.is_integer(kind) or pyarrow.types.is_floating(kind):
+            self.quantiles = QuantileSketch()
+        elif pyarrow.types.is_string(kind) or pyarrow.types.is_large_string(kind):
+            self.lengths = [0] * LENGTH_BUCKETS
+
+    def add(self, column):
+        self.count += len(column)
+        self.nulls += column.null_count
+        values = column.drop_null() if column.null_count else column
+        if len(values) == 0:
+            return
+        bounds = pc.min_max(values)
+        low, high = bounds["min"].as_py(), bounds["max"].as_py()
+        if self.min is None or low < self.min:
+            self.min = low
+        if self.max is None or high > self.max:
+            self.max = high
+        self.distinct.add(values)
+        if self.quantiles is not None:
+            self.quantiles.add(values)
+        if self.lengths is not None:
+            # Bucket i holds lengths in [2^i - 1, 2^(i+1) - 1). A column
+            # has few distinct lengths, so they are bucketed once counted.
+            counts = pc.value_counts(pc.utf8_length(values))
+            for length, count in zip(counts.field("values").to_pylist(),
+                                     counts.field("counts").to_pylist()):
+                bucket = min((length + 1).bit_length() - 1, LENGTH_BUCKETS - 1)
+                self.lengths[bucket] += count
+
+    def as_dict(self):
+        profile = {
+            "type": str(self.kind),
+            "count": self.count,
+            "nulls": self.nulls,
+            "min": _jsonable(self.min),
+            "max": _jsonable(self.max),
+            "distinct": self.distinct.estimate()
+        }
+        if self.quantiles is not None:
+            profile["quantiles"] = dict(
+                zip((str(q) for q in QUANTILES),
+                    self.quantiles.quantiles(QUANTILES)))
+        if self.lengths is not None:
+            last = max((i for i, count in enumerate(self.lengths) if count),
+                       default=-1)
+            profile["length_histogram"] = {
+                f"{(1 << i) - 1}": count
+                for i, count in enumerate(self.lengths[:last + 1])
+            }
+        return profile
+
+
+def _jsonable(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+class Profiler:
+    """
+    Profiles the columns of a file as its batches stream past.
+    """
+    def __init__(self, columns=None):
+        """
+        Constructor.
+
+        :param columns: Names of the columns to profile, None for all.
+        :type  columns: list of strings
+        """
+        self.columns = columns
+        self.profiles = None
+        self.rows = 0
+
+    def add(self, batch):
+        """
+        Profile the next batch.
+
+        :param batch: The converted batch.
+        :type  batch: pyarrow.RecordBatch
+        """
+        if self.profiles is None:
+            names = self.columns or batch.schema.names
+            self.profiles = [ColumnProfile(name, batch.schema.field(name).type)
+                             for name in names if name in batch.schema.names]
+        for profile in self.profiles:
+            profile.add(batch.column(profile.name))
+        self.rows += batch.num_rows
+
+    def as_dict(self):
+        """
+        :returns: dict of rows and a profile per column, ready for json.
+        """
+        return {
+            "rows": self.rows,
+            "columns": {profile.name: profile.as_dict()
+                        for profile in self.profiles or []}
+        }
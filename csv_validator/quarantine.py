@@ -0,0 +1,325 @@
+import logging
+import posixpath
+import re
+import threading
+
+import pyarrow
+import pyarrow.compute as pc
+import pyarrow.csv as csv
+
+
+QUARANTINE_SCHEMA = pyarrow.schema([
+    ("row", pyarrow.int64()),
+    ("column", pyarrow.string()),
+    ("error", pyarrow.string()),
+    ("value", pyarrow.string())
+])
+# Types pc.cast parses exactly like the csv reader, except that the reader
+# also trims whitespace around numbers and reads its null values as null,
+# which the cast refuses. Anything the cast accepts the reader does too.
+CASTS_LIKE_READER = (pyarrow.types.is_integer, pyarrow.types.is_decimal,
+                     pyarrow.types.is_temporal)
+READER_ERRORS = (pyarrow.lib.ArrowInvalid, pyarrow.lib.ArrowNotImplementedError)
+# Where read_column()'s errors say they happened, in its one column csv.
+SCRATCH_LOCATION = re.compile(r"^In CSV column #\d+: Row #\d+: ")
+# What a value the reader converts could look like, per type, once trimmed.
+# Looser than the reader (e.g. "+1" for an int, or out of range values), so
+# no value the reader takes is rejected; what they let through is converted
+# for real before it is trusted.
+CANDIDATE_PATTERNS = (
+    (pyarrow.types.is_integer, r"^[+-]?(0x)?[0-9a-f]+$"),
+    (pyarrow.types.is_floating, r"^[+-]?([0-9.]+(e[+-]?[0-9]+)?|inf(inity)?|nan)$"),
+    (pyarrow.types.is_decimal, r"^[+-]?[0-9.]+(e[+-]?[0-9]+)?$"),
+    (pyarrow.types.is_temporal, r"^[0-9][0-9t:.+z -]*$"),
+)
+_READER_DEFAULTS = csv.ConvertOptions()
+
+
+def read_column(column, target_type):
+    """
+    Convert a string column with the csv reader's own converter, by
+    writing it back out as a one column csv and reading that with the
+    column's type. Slower than a cast, but what the reader makes of a
+    value (nulls, whitespace, true/false spellings) is exactly what it
+    would have made of it reading the file typed.
+
+    :param column: The column, as read from the csv.
+    :type  column: pyarrow.StringArray
+
+    :param target_type: The type it should have.
+    :type  target_type: pyarrow.DataType
+
+    :returns: pyarrow.Array
+    :raises: pyarrow.lib.ArrowInvalid if any value doesn't convert.
+    """
+    if len(column) == 0:
+        return pyarrow.array([], target_type)
+    sink = pyarrow.BufferOutputStream()
+    csv.write_csv(pyarrow.table({"value": column}), sink,
+                  csv.WriteOptions(include_header=False))
+    table = csv.read_csv(
+        pyarrow.BufferReader(sink.getvalue()),
+        read_options=csv.ReadOptions(column_names=["value"], use_threads=False),
+        # Nulls are written as empty lines, which mustn't be skipped.
+        parse_options=csv.ParseOptions(newlines_in_values=True,
+                                       ignore_empty_lines=False),
+        convert_options=csv.ConvertOptions(column_types={"value": target_type}))
+    return table.column(0).combine_chunks()
+
+
+def convert_column(column, target_type):
+    """
+    Convert a string column the way the csv reader would have, with a
+    single cast where that is known to agree with the reader and the
+    reader's converter otherwise.
+
+    :returns: pyarrow.Array
+    :raises: pyarrow.lib.ArrowInvalid if any value doesn't convert.
+    """
+    if pyarrow.types.is_string(target_type):
+        return column
+    if any(check(target_type) for check in CASTS_LIKE_READER):
+        try:
+            return pc.cast(column, target_type)
+        except READER_ERRORS:
+            pass
+    return read_column(column, target_type)
+
+
+def candidates(column, target_type):
+    """
+    Mark the values of a string column that could convert to a type, in
+    one vectorized pass: the reader's null values, its true/false values
+    for bools, and values shaped like the type (see CANDIDATE_PATTERNS)
+    otherwise. Unmarked values certainly don't convert.
+
+    :returns: pyarrow.BooleanArray
+    """
+    nulls = pc.is_in(column, value_set=pyarrow.array(_READER_DEFAULTS.null_values))
+    if pyarrow.types.is_boolean(target_type):
+        values = _READER_DEFAULTS.true_values + _READER_DEFAULTS.false_values
+        return pc.or_(nulls, pc.is_in(column, value_set=pyarrow.array(values)))
+    for check, pattern in CANDIDATE_PATTERNS:
+        if check(target_type):
+            shaped = pc.match_substring_regex(pc.utf8_trim_whitespace(column),
+                                              pattern, ignore_case=True)
+            return pc.or_(nulls, shaped)
+    return pyarrow.repeat(True, len(column))
+
+
+def bisect_rows(column, target_type):
+    """
+    Find the values of a string column that the csv reader can't convert
+    by converting halves of it, for values that look right but aren't
+    (e.g. out of range). Costs a few conversions per bad value.
+
+    :returns: list of (index, error message)
+    """
+    try:
+        convert_column(column, target_type)
+        return []
+    except READER_ERRORS as e:
+        if len(column) == 1:
+            return [(0, SCRATCH_LOCATION.sub("", str(e)))]
+    middle = len(column) // 2
+    right = bisect_rows(column.slice(middle), target_type)
+    return bisect_rows(column.slice(0, middle), target_type) + \
+        [(middle + index, error) for index, error in right]
+
+
+def invalid_rows(column, target_type):
+    """
+    Find the values of a string column that the csv reader can't convert
+    to a type. Values that can't be the type are found in one vectorized
+    pass (see candidates()) and the rest are converted in one go, only
+    bisected if some of them still don't convert, so the cost hardly
+    grows with the number of bad values.
+
+    :param column: The column, as read from the csv.
+    :type  column: pyarrow.StringArray
+
+    :param target_type: The type it should have.
+    :type  target_type: pyarrow.DataType
+
+    :returns: list of (index, error message), by index
+    """
+    mask = pc.fill_null(candidates(column, target_type), True)
+    rejected = pc.indices_nonzero(pc.invert(mask))
+    found = [(index, f"CSV conversion error to {target_type}: invalid value '{value}'")
+             for index, value in zip(rejected.to_pylist(),
+                                     column.take(rejected).to_pylist())]
+    kept = pc.indices_nonzero(mask)
+    if len(kept) == len(column):
+        return bisect_rows(column, target_type)
+    positions = kept.to_pylist()
+    found += [(positions[index], error)
+              for index, error in bisect_rows(column.take(kept), target_type)]
+    return sorted(found)
+
+
+class Quarantine:
+    """
+    Converts batches read as strings to their schema types, setting aside
+    rows that don't convert (or don't parse) instead of failing the file.
+    Bad values are streamed to a quarantine csv as they are found, with
+    the row offset, column, error and value, so memory stays bounded by
+    the batch size. Row offsets count the rows that parsed: rows with the
+    wrong number of columns are dropped by the reader, before they have an
+    offset, and are written with their line number where it is known.
+    """
+    def __init__(self, schema, filesystem, path, max_rows=0):
+        """
+        Constructor.
+
+        :param schema: The types the batches should be converted to.
+        :type  schema: pyarrow.Schema
+
+        :param filesystem: Filesystem to write the quarantine csv to.
+        :type  filesystem: pyarrow.fs.FileSystem
+
+        :param path: Path of the quarantine csv.
+        :type  path: string
+
+        :param max_rows: Rows that can be quarantined before the file
+                         fails.
+        :type  max_rows: int
+        """
+        self.schema = schema
+        self.filesystem = filesystem
+        self.path = path
+        self.max_rows = max_rows
+        self.rows = 0
+        self.column_errors = {}
+        self._unparsed = []
+        self._lock = threading.Lock()
+        self._stream = None
+        self._writer = None
+
+    def handle_invalid_row(self, row):
+        """
+        Handler for rows with the wrong number of columns, for the csv
+        parse options' invalid_row_handler. May be called from the
+        reader's threads.
+        """
+        error = f"Expected {row.expected_columns} columns, got {row.actual_columns}"
+        if row.number is not None:
+            error += f" (line {row.number})"
+        with self._lock:
+            self._unparsed.append((error, row.text))
+        return "skip"
+
+    def _write(self, rows, columns, errors, values):
+        if self._writer is None:
+            if self.filesystem.type_name != "s3":
+                self.filesystem.create_dir(posixpath.dirname(self.path))
+            self._stream = self.filesystem.open_output_stream(self.path)
+            self._writer = csv.CSVWriter(self._stream, QUARANTINE_SCHEMA)
+        self._writer.write_batch(pyarrow.record_batch(
+            [pyarrow.array(rows, pyarrow.int64()), pyarrow.array(columns),
+             pyarrow.array(errors), pyarrow.array(values)],
+            schema=QUARANTINE_SCHEMA))
+
+    def _flush_unparsed(self):
+        with self._lock:
+            unparsed = self._unparsed
+            self._unparsed = []
+        if not unparsed:
+            return
+        errors, texts = zip(*unparsed)
+        self._write([None] * len(unparsed), [""] * len(unparsed), errors, texts)
+        self.rows += len(unparsed)
+        self.column_errors[""] = self.column_errors.get("", 0) + len(unparsed)
+
+    def convert(self, batch, offset):
+        """
+        Convert the next batch, dropping any rows that don't convert.
+
+        :param batch: The batch with every column read as strings.
+        :type  batch: pyarrow.RecordBatch
+
+        :param offset: Row offset of the first row of the batch.
+        :type  offset: int
+
+        :returns: tuple of (pyarrow.RecordBatch with the schema's types, the
+                  offset, or a pyarrow.Int64Array of the row offset of each
+                  row if any were dropped)
+        """
+        self._flush_unparsed()
+        columns = []
+        failed = set()
+        bad = set()
+        found = ([], [], [], [])
+        for name in batch.schema.names:
+            column, errors = self._cast(batch.column(name),
+                                        self.schema.field(name).type)
+            columns.append(column)
+            if not errors:
+                continue
+            failed.add(name)
+            indices = [index for index, _ in errors]
+            bad.update(indices)
+            found[0].extend(offset + index for index in indices)
+            found[1].extend([name] * len(errors))
+            found[2].extend(error for _, error in errors)
+            found[3].extend(column.take(indices).to_pylist())
+            self.column_errors[name] = self.column_errors.get(name, 0) + len(errors)
+        if bad:
+            self._write(*found)
+            self.rows += len(bad)
+            rows = pc.add(pc.cast(pc.indices_nonzero(pyarrow.repeat(True, batch.num_rows)),
+                                  pyarrow.int64()), offset)
+            keep = pc.invert(pc.is_in(rows, value_set=pyarrow.array(found[0], pyarrow.int64())))
+            columns = [column.filter(keep) for column in columns]
+            # Only the columns that failed are still strings.
+            columns = [convert_column(column, self.schema.field(name).type)
+                       if name in failed else column
+                       for name, column in zip(batch.schema.names, columns)]
+            # Keep the offsets of the rows left, so checks report where
+            # they are in the file rather than in what's left of it.
+            offset = rows.filter(keep)
+        return pyarrow.record_batch(columns, names=batch.schema.names), offset
+
+    @staticmethod
+    def _cast(column, target_type):
+        # Returns the converted column, or the column as it is and the bad
+        # values if it doesn't convert.
+        try:
+            return convert_column(column, target_type), []
+        except READER_ERRORS:
+            return column, invalid_rows(column, target_type)
+
+    def over_limit(self):
+        """
+        Whether more rows were quarantined than allowed, after which the
+        file fails whatever the rest of it holds.
+        """
+        return self.rows > self.max_rows
+
+    def finish(self):
+        """
+        Write any rows left that didn't parse and close the quarantine csv.
+
+        :returns: number of rows quarantined
+        """
+        self._flush_unparsed()
+        self.close()
+        if self.rows:
+            logging.info(f"Quarantined {self.rows} rows to {self.path}")
+        return self.rows
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def summary(self):
+        """
+        Describe the errors per column, e.g. "alpha: 2, id: 1". Rows that
+        didn't parse are counted as "unparsed".
+        """
+        counts = sorted((name or "unparsed", count)
+                        for name, count in self.column_errors.items())
+        return ", ".join(f"{name}: {count}" for name, count in counts)
@@ -0,0 +1,183 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import pyarrow
+import pyarrow.csv as csv
+
+
+DEFAULT_PART_SIZE = 32 * 1024 * 1024
+DEFAULT_RANGED_CONCURRENCY = 8
+HEADER_PEEK_SIZE = 64 * 1024
+
+
+def last_row_end(data, quoted, quote_char=b'"'):
+    """
+    Find where the last complete row in a part of the file ends.
+
+    :param data: The part of the file, starting at the start of a row.
+    :type  data: bytes
+
+    :param quoted: Whether quoted fields may contain newlines. When they
+                   can't, every newline ends a row.
+    :type  quoted: bool
+
+    :param quote_char: The quote character.
+    :type  quote_char: bytes
+
+    :returns: Offset just past the last row ending newline, or 0 if the
+              part doesn't end a row.
+    """
+    if not quoted:
+        return data.rfind(b"\n") + 1
+    # Quotes (including escaped "" pairs) toggle the state, so the state at
+    # the end of the part follows from the parity of the quote count.
+    inside = data.count(quote_char) % 2 == 1
+    position = len(data)
+    while True:
+        newline = data.rfind(b"\n", 0, position)
+        if newline == -1:
+            return 0
+        # Walk back one newline at a time, flipping the state for every
+        # quote crossed, until a newline outside of quotes turns up.
+        inside ^= data.count(quote_char, newline, position) % 2 == 1
+        if not inside:
+            return newline + 1
+        position = newline
+
+
+class RangedReader:
+    """
+    Reads a csv object with concurrent ranged GETs. The object is split
+    into parts that are fetched in parallel, cut back to row boundaries
+    (taking quoted fields into account) and parsed in parallel. Tables are
+    yielded in file order so the results can be merged as if the file had
+    been read as one stream. At most `concurrency` parts are held at once.
+    """
+    def __init__(self, infile, size, part_size=DEFAULT_PART_SIZE,
+                 concurrency=DEFAULT_RANGED_CONCURRENCY):
+        """
+        Constructor.
+
+        :param infile: The object, opened for random access.
+        :type  infile: pyarrow.NativeFile
+
+        :param size: Size of the object in bytes.
+        :type  size: int
+
+        :param part_size: Bytes fetched per ranged GET.
+        :type  part_size: int
+
+        :param concurrency: Max parts fetched or parsed at once.
+        :type  concurrency: int
+        """
+        self.infile = infile
+        self.size = size
+        self.part_size = part_size
+        self.concurrency = concurrency
+        self.bytes_fetched = 0
+        self.parts = 0
+        self._lock = threading.Lock()
+
+    def _fetch(self, offset, length):
+        data = self.infile.read_at(length, offset)
+        with self._lock:
+            self.bytes_fetched += len(data)
+            self.parts += 1
+        return data
+
+    def peek_header(self):
+        """
+        Read the header line.
+
+        :returns: bytes of the header line, including the newline.
+        """
+        data = b""
+        while b"\n" not in data and len(data) < self.size:
+            data += self._fetch(len(data), HEADER_PEEK_SIZE)
+        end = data.find(b"\n")
+        if end == -1:
+            return data
+        return data[:end + 1]
+
+    def row_chunks(self, start, pool, quoted=False, quote_char='"'):
+        """
+        Fetch the object from an offset onward and yield it in chunks of
+        whole rows, in order.
+
+        :param start: Offset to start reading at (i.e. after the header).
+        :type  start: int
+
+        :param pool: Executor to fetch parts on.
+        :type  pool: concurrent.futures.Executor
+
+        :param quoted: Whether quoted fields may contain newlines.
+        :type  quoted: bool
+
+        :param quote_char: The quote character.
+        :type  quote_char: string
+
+        :returns: generator of bytes
+        """
+        quote = quote_char.encode("utf-8")
+        offsets = deque(range(start, self.size, self.part_size))
+        pending = deque()
+        leftover = b""
+        while offsets or pending:
+            while offsets and len(pending) < self.concurrency:
+                pending.append(pool.submit(self._fetch, offsets.popleft(),
+                                           self.part_size))
+            data = leftover + pending.popleft().result()
+            if not offsets and not pending:
+                if data:
+                    yield data
+                return
+            # Whatever is left over starts a row, so the next part picks up
+            # outside of any quotes.
+            end = last_row_end(data, quoted, quote)
+            if end:
+                yield data[:end]
+            leftover = data[end:]
+
+    def read(self, column_names, parse_options, convert_options, start):
+        """
+        Parse the object from an offset onward in parallel.
+
+        :param column_names: Column names, taken from the header.
+        :type  column_names: list of strings
+
+        :param parse_options: The csv parse options.
+        :type  parse_options: pyarrow.csv.ParseOptions
+
+        :param convert_options: The csv convert options.
+        :type  convert_options: pyarrow.csv.ConvertOptions
+
+        :param start: Offset of the first row after the header.
+        :type  start: int
+
+        :returns: generator of pyarrow.Table, in file order
+        """
+        read_options = csv.ReadOptions(column_names=column_names,
+                                       use_threads=False)
+
+        def parse(chunk):
+            return csv.read_csv(pyarrow.py_buffer(chunk),
+                                read_options=read_options,
+                                parse_options=parse_options,
+                                convert_options=convert_options)
+
+        # Fetches and parses each get their own workers so a parse can't
+        # starve the fetches that feed it.
+        with ThreadPoolExecutor(max_workers=self.concurrency) as fetchers, \
+                ThreadPoolExecutor(max_workers=self.concurrency) as parsers:
+            parsing = deque()
+            quoted = parse_options.newlines_in_values and \
+                bool(parse_options.quote_char)
+            chunks = self.row_chunks(start, fetchers, quoted,
+                                     parse_options.quote_char or '"')
+            for chunk in chunks:
+                parsing.append(parsers.submit(parse, chunk))
+                if len(parsing) >= self.concurrency:
+                    yield parsing.popleft().result()
+            while parsing:
+                yield parsing.popleft().result()
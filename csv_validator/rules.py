@@ -1,9 +1,27 @@
+from concurrent.futures import ThreadPoolExecutor
+import io
+import json
 import logging
-import re
+import time
 
 import pyarrow
+import pyarrow.compute as pc
 import pyarrow.csv as csv
-import pyarrow.fs as fs
+
+from .cache import result_key
+from .clients import pool
+from .compression import MAGIC_SIZE, codec_from_magic, decompressing_stream
+from .compression import detect_codec, split_extension
+from .memory import MemoryBudget, MemoryWatermark, default_budget
+from .metrics import with_throughput
+from .output import DEFAULT_OUTPUT_FORMAT, ValidatedOutput, output_key
+from .output import resolve_location, strip_extension
+from .patterns import compile_paths, primary_key_columns
+from .profile import Profiler
+from .quarantine import Quarantine
+from .ranged import DEFAULT_PART_SIZE, DEFAULT_RANGED_CONCURRENCY, HEADER_PEEK_SIZE
+from .ranged import RangedReader, last_row_end
+from .uniqueness import DEFAULT_MEMORY_BUDGET, UniqueKeyTracker, key_array
 
 
 NOT_RUN = "NOT_RUN"
@@ -11,6 +29,187 @@ STARTED = "STARTED"
 SUCCESS = "SUCCESS"
 FAILED = "FAILED"
 TABLE_NAME = "SCHEMA_TABLE_NAME"
+MAX_REPORTED_OFFENDERS = 10
+DEFAULT_CONCURRENCY = 4
+
+
+def missing_key_mask(batch, columns):
+    """
+    Build a boolean mask of rows where any of the key columns is null,
+    empty or whitespace only, using vectorized compute kernels.
+
+    :param batch: The batch to check.
+    :type  batch: pyarrow.RecordBatch
+
+    :param columns: Names of the primary key columns.
+    :type  columns: list of strings
+
+    :returns: pyarrow.BooleanArray
+    """
+    mask = None
+    for name in columns:
+        column = batch.column(name)
+        missing = pc.is_null(column)
+        if pyarrow.types.is_string(column.type) or \
+                pyarrow.types.is_large_string(column.type):
+            blank = pc.equal(pc.utf8_trim_whitespace(column), "")
+            missing = pc.or_kleene(missing, blank)
+        mask = missing if mask is None else pc.or_(mask, missing)
+    return mask
+
+
+class ScanStream(io.RawIOBase):
+    """
+    Wraps an input stream so the header can be peeked at and then
+    replayed to the csv reader, letting a file be scanned in a single
+    pass. Keeps count of the bytes fetched from the underlying stream.
+    """
+    def __init__(self, stream, max_lines=None, max_bytes=None):
+        """
+        Constructor.
+
+        :param stream: The stream to read from.
+        :type  stream: file-like object (e.g. pyarrow NativeFile)
+
+        :param max_lines: Stop reading after this many lines, None to read
+                          the whole stream.
+        :type  max_lines: int
+
+        :param max_bytes: Stop reading at the last whole line within this
+                          many bytes, None to read the whole stream.
+        :type  max_bytes: int
+        """
+        super().__init__()
+        self.stream = stream
+        self.bytes_fetched = 0
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.lines = 0
+        self.cut_short = False
+        self._buffer = b""
+        # Bytes of a line that isn't whole yet, held back under a byte
+        # budget in case the budget runs out before its newline.
+        self._partial = b""
+
+    def readable(self):
+        return True
+
+    def limit(self, max_lines=None, max_bytes=None):
+        """
+        Set the limits after peeking but before reading, counting the
+        bytes peeked already against them.
+
+        :param max_lines: Stop reading after this many lines, None to read
+                          the whole stream.
+        :type  max_lines: int
+
+        :param max_bytes: Stop reading at the last whole line within this
+                          many bytes, None to read the whole stream.
+        :type  max_bytes: int
+        """
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.lines = 0
+        if self._buffer:
+            buffer, self._buffer = self._buffer, b""
+            if max_bytes is not None:
+                buffer = self._whole_lines(buffer, False)
+            self._buffer = self._cut(buffer)
+
+    def _fetch(self, size):
+        while not self.cut_short:
+            data = self.stream.read(size)
+            self.bytes_fetched += len(data)
+            if self.max_bytes is None:
+                return self._cut(data)
+            eof = not data
+            data = self._whole_lines(data, eof)
+            if data or eof:
+                return self._cut(data)
+        return b""
+
+    def _whole_lines(self, data, eof):
+        # Only hand on whole lines under a byte budget, so a line that
+        # starts within the budget but ends past it is never returned in
+        # part.
+        data = self._partial + data
+        self._partial = b""
+        if self.bytes_fetched >= self.max_bytes:
+            # Cut the data just past the last line within the budget.
+            over = self.bytes_fetched - self.max_bytes
+            self.cut_short = True
+            return data[:data.rfind(b"\n", 0, len(data) - over) + 1]
+        if eof:
+            return data
+        end = data.rfind(b"\n") + 1
+        self._partial = data[end:]
+        return data[:end]
+
+    def _cut(self, data):
+        if self.max_lines is None:
+            return data
+        count = data.count(b"\n")
+        if self.lines + count < self.max_lines:
+            self.lines += count
+            return data
+        # Cut the data just past the last line we're allowed.
+        end = -1
+        for _ in range(self.max_lines - self.lines):
+            end = data.find(b"\n", end + 1)
+        self.lines = self.max_lines
+        self.cut_short = True
+        return data[:end + 1]
+
+    def peek(self, size):
+        """
+        Read up to `size` bytes from the start of the stream without
+        consuming them.
+
+        :returns: bytes
+        """
+        while len(self._buffer) < size:
+            data = self._fetch(size - len(self._buffer))
+            if not data:
+                break
+            self._buffer += data
+        return self._buffer[:size]
+
+    def peek_header(self):
+        """
+        Read up to and including the first line of the stream without
+        consuming it.
+
+        :returns: bytes of the header line.
+        """
+        while b"\n" not in self._buffer:
+            data = self._fetch(HEADER_PEEK_SIZE)
+            if not data:
+                break
+            self._buffer += data
+        end = self._buffer.find(b"\n")
+        if end == -1:
+            return self._buffer
+        return self._buffer[:end + 1]
+
+    def read(self, size=-1):
+        if self._buffer:
+            if size is None or size < 0:
+                data = self._buffer + self._fetch(-1)
+                self._buffer = b""
+                return data
+            data = self._buffer[:size]
+            self._buffer = self._buffer[size:]
+            return data
+        data = self._fetch(size)
+        if size is not None and 0 <= size < len(data):
+            # Held back bytes came with it.
+            data, self._buffer = data[:size], data[size:]
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
 
 
 class Rule:
@@ -18,7 +217,7 @@ class Rule:
     Base class representing a rule. Rules should implement
     the validate() method.
     """
-    def __init__(self, name, description):
+    def __init__(self, name, description, concurrency=DEFAULT_CONCURRENCY):
         """
         Constructor.
 
@@ -27,11 +226,17 @@ class Rule:
 
         :param description: Description of the rule
         :type  description: String
+
+        :param concurrency: Max number of records validated at once.
+        :type  concurrency: int
         """
         self.description = description
         self.results = []
         self.continue_on_fail = False
         self.name = name
+        self.concurrency = concurrency
+        self.stats = {}
+        self.timings = {}
 
     def fail(self, message, bucket, key):
         """
@@ -43,10 +248,134 @@ class Rule:
         row = (FAILED, self.name, self.description, message, bucket, key)
         self.results.append(row)
     
-    def success(self, bucket, key):
-        row = (SUCCESS, self.name, self.description, "", bucket, key)
+    def success(self, bucket, key, message=""):
+        """
+        Acknowledge that the rule passed.
+
+        :param message: Optional note about the result (e.g. that only a
+                        sample of the file was checked).
+        :type  message: String
+        """
+        row = (SUCCESS, self.name, self.description, message, bucket, key)
         self.results.append(row)
 
+    def record_stat(self, bucket, key, name, value):
+        """
+        Record a measurement about a file, kept in self.stats under
+        "bucket/key".
+        """
+        self.stats.setdefault(f"{bucket}/{key}", {})[name] = value
+
+    def _record_time(self, bucket, key, start):
+        elapsed = time.perf_counter() - start
+        self.record_stat(bucket, key, "seconds", elapsed)
+        logging.info(f"{self.name} took {elapsed:.3f}s for s3://{bucket}/{key}")
+
+    def _timed_check(self, check, bucket, key):
+        start = time.perf_counter()
+        try:
+            return check(bucket, key)
+        finally:
+            self._record_time(bucket, key, start)
+
+    @staticmethod
+    def records(event):
+        """
+        Get the (bucket, key) of every record in the event, in order.
+
+        :returns: list of tuples of (string, string)
+        """
+        return [(record["s3"]["bucket"]["name"], record["s3"]["object"]["key"])
+                for record in event["Records"]]
+
+    def _record_outcomes(self, records, outcomes):
+        for (bucket, key), (status, message) in zip(records, outcomes):
+            if status == SUCCESS:
+                self.success(bucket, key, message)
+            else:
+                self.fail(message, bucket, key)
+
+    def validate_records(self, event, check):
+        """
+        Run a check against every record in the event, up to
+        self.concurrency at a time, and record a result for each in the
+        order of the records.
+
+        :param event: Event passed to the lambda
+        :type  event: dict
+
+        :param check: Called with (bucket, key) for each record. Returns
+                      a tuple of (status, message), status being SUCCESS
+                      or FAILED.
+        :type  check: callable
+        """
+        records = self.records(event)
+        workers = min(self.concurrency, len(records))
+        if workers <= 1:
+            outcomes = [self._timed_check(check, bucket, key)
+                        for bucket, key in records]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(self._timed_check, check, bucket, key)
+                           for bucket, key in records]
+                outcomes = [future.result() for future in futures]
+        self._record_outcomes(records, outcomes)
+
+    async def validate_records_async(self, event, check):
+        """
+        Like validate_records, from an event loop.
+
+        :param check: Coroutine function called with (bucket, key) for
+                      each record, up to self.concurrency at a time.
+                      Returns a tuple of (status, message).
+        :type  check: coroutine function
+        """
+        # Only the ASYNC_IO path needs asyncio, keep it off the cold start.
+        import asyncio
+        records = self.records(event)
+        limit = asyncio.Semaphore(max(self.concurrency, 1))
+
+        async def timed_check(bucket, key):
+            async with limit:
+                start = time.perf_counter()
+                try:
+                    return await check(bucket, key)
+                finally:
+                    self._record_time(bucket, key, start)
+
+        outcomes = await asyncio.gather(*(timed_check(bucket, key)
+                                          for bucket, key in records))
+        self._record_outcomes(records, outcomes)
+
+    def prefetch(self, session, event):
+        """
+        Start any I/O validate_async() will need. The suite calls this for
+        every rule before the first one runs, from its event loop, so the
+        I/O overlaps the rules before it.
+
+        :param session: Boto3 session
+        :type  session: Boto3 session
+
+        :param event: Event passed to the lambda
+        :type  event: dict
+        """
+        pass
+
+    async def validate_async(self, session, event):
+        """
+        Run the rule from an event loop. By default validate() runs in a
+        thread.
+        """
+        import asyncio
+        await asyncio.to_thread(self.validate, session, event)
+
+    async def release(self):
+        """
+        Release anything prefetch() started that validate_async() didn't
+        use, e.g. when an earlier rule failed.
+        """
+        pass
+
     def validate(self, session, event):
         """
         Run the business logic of the rule.
@@ -65,7 +394,7 @@ class ValidationSuite:
     This class contains the base logic to run all of the rules
     and deliver the validation result.
     """
-    def __init__(self, rules, notifier):
+    def __init__(self, rules, notifier, metrics=None):
         """
         Constructor.
 
@@ -75,9 +404,16 @@ class ValidationSuite:
         :param notifier: The notifier that encapsulates the logic of sending
                          the notification.
         :type  notifier: object that implements Notifier
+
+        :param metrics: Emits the timings and stats of each run, None to
+                        not emit any.
+        :type  metrics: MetricsEmitter
         """
         self.rules = rules
         self.notifier = notifier
+        self.metrics = metrics
+        self.notification = None
+        self.timings = {}
     
     def validate(self, event, session):
         """
@@ -90,16 +426,100 @@ class ValidationSuite:
         :type  session: boto3 session
         """
         results = []
+        ran = []
         for rule in self.rules:
+            start = time.perf_counter()
             rule.validate(session, event)
+            rule.timings["validate_seconds"] = time.perf_counter() - start
+            ran.append(rule)
             results += rule.results
-            finished = False
-            for row in rule.results:
-                if row[0] == FAILED and rule.continue_on_fail is False:
-                    finished = True
-            if finished:
+            if self._stops(rule):
                 break
-        self.notifier.notify(results)
+        self._notify(results, ran)
+
+    @staticmethod
+    def _stops(rule):
+        return rule.continue_on_fail is False and \
+            any(row[0] == FAILED for row in rule.results)
+
+    def _notify(self, results, ran):
+        start = time.perf_counter()
+        try:
+            self.notifier.notify(results)
+        finally:
+            self.timings["notify_seconds"] = time.perf_counter() - start
+            if self.metrics is not None:
+                self.emit_metrics(results, ran)
+
+    def emit_metrics(self, results, ran):
+        """
+        Emit a record for every rule that ran, one for every file each of
+        them checked and one for the suite.
+
+        :param results: The results of the run.
+        :type  results: list of result tuples
+
+        :param ran: The rules that ran.
+        :type  ran: list of Rule
+        """
+        statuses = {(row[1], row[4], row[5]): row[0] for row in results}
+        for rule in ran:
+            self.metrics.emit(rule.timings, {"Rule": rule.name})
+            for uri, stats in rule.stats.items():
+                bucket, key = uri.split("/", 1)
+                values = with_throughput(stats)
+                values.update(bucket=bucket, key=key,
+                              status=statuses.get((rule.name, bucket, key)))
+                self.metrics.emit(values, {"Rule": rule.name})
+        self.metrics.emit(self.timings, {"Suite": type(self).__name__})
+
+    async def validate_async(self, event, session):
+        """
+        Run validation on all the rules from an event loop. Every rule's
+        prefetch() is started before the first rule runs (e.g. the schema
+        config is fetched while FileFormatValidator runs and the files are
+        opened), and the notification is sent in the background, so the
+        results are returned without waiting on it. Await
+        wait_for_notification() before the loop closes.
+
+        :param event: The event passed to the lambda.
+        :type  event: dict
+
+        :param session: boto3 session
+        :type  session: boto3 session
+
+        :returns: list of result tuples
+        """
+        import asyncio
+        for rule in self.rules:
+            rule.prefetch(session, event)
+        results = []
+        ran = []
+        try:
+            for rule in self.rules:
+                start = time.perf_counter()
+                await rule.validate_async(session, event)
+                rule.timings["validate_seconds"] = time.perf_counter() - start
+                ran.append(rule)
+                results += rule.results
+                if self._stops(rule):
+                    break
+            self.notification = asyncio.ensure_future(
+                asyncio.to_thread(self._notify, results, ran))
+        finally:
+            for rule in self.rules:
+                await rule.release()
+        return results
+
+    async def wait_for_notification(self):
+        """
+        Wait for the notification started by validate_async() to be sent,
+        raising anything the notifier raised.
+        """
+        if self.notification is not None:
+            notification = self.notification
+            self.notification = None
+            await notification
 
 
 class NoMatchingSchemaException(Exception):
@@ -118,111 +538,932 @@ class EmptyPrimaryKeyException(Exception):
     pass
 
 
+class DuplicatePrimaryKeyException(Exception):
+    pass
+
+
+class QuarantineLimitException(Exception):
+    pass
+
+
+class ConstraintViolationException(Exception):
+    pass
+
+
+# Failures down to the file's content and its config entry alone, so an
+# identical file checked against the same entry fails the same way.
+CONTENT_FAILURES = (ColumnOrderException, EmptyPrimaryKeyException,
+                    DuplicatePrimaryKeyException, QuarantineLimitException,
+                    ConstraintViolationException)
+
+
+def row_offsets(offset, rows):
+    """
+    Offsets in the file of some rows of a batch.
+
+    :param offset: Row offset of the first row of the batch, or of each
+                   row (see BatchCheck.check).
+    :type  offset: int or pyarrow.Int64Array
+
+    :param rows: Indices of the rows in the batch.
+    :type  rows: list of int
+
+    :returns: list of int
+    """
+    if isinstance(offset, int):
+        return [offset + row for row in rows]
+    return offset.take(rows).to_pylist()
+
+
+class BatchCheck:
+    """
+    Base class for a check run against every batch of a file as it
+    streams through ValidateSchema.scan_file. Checks should raise an
+    exception as soon as they know the file is invalid.
+    """
+    def check(self, batch, offset):
+        """
+        Check the next batch of the file.
+
+        :param batch: The converted batch.
+        :type  batch: pyarrow.RecordBatch
+
+        :param offset: Row offset of the first row of the batch, or the
+                       offset of each row when rows were dropped from it
+                       in quarantine mode. Use row_offsets() to report rows.
+        :type  offset: int or pyarrow.Int64Array
+        """
+        raise NotImplementedError()
+
+    def finish(self):
+        """
+        Called once every batch has been checked.
+        """
+        pass
+
+    def close(self):
+        """
+        Release any resources, called whether the scan passed or not.
+        """
+        pass
+
+
+class MissingKeyCheck(BatchCheck):
+    """
+    Checks the primary key columns for nulls, empty or whitespace only
+    values.
+    """
+    def __init__(self, columns):
+        self.columns = columns
+        self.offenders = []
+
+    def check(self, batch, offset):
+        mask = missing_key_mask(batch, self.columns)
+        if pc.any(mask).as_py():
+            rows = pc.indices_nonzero(mask).to_pylist()
+            needed = MAX_REPORTED_OFFENDERS - len(self.offenders)
+            self.offenders += row_offsets(offset, rows[:needed])
+            if len(self.offenders) >= MAX_REPORTED_OFFENDERS:
+                self.finish()
+
+    def finish(self):
+        if self.offenders:
+            rows = ", ".join(str(row) for row in self.offenders)
+            msg = f"Primary key column has a missing value (rows: {rows})"
+            raise EmptyPrimaryKeyException(msg)
+
+
+class ConstraintCheck(BatchCheck):
+    """
+    Checks the value level constraints of the path, e.g. ranges, regexes,
+    enums and conditions across columns.
+    """
+    def __init__(self, constraints):
+        self.constraints = constraints
+        self.offenders = {}
+        self.reported = 0
+
+    def check(self, batch, offset):
+        for position, (name, mask) in enumerate(self.constraints.evaluate(batch)):
+            if not pc.any(mask).as_py():
+                continue
+            needed = MAX_REPORTED_OFFENDERS - self.reported
+            rows = pc.indices_nonzero(mask)[:needed].to_pylist()
+            # Keyed by position too, so they are reported in config order
+            # whichever batch a constraint first failed in.
+            self.offenders.setdefault((position, name), []).extend(
+                row_offsets(offset, rows))
+            self.reported += len(rows)
+            if self.reported >= MAX_REPORTED_OFFENDERS:
+                self.finish()
+
+    def finish(self):
+        if self.offenders:
+            failed = "; ".join(
+                f"{name} (rows: {', '.join(str(row) for row in rows)})"
+                for (_, name), rows in sorted(self.offenders.items()))
+            raise ConstraintViolationException(f"Constraint failed: {failed}")
+
+
+class UniqueKeyCheck(BatchCheck):
+    """
+    Checks the primary key is unique across the whole file.
+    """
+    def __init__(self, columns, memory_budget=DEFAULT_MEMORY_BUDGET,
+                 spill_dir=None):
+        self.columns = columns
+        self.tracker = UniqueKeyTracker(memory_budget, spill_dir)
+
+    def check(self, batch, offset):
+        self.tracker.add(key_array(batch, self.columns))
+
+    def finish(self):
+        counter = self.tracker.finish()
+        if counter.duplicate_rows:
+            sample = ", ".join(str(key) for key in counter.samples)
+            msg = (f"Primary key has {counter.duplicate_rows} duplicate rows "
+                   f"across {counter.duplicate_keys} keys (sample: {sample})")
+            raise DuplicatePrimaryKeyException(msg)
+
+    def close(self):
+        self.tracker.close()
+
+
+class ProfileCheck(BatchCheck):
+    """
+    Profiles the columns of a file and writes the profile to a json
+    sidecar once every check before it has passed.
+    """
+    def __init__(self, profiler, filesystem, path):
+        self.profiler = profiler
+        self.filesystem = filesystem
+        self.path = path
+
+    def check(self, batch, offset):
+        self.profiler.add(batch)
+
+    def finish(self):
+        if self.filesystem.type_name != "s3":
+            self.filesystem.create_dir(self.path.rsplit("/", 1)[0])
+        with self.filesystem.open_output_stream(self.path) as out:
+            out.write(json.dumps(self.profiler.as_dict(), indent=2).encode("utf-8"))
+        logging.info(f"Wrote profile to {self.path}")
+
+
+class OutputCheck(BatchCheck):
+    """
+    Writes every batch to the path's output, committed only once every
+    other check has passed. Has to be the last check.
+    """
+    def __init__(self, output):
+        self.output = output
+
+    def check(self, batch, offset):
+        self.output.write(batch)
+
+    def finish(self):
+        self.output.commit()
+
+    def close(self):
+        self.output.abort()
+
+
 class FileFormatValidator(Rule):
 
     def validate(self, session, event):
         self.status = STARTED
-        for record in event["Records"]:
-            bucket = record["s3"]["bucket"]["name"]
-            key = record["s3"]["object"]["key"]
-            logging.info(f"Validating csv file format for {key}")
-            if key.split(".")[-1] != "csv":
-                msg = f"{key} does not match pattern of *.csv"
-                logging.info(msg)
-                self.fail(msg, bucket, key)
-                return
-            self.success(bucket, key)
+        self.validate_records(event, self.check_file_format)
+
+    async def validate_async(self, session, event):
+        # Only looks at the keys, there's no I/O to overlap.
+        self.validate(session, event)
+
+    def check_file_format(self, bucket, key):
+        logging.info(f"Validating csv file format for {key}")
+        if split_extension(key)[0] != "csv":
+            msg = f"{key} does not match pattern of *.csv or *.csv.{{gz,zst,bz2}}"
+            logging.info(msg)
+            return FAILED, msg
+        return SUCCESS, ""
 
 
 class ValidateSchema(Rule):
 
-    def __init__(self, name, description, config_loader):
-        super().__init__(name, description)
+    def __init__(self, name, description, config_loader, filesystem=None,
+                 concurrency=DEFAULT_CONCURRENCY, sampling=True,
+                 memory_budget=None, result_cache=None):
+        super().__init__(name, description, concurrency)
         self.paths = None
         self.config_loader = config_loader
+        self.filesystem = filesystem
+        self.sampling = sampling
+        self.memory = MemoryBudget(memory_budget or default_budget())
         self.delimiter = None
         self.pattern = None
         self.primary_key = None
+        self.unique_primary_key = False
+        self.entry = None
+        self._config = None
+        self._opening = {}
+        self._opened = {}
+        self.result_cache = result_cache
+        self._etags = {}
+        self._cache_before = None
+
+    @property
+    def s3fs(self):
+        """
+        The filesystem files are read from: the one given to the
+        constructor, or the container's shared S3 filesystem.
+        """
+        return self.filesystem or pool().filesystem()
 
     def validate(self, session, event):
         self.status = STARTED
-        self.paths = self.config_loader.load(session)["paths"]
+        self.paths = self.load_config(session)["paths"]
+        self.start_cache(event)
+        try:
+            self.validate_records(event, self.check_file)
+        finally:
+            self.finish_cache()
+
+    def load_config(self, session):
+        """
+        Load the config, timing it.
+
+        :returns: configuration dict
+        """
+        start = time.perf_counter()
+        try:
+            return self.config_loader.load(session)
+        finally:
+            self.timings["config_seconds"] = time.perf_counter() - start
+
+    def prefetch(self, session, event):
+        """
+        Start loading the config and opening the first files of the event,
+        in threads, so the config and the first bytes of the files are
+        fetched at the same time. Only as many files as are checked at once
+        (self.concurrency) are opened ahead, the others are opened when
+        their check starts. Files whose result may be in the result cache
+        (their record has an ETag) aren't opened ahead, so a hit reads
+        nothing.
+        """
+        import asyncio
+        self._config = asyncio.ensure_future(
+            asyncio.to_thread(self.load_config, session))
+        s3fs = self.s3fs
+        etags = self.etags(event) if self.result_cache is not None else {}
+        uris = [f"{bucket}/{key}" for bucket, key in self.records(event)]
+        window = uris[:max(self.concurrency, 1)]
+        for uri in window:
+            if uri not in self._opening and uri not in etags:
+                self._opening[uri] = asyncio.ensure_future(
+                    asyncio.to_thread(self.open_stream, s3fs, uri))
+
+    async def validate_async(self, session, event):
+        import asyncio
+        self.status = STARTED
+        if self._config is None:
+            self.prefetch(session, event)
+        config, self._config = self._config, None
+        self.paths = (await config)["paths"]
+        self.start_cache(event)
+
+        async def check(bucket, key):
+            uri = f"{bucket}/{key}"
+            opening = self._opening.pop(uri, None)
+            if opening is not None:
+                opened = await opening
+                if opened is not None:
+                    self._opened[uri] = opened
+            return await asyncio.to_thread(self.check_file, bucket, key)
+
+        try:
+            await self.validate_records_async(event, check)
+        finally:
+            await asyncio.to_thread(self.finish_cache)
+
+    async def release(self):
+        if self._config is not None:
+            config, self._config = self._config, None
+            try:
+                await config
+            except Exception:
+                # The rule never ran, so neither did the config.
+                pass
+        opening, self._opening = self._opening, {}
+        for task in opening.values():
+            opened = await task
+            if opened is not None:
+                opened[0].close()
+        opened, self._opened = self._opened, {}
+        for source, _ in opened.values():
+            source.close()
+
+    @staticmethod
+    def open_stream(s3fs, uri):
+        """
+        Open a file and fetch its first bytes, for scan_stream to carry on
+        reading from.
+
+        :returns: tuple of (input stream, ScanStream) or None if it
+                  couldn't be opened (the scan will report why).
+        """
+        try:
+            source = s3fs.open_input_stream(uri, compression=None)
+        except Exception as e:
+            logging.info(f"Couldn't open s3://{uri} ahead of its scan: {e}")
+            return None
+        raw = ScanStream(source)
+        try:
+            raw.peek(MAGIC_SIZE)
+        except Exception as e:
+            logging.info(f"Couldn't read s3://{uri} ahead of its scan: {e}")
+            source.close()
+            return None
+        return source, raw
+
+    def check_file(self, bucket, key):
+        """
+        Validate the schema of one file, or reuse the result of an
+        identical one from the result cache. Safe to call from several
+        threads at once.
+
+        :returns: tuple of (status, message)
+        """
+        logging.info(f"Validating schema of file: s3://{bucket}/{key}")
+        try:
+            start = time.perf_counter()
+            entry = self.resolve(key)
+            self.record_stat(bucket, key, "resolve_seconds",
+                             time.perf_counter() - start)
+        except NoMatchingSchemaException:
+            return FAILED, f"No schema matches key: {key}"
+        except Exception as e:
+            return FAILED, "Unknown error: {0}".format(str(e))
+        cache_key = self.cache_key(bucket, key, entry)
+        if cache_key is not None:
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                self.record_stat(bucket, key, "cache_hit", True)
+                logging.info(f"Reusing the result of an identical file for s3://{bucket}/{key}")
+                return cached["status"], cached["message"]
+        try:
+            self.scan_file(bucket, key, entry.schema, entry)
+        except pyarrow.lib.ArrowInvalid as e:
+            outcome = FAILED, e.args[0]
+        except WrongDelimiterException:
+            outcome = FAILED, "Delimiter of the file is incorrect"
+        except CONTENT_FAILURES as e:
+            outcome = FAILED, str(e)
+        except Exception as e:
+            # Not down to the file (e.g. S3 errors), so not cached.
+            return FAILED, "Unknown error: {0}".format(str(e))
+        else:
+            stats = self.stats.get(f"{bucket}/{key}", {})
+            notes = []
+            if stats.get("sampled"):
+                notes.append(f"sampled: first {stats['rows']} rows checked")
+            if stats.get("quarantine_message"):
+                notes.append(stats["quarantine_message"])
+            outcome = SUCCESS, "; ".join(notes)
+        if cache_key is not None:
+            self.result_cache.put(cache_key, {"status": outcome[0], "message": outcome[1]})
+        return outcome
+
+    def cache_key(self, bucket, key, entry):
+        """
+        Get the result cache key of a file, from the ETag in its event
+        record and its config entry.
+
+        :returns: string, or None if the result can't be cached: there is
+                  no cache or ETag, or checking the file writes something
+                  for it (its output, profile or quarantine file).
+        """
+        if self.result_cache is None or entry.output or entry.profile or entry.quarantine:
+            return None
+        etag = self._etags.get(f"{bucket}/{key}")
+        if not etag:
+            return None
+        return result_key(self.name, etag, entry.fingerprint, self.sampling)
+
+    @staticmethod
+    def etags(event):
+        """
+        Get the ETag of every object in the event, from the records.
+
+        :returns: dict of "bucket/key" to ETag
+        """
+        etags = {}
         for record in event["Records"]:
             bucket = record["s3"]["bucket"]["name"]
-            key = record["s3"]["object"]["key"]
-            logging.info(f"Validating schema of file: s3://{bucket}/{key}")
+            obj = record["s3"]["object"]
+            if obj.get("eTag"):
+                etags[f"{bucket}/{obj['key']}"] = obj["eTag"]
+        return etags
+
+    def start_cache(self, event):
+        if self.result_cache is not None:
+            self._etags = self.etags(event)
+            self._cache_before = self.result_cache.stats()
+
+    def finish_cache(self):
+        """
+        Flush the result cache and record its hits, misses and evictions
+        for this run.
+        """
+        if self.result_cache is None or self._cache_before is None:
+            return
+        before, self._cache_before = self._cache_before, None
+        try:
+            self.result_cache.flush()
+        except Exception as e:
+            # The results stand, they just won't be reused.
+            logging.warning(f"Couldn't flush the result cache: {e}")
+        after = self.result_cache.stats()
+        for name in after:
+            self.timings[f"cache_{name}"] = after[name] - before[name]
+        lookups = self.timings["cache_hits"] + self.timings["cache_misses"]
+        if lookups:
+            self.timings["cache_hit_rate"] = self.timings["cache_hits"] / lookups * 100
+
+    def scan_file(self, bucket, key, schema, entry=None):
+        entry = entry or self.entry
+        logging.info(f"delim is {entry.delimiter}")
+        s3fs = self.s3fs
+        sample = entry.sample if self.sampling else None
+        compressed = split_extension(key)[1] is not None
+        try:
+            if entry.ranged_read and not sample and not compressed:
+                self.scan_ranged(s3fs, bucket, key, schema, entry)
+            else:
+                self.scan_stream(s3fs, bucket, key, schema, entry, sample)
+        finally:
+            # Let the files scanned after it have its share of the budget.
+            self.memory.release()
+        self.record_projection_savings(bucket, key, entry)
+
+    def scan_stream(self, s3fs, bucket, key, schema, entry, sample=None):
+        """
+        Scan a file in a single streaming pass, decompressing it on the fly
+        if it is gzip, zstd or bz2 compressed.
+        """
+        uri = f"{bucket}/{key}"
+        max_lines = None
+        max_bytes = None
+        truncated = False
+        fetched = None
+        source = None
+        raw = None
+        if sample:
+            if sample.get("rows") is not None:
+                # The header plus the sampled rows.
+                max_lines = sample["rows"] + 1
+            if sample.get("mb") is not None:
+                max_bytes = int(sample["mb"] * 1024 * 1024)
+                if split_extension(key)[1] is None:
+                    source, truncated, fetched = self.open_sample(
+                        s3fs, uri, entry, max_bytes)
+        if source is None:
+            # Decompression is handled here, from the magic bytes rather
+            # than only the extension.
+            opened = self._opened.pop(uri, None)
+            if opened is not None:
+                # Opened by prefetch(), carry on from the bytes it read.
+                source, raw = opened
+            else:
+                source = s3fs.open_input_stream(uri, compression=None)
+            fetched = None
+        else:
+            # The range fetched already is the byte budget.
+            max_bytes = None
+        with source as filestream:
+            if raw is None:
+                raw = ScanStream(filestream)
+            stream = raw
             try:
-                schema = self.get_schema(key)
-                self.scan_file(bucket, key, schema)
-            except pyarrow.lib.ArrowInvalid as e:
-                self.fail(e.args[0], bucket, key)
-                return
-            except NoMatchingSchemaException:
-                self.fail(f"No schema matches key: {key}", bucket, key)
-                return
-            except WrongDelimiterException:
-                self.fail("Delimiter of the file is incorrect", bucket, key)
-                return
-            except ColumnOrderException as e:
-                self.fail(str(e), bucket, key)
-                return
-            except EmptyPrimaryKeyException as e:
-                self.fail("Primary key column has a missing value", bucket, key)
-                return
-            except Exception as e:
-                self.fail("Unknown error: {0}".format(str(e)), bucket, key)
-                return
-            self.success(bucket, key)
+                codec = detect_codec(key, raw.peek(MAGIC_SIZE))
+                if codec is not None:
+                    stream = ScanStream(decompressing_stream(raw, codec))
+                    self.record_stat(bucket, key, "codec", codec)
+                # The magic bytes were peeked before the limits were known.
+                stream.limit(max_lines, max_bytes)
+                # Check the header before any conversion happens, then
+                # replay it to the typed reader from the same stream.
+                start = time.perf_counter()
+                self.check_header(stream.peek_header(), schema, entry)
+                self.record_stat(bucket, key, "header_seconds",
+                                 time.perf_counter() - start)
+                quarantine = self.open_quarantine(entry, bucket, key)
+                parse_options, convert_options = self.reader_options(
+                    entry, quarantine)
+                reader = csv.open_csv(pyarrow.PythonFile(stream, mode="r"),
+                                      read_options=self.read_options(bucket, key, entry),
+                                      convert_options=convert_options,
+                                      parse_options=parse_options)
+                self.check_batches(bucket, key, reader, entry, quarantine)
+                self.record_stat(bucket, key, "sampled", truncated or stream.cut_short)
+            finally:
+                if fetched is None:
+                    fetched = raw.bytes_fetched
+                self.record_stat(bucket, key, "bytes_fetched", fetched)
+                if stream is not raw:
+                    self.record_stat(bucket, key, "bytes_decompressed",
+                                     stream.bytes_fetched)
+                logging.info(f"Fetched {fetched} bytes from s3://{uri}")
+
+    def read_options(self, bucket, key, entry):
+        """
+        Build the csv read options for a file from the path's "reader"
+        settings ({"block_size_mb": 1, "use_threads": true}), shrunk to fit
+        the memory budget.
+
+        :returns: pyarrow.csv.ReadOptions
+        """
+        block_size = None
+        if entry.reader.get("block_size_mb") is not None:
+            block_size = int(entry.reader["block_size_mb"] * 1024 * 1024)
+        block_size, use_threads = self.memory.reader_settings(
+            block_size, entry.reader.get("use_threads", True))
+        self.record_stat(bucket, key, "block_size", block_size)
+        self.record_stat(bucket, key, "use_threads", use_threads)
+        return csv.ReadOptions(block_size=block_size, use_threads=use_threads)
+
+    @staticmethod
+    def open_sample(s3fs, uri, entry, budget):
+        """
+        Fetch only the first `budget` bytes of a file for sampling, cut
+        back to the last whole row.
+
+        :returns: tuple of (input stream or None if the file turns out to
+                  be compressed, whether the file was cut short, bytes
+                  fetched)
+        """
+        with s3fs.open_input_file(uri) as infile:
+            size = infile.size()
+            data = infile.read_at(min(budget, size), 0)
+        if codec_from_magic(data):
+            # Part of a compressed file can't be decompressed, stream it.
+            return None, False, None
+        fetched = len(data)
+        truncated = fetched < size
+        if truncated:
+            opts = entry.parse_options
+            quoted = opts.newlines_in_values and bool(opts.quote_char)
+            quote = (opts.quote_char or '"').encode("utf-8")
+            data = data[:last_row_end(data, quoted, quote)]
+        return pyarrow.BufferReader(data), truncated, fetched
 
-    def scan_file(self, bucket, key, schema):
-        logging.info(f"delim is {self.delimiter}")
+    def scan_ranged(self, s3fs, bucket, key, schema, entry):
+        """
+        Scan a file with concurrent ranged GETs, parsing the parts in
+        parallel. Set "ranged_read" on a path to use it, either as true or
+        as {"part_size_mb": 32, "concurrency": 8}.
+        """
         uri = f"{bucket}/{key}"
-        s3fs = fs.S3FileSystem()
-        # Run column order validation by opening and not reading anything.
-        filestream = s3fs.open_input_stream(uri)
-        parse_opts = csv.ParseOptions(delimiter=self.delimiter)
-        reader = csv.open_csv(filestream, parse_options=parse_opts)
-        for index, col in enumerate(reader.schema):
-            if col.name != schema[index].name:
-                msg = "column {} is out of order".format(col.name)
-                raise ColumnOrderException(msg)
-        # Run the rest of the validations.
-        filestream = s3fs.open_input_stream(uri)
-        opts = csv.ConvertOptions(column_types=schema)
-        reader = csv.open_csv(filestream, convert_options=opts,
-                              parse_options=parse_opts)
-        # Kind of a hack, but it works...if delim wrong, everything is read
-        # as one column.
-        if len(schema) > 1 and len(reader.schema) == 1:
+        opts = entry.ranged_read
+        if not isinstance(opts, dict):
+            opts = {}
+        part_size = DEFAULT_PART_SIZE
+        if opts.get("part_size_mb") is not None:
+            part_size = int(opts["part_size_mb"] * 1024 * 1024)
+        concurrency = opts.get("concurrency", DEFAULT_RANGED_CONCURRENCY)
+        concurrency = self.memory.ranged_concurrency(part_size, concurrency)
+        self.record_stat(bucket, key, "ranged_concurrency", concurrency)
+        with s3fs.open_input_file(uri) as infile:
+            codec = codec_from_magic(infile.read_at(MAGIC_SIZE, 0))
+            if codec is not None:
+                # Compressed without an extension to say so, it can't be
+                # split into ranges.
+                logging.info(f"s3://{uri} is {codec} compressed, streaming it")
+                self.scan_stream(s3fs, bucket, key, schema, entry)
+                return
+            reader = RangedReader(infile, infile.size(), part_size, concurrency)
+            try:
+                start = time.perf_counter()
+                header_bytes = reader.peek_header()
+                header = self.check_header(header_bytes, schema, entry)
+                self.record_stat(bucket, key, "header_seconds",
+                                 time.perf_counter() - start)
+                quarantine = self.open_quarantine(entry, bucket, key)
+                parse_options, convert_options = self.reader_options(
+                    entry, quarantine)
+                tables = reader.read(header.column_names, parse_options,
+                                     convert_options, len(header_bytes))
+                self.check_batches(
+                    bucket, key,
+                    (batch for table in tables for batch in table.to_batches()),
+                    entry, quarantine
+                )
+            finally:
+                self.record_stat(bucket, key, "bytes_fetched", reader.bytes_fetched)
+                self.record_stat(bucket, key, "ranged_gets", reader.parts)
+                logging.info(f"Fetched {reader.bytes_fetched} bytes from "
+                             f"s3://{uri} in {reader.parts} ranged GETs")
+
+    @staticmethod
+    def check_header(header_bytes, schema, entry):
+        """
+        Check the delimiter and column order from the header line.
+
+        :returns: pyarrow.Table with no rows, holding the header's columns.
+        """
+        header = csv.read_csv(pyarrow.py_buffer(header_bytes),
+                              parse_options=entry.parse_options)
+        # Kind of a hack, but it works...if delim wrong, everything
+        # is read as one column.
+        if len(schema) > 1 and header.num_columns == 1:
             raise WrongDelimiterException()
-        # Parse through the file, pyarrow will through exceptions
-        # if there's invalid data.
-        for batch in reader:
-            # If primary key is a string, need to check the column
-            # for empty strings.
-            if schema.field(self.primary_key).type == "string":
-                table = pyarrow.Table.from_batches([batch])
-                for val in table[self.primary_key]:
-                    if val.as_py() == "":
-                        raise EmptyPrimaryKeyException()
+        for index, name in enumerate(header.column_names):
+            if index >= len(schema) or name != schema[index].name:
+                msg = "column {} is out of order".format(name)
+                raise ColumnOrderException(msg)
+        if header.num_columns < len(schema):
+            msg = "column {} is missing".format(schema[header.num_columns].name)
+            raise ColumnOrderException(msg)
+        return header
 
-    def get_schema(self, key):
-        for path in self.paths:
-            pattern = path["pattern"]
-            if re.match(pattern, key):
-                self.delimiter = path["delimiter"]
-                self.pattern = path["pattern"]
-                self.primary_key = path["primary_key"]
-                fields = []
-                for field in path["fields"]:
-                    fields.append(
-                        pyarrow.field(
-                            field["name"],
-                            field["type"],
-                            field["nullable"]
-                        )
-                    )
-                schema = pyarrow.schema(fields)
-                return schema
-        raise NoMatchingSchemaException()
+    def check_batches(self, bucket, key, batches, entry, quarantine=None):
+        """
+        Run the batch checks over every batch of a file, in order, and
+        record the time, rows, batches, bytes materialized and the
+        process's memory high-water marks during the scan.
+
+        :param batches: The converted batches of the file.
+        :type  batches: iterable of pyarrow.RecordBatch
+
+        :param entry: The config entry matching the file.
+        :type  entry: PathEntry
+
+        :param quarantine: Converts the batches (read as strings) and sets
+                           aside rows that don't convert, None if the
+                           batches are converted already.
+        :type  quarantine: Quarantine
+
+        :returns: number of rows checked
+        """
+        checks = self.batch_checks(entry, bucket, key)
+        materialized = 0
+        count = 0
+        watermark = MemoryWatermark()
+        start = time.perf_counter()
+        try:
+            offset = 0
+            # Parse through the file, pyarrow will through exceptions
+            # if there's invalid data.
+            for batch in batches:
+                rows = batch.num_rows
+                offsets = offset
+                if quarantine is not None:
+                    batch, offsets = quarantine.convert(batch, offset)
+                    if quarantine.over_limit():
+                        # The file fails whatever the rest of it holds.
+                        self.finish_quarantine(bucket, key, entry, quarantine,
+                                               stopped_at=offset + rows)
+                for check in checks:
+                    check.check(batch, offsets)
+                offset += rows
+                count += 1
+                materialized += batch.nbytes
+                watermark.sample()
+            if quarantine is not None:
+                self.finish_quarantine(bucket, key, entry, quarantine)
+            for check in checks:
+                check.finish()
+        finally:
+            if quarantine is not None:
+                quarantine.close()
+            for check in checks:
+                check.close()
+            self.record_stat(bucket, key, "scan_seconds", time.perf_counter() - start)
+            self.record_stat(bucket, key, "rows", offset)
+            self.record_stat(bucket, key, "batches", count)
+            self.record_stat(bucket, key, "bytes_materialized", materialized)
+            memory = watermark.as_stats()
+            for name, value in memory.items():
+                self.record_stat(bucket, key, name, value)
+            logging.info(f"Process peak RSS {memory['peak_rss']} bytes, arrow pool peak "
+                         f"{memory['arrow_peak_bytes']} bytes during the scan of "
+                         f"s3://{bucket}/{key}")
+        return offset
+
+    def record_projection_savings(self, bucket, key, entry):
+        """
+        Estimate the bytes that skipping presence only columns saved from
+        being materialized. Fixed width columns would take their width per
+        row; anything else is taken to be an average sized field of the
+        raw file plus a 4 byte offset.
+        """
+        stats = self.stats.get(f"{bucket}/{key}", {})
+        rows = stats.get("rows", 0)
+        skipped = [field for field in entry.schema
+                   if field.name not in entry.projected]
+        if not rows or not skipped:
+            return
+        field_bytes = stats.get("bytes_fetched", 0) / rows / len(entry.schema)
+        saved = 0
+        for field in skipped:
+            try:
+                width = field.type.bit_width / 8
+            except ValueError:
+                width = 4 + field_bytes
+            saved += int(rows * width)
+        self.record_stat(bucket, key, "bytes_not_materialized", saved)
+        logging.info(f"Skipped {len(skipped)} presence only columns of "
+                     f"s3://{bucket}/{key}, saving ~{saved} bytes")
+
+    def batch_checks(self, entry, bucket=None, key=None):
+        """
+        Build the checks to run against each batch of a file.
+
+        :param entry: The config entry matching the file.
+        :type  entry: PathEntry
+
+        :param bucket: Bucket of the file, needed to write its output.
+        :type  bucket: string
+
+        :param key: Key of the file, needed to write its output.
+        :type  key: string
 
+        :returns: list of BatchCheck
+        """
+        key_columns = primary_key_columns(entry.primary_key)
+        checks = [MissingKeyCheck(key_columns)]
+        if entry.constraints is not None:
+            checks.append(ConstraintCheck(entry.constraints))
+        if entry.unique_primary_key:
+            opts = entry.unique_primary_key
+            if not isinstance(opts, dict):
+                opts = {}
+            budget_mb = opts.get("memory_budget_mb")
+            budget = DEFAULT_MEMORY_BUDGET
+            if budget_mb is not None:
+                budget = int(budget_mb * 1024 * 1024)
+            checks.append(UniqueKeyCheck(key_columns, budget,
+                                         opts.get("spill_dir")))
+        profile = self.open_profile(entry, bucket, key)
+        if profile is not None:
+            checks.append(profile)
+        output = self.open_output(entry, bucket, key)
+        if output is not None:
+            checks.append(OutputCheck(output))
+        return checks
+
+    def open_profile(self, entry, bucket, key):
+        """
+        Set up profiling for a file if its path asks for it, with
+        "profile": true or {"columns": ["id"], "location": "bucket/prefix"}.
+        The profile is written next to the file as <name>.profile.json
+        unless a location is given.
+
+        :returns: ProfileCheck or None
+        """
+        opts = entry.profile
+        if not opts or key is None:
+            return None
+        if not isinstance(opts, dict):
+            opts = {}
+        filesystem, path = self.sidecar(bucket, key, "profile.json",
+                                        opts.get("location"))
+        self.record_stat(bucket, key, "profile", path)
+        return ProfileCheck(Profiler(opts.get("columns")), filesystem, path)
+
+    def open_output(self, entry, bucket, key):
+        """
+        Set up the output for a file if its path has one, e.g.
+        {"output": {"location": "s3://bucket/prefix", "format": "parquet"}}.
+        Sampled scans have no output since they don't see the whole file.
+
+        :returns: ValidatedOutput or None
+        """
+        opts = entry.output
+        if not opts or key is None:
+            return None
+        if self.sampling and entry.sample:
+            logging.info(f"Not writing output for sampled s3://{bucket}/{key}")
+            return None
+        fmt = opts.get("format", DEFAULT_OUTPUT_FORMAT)
+        filesystem, prefix = resolve_location(
+            opts["location"], self.s3fs)
+        path = f"{prefix.rstrip('/')}/{output_key(key, fmt)}"
+        schema = pyarrow.schema([entry.schema.field(name)
+                                 for name in entry.projected])
+        self.record_stat(bucket, key, "output", path)
+        return ValidatedOutput(filesystem, path, fmt, opts.get("compression"),
+                               schema)
+
+    def open_quarantine(self, entry, bucket, key):
+        """
+        Set up quarantine mode for a file if its path asks for it, with
+        "quarantine": true or {"location": "bucket/prefix", "max_rows": 100}.
+        Rows that don't parse or convert are written to a csv next to the
+        file (or under the location) instead of failing it straight away.
+
+        :returns: Quarantine or None
+        """
+        opts = entry.quarantine
+        if not opts:
+            return None
+        if not isinstance(opts, dict):
+            opts = {}
+        # Not ".csv", so a quarantine file next to its csv doesn't match
+        # the path and get validated (and quarantined) in turn.
+        filesystem, path = self.sidecar(bucket, key, "quarantine.txt",
+                                        opts.get("location"))
+        schema = pyarrow.schema([entry.schema.field(name)
+                                 for name in entry.projected])
+        return Quarantine(schema, filesystem, path, opts.get("max_rows", 0))
+
+    def finish_quarantine(self, bucket, key, entry, quarantine, stopped_at=None):
+        """
+        Record what was quarantined and fail the file if it is more rows
+        than the path allows (none by default).
+
+        :param stopped_at: Rows read when the scan was stopped for going
+                           over the limit, None if it read the whole file.
+        :type  stopped_at: int
+        """
+        rows = quarantine.finish()
+        self.record_stat(bucket, key, "quarantined_rows", rows)
+        if not rows:
+            return
+        self.record_stat(bucket, key, "quarantine", quarantine.path)
+        self.record_stat(bucket, key, "quarantine_errors",
+                         dict(quarantine.column_errors))
+        msg = f"Quarantined {rows} rows to {quarantine.path} ({quarantine.summary()})"
+        if stopped_at is not None:
+            self.record_stat(bucket, key, "quarantine_stopped_at", stopped_at)
+            msg += f", stopped after {stopped_at} rows"
+        if quarantine.over_limit():
+            raise QuarantineLimitException(msg)
+        self.record_stat(bucket, key, "quarantine_message", msg)
+
+    def sidecar(self, bucket, key, suffix, location=None):
+        """
+        Place a file written alongside a csv, e.g. "reports/a.csv" with the
+        suffix "profile.json" gives "bucket/reports/a.profile.json", or
+        "prefix/reports/a.profile.json" under a location.
+
+        :returns: tuple of (pyarrow.fs.FileSystem, path)
+        """
+        filesystem = self.s3fs
+        sidecar_key = f"{strip_extension(key)}.{suffix}"
+        if not location:
+            return filesystem, f"{bucket}/{sidecar_key}"
+        filesystem, prefix = resolve_location(location, filesystem)
+        return filesystem, f"{prefix.rstrip('/')}/{sidecar_key}"
+
+    @staticmethod
+    def reader_options(entry, quarantine=None):
+        """
+        Get the csv parse and convert options for a file. In quarantine
+        mode every column is read as strings and rows with the wrong
+        number of columns are handed to the quarantine.
+
+        :returns: tuple of (pyarrow.csv.ParseOptions, pyarrow.csv.ConvertOptions)
+        """
+        if quarantine is None:
+            return entry.parse_options, entry.convert_options
+        parse_options = csv.ParseOptions(
+            delimiter=entry.parse_options.delimiter,
+            newlines_in_values=entry.parse_options.newlines_in_values,
+            invalid_row_handler=quarantine.handle_invalid_row
+        )
+        return parse_options, entry.string_convert_options
+
+    def resolve(self, key):
+        """
+        Find the config entry for a key.
+
+        :param key: The s3 key of the file.
+        :type  key: string
+
+        :returns: PathEntry
+        """
+        entry = compile_paths(self.paths).match(key)
+        if entry is None:
+            raise NoMatchingSchemaException()
+        return entry
+
+    def pattern_of(self, key):
+        """
+        Get the pattern of the config path matching a key, e.g. to group
+        failures by.
+
+        :returns: string, or None if the config isn't loaded or no path
+                  matches.
+        """
+        if self.paths is None:
+            return None
+        entry = compile_paths(self.paths).match(key)
+        return entry.pattern if entry is not None else None
+
+    def get_schema(self, key):
+        entry = self.resolve(key)
+        self.entry = entry
+        self.delimiter = entry.delimiter
+        self.pattern = entry.pattern
+        self.primary_key = entry.primary_key
+        self.unique_primary_key = entry.unique_primary_key
+        return entry.schema
@@ -0,0 +1,236 @@
+import logging
+import os
+import tempfile
+
+import pyarrow
+import pyarrow.compute as pc
+
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+KEY_SEPARATOR = "\x1f"
+MAX_SAMPLE_KEYS = 10
+SPILL_BATCH_SIZE = 64 * 1024
+
+
+def key_array(batch, columns):
+    """
+    Build a single array holding the primary key of every row in the batch.
+    Composite keys are joined into one string column so they can be sorted
+    and compared with the same kernels as a single key.
+
+    :param batch: The batch to take the key from.
+    :type  batch: pyarrow.RecordBatch
+
+    :param columns: Names of the primary key columns.
+    :type  columns: list of strings
+
+    :returns: pyarrow.Array
+    """
+    if len(columns) == 1:
+        return batch.column(columns[0])
+    parts = [pc.cast(batch.column(name), pyarrow.string()) for name in columns]
+    return pc.binary_join_element_wise(*parts, KEY_SEPARATOR)
+
+
+class DuplicateCounter:
+    """
+    Counts repeated keys in a stream of sorted chunks. Chunks must be fed
+    in sort order; state is carried across chunk boundaries so a key split
+    between two chunks is still counted once.
+    """
+    def __init__(self):
+        self.duplicate_rows = 0
+        self.duplicate_keys = 0
+        self.samples = []
+        self._last = None
+        self._last_repeated = False
+
+    def consume(self, chunk):
+        """
+        Count the duplicates in the next sorted chunk.
+
+        :param chunk: Sorted keys following every key consumed so far.
+        :type  chunk: pyarrow.Array
+        """
+        if len(chunk) == 0:
+            return
+        if self._last is None:
+            previous = chunk.slice(0, len(chunk) - 1)
+            repeated = pc.equal(chunk.slice(1), previous)
+            repeated = pyarrow.concat_arrays([pyarrow.array([False]), repeated])
+        else:
+            previous = pyarrow.concat_arrays(
+                [self._last, chunk.slice(0, len(chunk) - 1)])
+            repeated = pc.equal(chunk, previous)
+        # A key is a new duplicate the first time it repeats.
+        before = pyarrow.concat_arrays(
+            [pyarrow.array([self._last_repeated]),
+             repeated.slice(0, len(repeated) - 1)])
+        first = pc.and_(repeated, pc.invert(before))
+        self.duplicate_rows += repeated.true_count
+        new_keys = first.true_count
+        self.duplicate_keys += new_keys
+        if new_keys and len(self.samples) < MAX_SAMPLE_KEYS:
+            needed = MAX_SAMPLE_KEYS - len(self.samples)
+            self.samples += chunk.filter(first).slice(0, needed).to_pylist()
+        self._last = chunk.slice(len(chunk) - 1)
+        self._last_repeated = repeated[len(repeated) - 1].as_py()
+
+    def merge(self, other):
+        """
+        Add the counts of a counter that saw a disjoint key range.
+
+        :param other: Counter to merge in.
+        :type  other: DuplicateCounter
+        """
+        self.duplicate_rows += other.duplicate_rows
+        self.duplicate_keys += other.duplicate_keys
+        needed = MAX_SAMPLE_KEYS - len(self.samples)
+        self.samples += other.samples[:needed]
+
+
+class UniqueKeyTracker:
+    """
+    Proves a key is unique across a file with bounded memory. Keys are
+    buffered as arrow arrays until the memory budget is exceeded, then
+    sorted and spilled to disk as a run. Runs whose key ranges don't
+    overlap are checked on their own; otherwise they are merged back in
+    sorted windows so only one batch per run is held at a time.
+    """
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET, spill_dir=None):
+        """
+        Constructor.
+
+        :param memory_budget: Bytes of keys to buffer before spilling.
+        :type  memory_budget: int
+
+        :param spill_dir: Directory for spill files, defaults to the system
+                          temp directory (/tmp on lambda).
+        :type  spill_dir: string
+        """
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.rows = 0
+        self.spills = 0
+        self._pending = []
+        self._pending_bytes = 0
+        self._runs = []
+        self._tempdir = None
+
+    def add(self, keys):
+        """
+        Track the keys of the next batch. Null keys are left out, they are
+        reported as missing rather than as duplicates.
+
+        :param keys: Keys of the batch, see key_array().
+        :type  keys: pyarrow.Array
+        """
+        if keys.null_count:
+            keys = keys.drop_null()
+            if len(keys) == 0:
+                return
+        self.rows += len(keys)
+        self._pending.append(keys)
+        self._pending_bytes += keys.nbytes
+        if self._pending_bytes > self.memory_budget:
+            self._spill()
+
+    def _sorted_pending(self):
+        # Gather the sorted keys one slice at a time, so only one sorted
+        # slice is held on top of the buffered keys.
+        keys = pyarrow.concat_arrays(self._pending)
+        self._pending = []
+        self._pending_bytes = 0
+        indices = pc.array_sort_indices(keys)
+        for start in range(0, len(indices), SPILL_BATCH_SIZE):
+            yield keys.take(indices.slice(start, SPILL_BATCH_SIZE))
+
+    def _spill(self):
+        if self._tempdir is None:
+            self._tempdir = tempfile.TemporaryDirectory(dir=self.spill_dir)
+        path = os.path.join(self._tempdir.name, f"run-{len(self._runs)}.arrow")
+        counter = DuplicateCounter()
+        schema = pyarrow.schema([("key", self._pending[0].type)])
+        first = last = None
+        rows = 0
+        with pyarrow.ipc.new_file(path, schema) as writer:
+            for chunk in self._sorted_pending():
+                if first is None:
+                    first = chunk[0].as_py()
+                last = chunk[len(chunk) - 1].as_py()
+                rows += len(chunk)
+                counter.consume(chunk)
+                writer.write_batch(pyarrow.record_batch([chunk], schema=schema))
+        self._runs.append((first, last, path, counter))
+        self.spills += 1
+        logging.info(f"Spilled {rows} keys to {path}")
+
+    def finish(self):
+        """
+        Check all the keys tracked so far and clean up any spill files.
+
+        :returns: DuplicateCounter with the duplicates found.
+        """
+        try:
+            if not self._runs:
+                counter = DuplicateCounter()
+                if self._pending:
+                    for chunk in self._sorted_pending():
+                        counter.consume(chunk)
+                return counter
+            if self._pending:
+                self._spill()
+            runs = sorted(self._runs, key=lambda run: run[0])
+            disjoint = all(runs[i][1] < runs[i + 1][0]
+                           for i in range(len(runs) - 1))
+            if disjoint:
+                counter = DuplicateCounter()
+                for run in runs:
+                    counter.merge(run[3])
+                return counter
+            return self._merge_runs(runs)
+        finally:
+            self.close()
+
+    @staticmethod
+    def _merge_runs(runs):
+        counter = DuplicateCounter()
+        readers = [pyarrow.ipc.open_file(pyarrow.memory_map(run[2]))
+                   for run in runs]
+        positions = [0] * len(readers)
+        current = [None] * len(readers)
+        while True:
+            for index, reader in enumerate(readers):
+                empty = current[index] is None or len(current[index]) == 0
+                if empty and positions[index] < reader.num_record_batches:
+                    batch = reader.get_batch(positions[index])
+                    current[index] = batch.column(0)
+                    positions[index] += 1
+            active = [index for index, keys in enumerate(current)
+                      if keys is not None and len(keys) > 0]
+            if not active:
+                break
+            # Everything up to the smallest last key of the loaded batches
+            # can be sorted and counted without seeing the rest of the runs.
+            cutoff = min(current[index][len(current[index]) - 1].as_py()
+                         for index in active)
+            parts = []
+            for index in active:
+                keys = current[index]
+                count = pc.less_equal(keys, cutoff).true_count
+                parts.append(keys.slice(0, count))
+                current[index] = keys.slice(count)
+            window = pyarrow.concat_arrays(parts)
+            counter.consume(window.take(pc.array_sort_indices(window)))
+        return counter
+
+    def close(self):
+        """
+        Remove any spill files.
+        """
+        self._pending = []
+        self._pending_bytes = 0
+        self._runs = []
+        if self._tempdir is not None:
+            self._tempdir.cleanup()
+            self._tempdir = None
@@ -0,0 +1,69 @@
+import csv
+import json
+
+from csv_validator.batch import main, run
+
+
+def _tree(tmp_path):
+    schema = {"paths": [{
+        "pattern": "reports/.*",
+        "delimiter": "|",
+        "primary_key": "id",
+        "fields": [
+            {"name": "id", "type": "int64", "nullable": False},
+            {"name": "alpha", "type": "double", "nullable": True}
+        ]
+    }]}
+    (tmp_path / "schema.json").write_text(json.dumps(schema))
+    data = tmp_path / "data"
+    (data / "reports" / "2020").mkdir(parents=True)
+    (data / "reports" / "a.csv").write_bytes(b"id|alpha\n1|1.5\n")
+    (data / "reports" / "2020" / "b.csv").write_bytes(b"id|alpha\n1|x\n")
+    (data / "reports" / "c.txt").write_bytes(b"id|alpha\n1|1.5\n")
+    # Not matched by any path, so not validated.
+    (data / "other.csv").write_bytes(b"id|alpha\n1|1.5\n")
+    return data, str(tmp_path / "schema.json")
+
+
+def _read_report(path):
+    with open(path) as f:
+        return [(row["status"], row["name"], row["key"]) for row in csv.DictReader(f)]
+
+
+def test_batch_directory(tmp_path):
+    data, schema = _tree(tmp_path)
+    report = str(tmp_path / "report.csv")
+    summary = run(str(data), schema, report, workers=1)
+    assert (summary["files"], summary["failed"], summary["skipped"]) == (3, 2, 1)
+    assert sorted(_read_report(report)) == [
+        ("FAILED", "FileFormatValidator", "reports/c.txt"),
+        ("FAILED", "ValidateSchema", "reports/2020/b.csv"),
+        ("SUCCESS", "FileFormatValidator", "reports/2020/b.csv"),
+        ("SUCCESS", "FileFormatValidator", "reports/a.csv"),
+        ("SUCCESS", "ValidateSchema", "reports/a.csv"),
+    ]
+
+
+def test_batch_resumes_from_checkpoint(tmp_path):
+    data, schema = _tree(tmp_path)
+    report = str(tmp_path / "report.jsonl")
+    checkpoint = tmp_path / "done.txt"
+    checkpoint.write_text("reports/a.csv\n")
+    summary = run(str(data), schema, report, str(checkpoint), workers=1)
+    assert (summary["files"], summary["resumed"]) == (2, 1)
+    rows = [json.loads(line) for line in open(report)]
+    assert {row["key"] for row in rows} == {"reports/2020/b.csv", "reports/c.txt"}
+    assert set(checkpoint.read_text().split()) == {
+        "reports/a.csv", "reports/2020/b.csv", "reports/c.txt"}
+    # Nothing left to do, and the report is appended to, not replaced.
+    summary = run(str(data), schema, report, str(checkpoint), workers=1)
+    assert summary["files"] == 0
+    assert len(open(report).readlines()) == len(rows)
+
+
+def test_batch_process_pool(tmp_path):
+    data, schema = _tree(tmp_path)
+    report = str(tmp_path / "report.csv")
+    assert main([str(data), "--schema", schema, "--report", report,
+                 "--workers", "2"]) == 1
+    assert len(_read_report(report)) == 5
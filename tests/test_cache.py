@@ -0,0 +1,115 @@
+import json
+import unittest.mock as mock
+
+from csv_validator.cache import MemoryCache, S3IndexCache, SqliteCache
+from csv_validator.cache import clear_caches, result_cache, result_key
+
+from botocore.exceptions import ClientError
+
+import pytest
+
+
+def test_result_key():
+    key = result_key("schema", '"abc"', "f1", True)
+    # The quotes S3 puts around ETags don't matter.
+    assert key == result_key("schema", "abc", "f1", True)
+    assert key != result_key("schema", "abd", "f1", True)
+    assert key != result_key("schema", "abc", "f2", True)
+    assert key != result_key("schema", "abc", "f1", False)
+    assert key != result_key("other", "abc", "f1", True)
+
+
+def test_memory_cache_lru():
+    cache = MemoryCache(max_entries=2)
+    cache.put("a", {"status": "SUCCESS"})
+    cache.put("b", {"status": "FAILED"})
+    assert cache.get("a") == {"status": "SUCCESS"}
+    # "b" is the least recently used now.
+    cache.put("c", {"status": "SUCCESS"})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats() == {"hits": 3, "misses": 1, "evictions": 1}
+
+
+def test_sqlite_cache(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    cache = SqliteCache(path, max_entries=2)
+    cache.put("a", {"status": "SUCCESS", "message": ""})
+    cache.put("b", {"status": "FAILED", "message": "bad"})
+    assert cache.get("a") == {"status": "SUCCESS", "message": ""}
+    cache.put("c", {"status": "SUCCESS", "message": ""})
+    assert cache.get("b") is None
+    cache.close()
+    # The results outlive the process, e.g. on a warm container's /tmp.
+    cache = SqliteCache(path, max_entries=2)
+    assert cache.get("a") == {"status": "SUCCESS", "message": ""}
+    assert cache.get("c") is not None
+    assert cache.stats() == {"hits": 2, "misses": 0, "evictions": 0}
+    cache.close()
+
+
+def _s3_session(objects):
+    client = mock.MagicMock(name="mock_client")
+
+    def get_object(Bucket, Key):
+        if (Bucket, Key) not in objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        body = mock.MagicMock()
+        body.read.return_value = objects[(Bucket, Key)]
+        return {"Body": body}
+
+    def put_object(Bucket, Key, Body):
+        objects[(Bucket, Key)] = Body
+
+    client.get_object.side_effect = get_object
+    client.put_object.side_effect = put_object
+    session = mock.MagicMock(name="mock_session")
+    session.client.return_value = client
+    return session, client
+
+
+def test_s3_index_cache():
+    objects = {}
+    session, client = _s3_session(objects)
+    cache = S3IndexCache("bucket", "cache/results.json", session, max_entries=2)
+    assert cache.get("a") is None
+    cache.put("a", {"status": "SUCCESS"})
+    # Nothing is written until the flush.
+    assert client.put_object.call_count == 0
+    cache.flush()
+    written = json.loads(objects[("bucket", "cache/results.json")])
+    assert written["entries"]["a"]["value"] == {"status": "SUCCESS"}
+    # Another invocation's entries are merged with, not overwritten.
+    other = S3IndexCache("bucket", "cache/results.json", session, max_entries=2)
+    assert other.get("a") == {"status": "SUCCESS"}
+    other.put("b", {"status": "FAILED"})
+    cache.put("c", {"status": "SUCCESS"})
+    other.flush()
+    cache.flush()
+    entries = json.loads(objects[("bucket", "cache/results.json")])["entries"]
+    # Three entries written, the least recently used one evicted.
+    assert len(entries) == 2
+    assert "c" in entries
+    # Flushing with nothing added doesn't write.
+    calls = client.put_object.call_count
+    cache.flush()
+    assert client.put_object.call_count == calls
+
+
+def test_result_cache_specs(tmp_path):
+    clear_caches()
+    session = mock.MagicMock()
+    assert result_cache("none", session) is None
+    assert result_cache("", session) is None
+    memory = result_cache("memory", session)
+    assert isinstance(memory, MemoryCache)
+    # Kept for the next invocation in the container.
+    assert result_cache("memory", session) is memory
+    sqlite = result_cache(f"sqlite:{tmp_path / 'r.sqlite'}", session)
+    assert isinstance(sqlite, SqliteCache)
+    s3 = result_cache("s3://bucket/cache/results.json", session)
+    assert (s3.bucket, s3.key) == ("bucket", "cache/results.json")
+    with pytest.raises(ValueError):
+        result_cache("redis", session)
+    clear_caches()
@@ -0,0 +1,57 @@
+from csv_validator.clients import PooledSession, clear_pools, log_setup, pool
+from csv_validator.clients import setup_stats
+
+import pyarrow.fs
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def fresh_pools(monkeypatch):
+    for name in ["AWS_REGION", "AWS_DEFAULT_REGION", "AWS_ENDPOINT_URL",
+                 "AWS_ENDPOINT_URL_S3"]:
+        monkeypatch.delenv(name, raising=False)
+    clear_pools()
+    yield
+    clear_pools()
+
+
+def test_pool_shared_per_region_and_endpoint(monkeypatch):
+    assert pool() is pool()
+    assert pool().region == "us-east-1"
+    monkeypatch.setenv("AWS_REGION", "eu-west-1")
+    assert pool().region == "eu-west-1"
+    assert pool() is not pool("us-east-1")
+    assert pool("us-east-1") is pool("us-east-1", None)
+
+
+def test_session_clients_reused():
+    session = pool("eu-west-1").session()
+    assert isinstance(session, PooledSession)
+    assert session is pool("eu-west-1").session()
+    assert session.region_name == "eu-west-1"
+    client = session.client("s3")
+    assert session.client("s3") is client
+    assert session.client("sesv2") is not client
+    assert session.client("s3", endpoint_url="http://localhost:9000") is not client
+
+
+def test_filesystem_reused():
+    filesystem = pool("eu-west-1", "http://localhost:9000").filesystem()
+    assert isinstance(filesystem, pyarrow.fs.S3FileSystem)
+    assert filesystem.region == "eu-west-1"
+    assert pool("eu-west-1", "http://localhost:9000").filesystem() is filesystem
+
+
+def test_setup_stats():
+    before = setup_stats()
+    clients = pool()
+    clients.session().client("s3")
+    clients.filesystem()
+    first = log_setup(before)
+    assert first["created"] == 3
+    assert first["reused"] == 0
+    assert first["seconds"] > 0
+    before = setup_stats()
+    clients.session().client("s3")
+    clients.filesystem()
+    assert log_setup(before) == {"created": 0, "reused": 3, "seconds": 0}
@@ -0,0 +1,170 @@
+import json
+import os
+import unittest.mock as mock
+
+from csv_validator.compiled import artifact_key, compile_config, config_errors
+from csv_validator.clients import clear_pools
+from csv_validator.compiled import fetch_compiled, main, read_artifact
+from csv_validator.config import CachedLoader, S3JsonLoader, clear_cache
+from csv_validator.patterns import PathIndex, compile_paths
+
+import boto3
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+
+def _config():
+    here = os.path.dirname(os.path.realpath(__file__))
+    with open(os.path.join(here, "fixtures/simple.json")) as f:
+        config = json.load(f)
+    config["paths"].append({
+        "delimiter": ",",
+        "primary_key": ["region", "id"],
+        "pattern": ".*/daily_[0-9]+\\.csv",
+        "fields": [
+            {"name": "region", "type": "string", "nullable": False},
+            {"name": "id", "type": "int64", "nullable": False},
+            {"name": "when", "type": "timestamp[s]", "nullable": True}
+        ]
+    })
+    return config
+
+
+def test_config_errors():
+    assert config_errors(_config()) == []
+    config = _config()
+    config["paths"][0]["pattern"] = "reports/(.*"
+    config["paths"][0]["delimiter"] = "||"
+    config["paths"][1]["primary_key"] = "missing"
+    config["paths"][1]["fields"][2]["type"] = "timestamp[x]"
+    config["paths"].append({"pattern": "x"})
+    errors = config_errors(config)
+    assert len(errors) == 5
+    assert "invalid pattern" in errors[0]
+    assert "missing delimiter, primary_key, fields" in errors[-1]
+
+
+def test_compile_round_trip():
+    config = _config()
+    compiled = read_artifact(compile_config(config))
+    paths = compiled["paths"]
+    assert list(paths) == config["paths"]
+    plain = PathIndex(config["paths"])
+    # The index is built once with the artifact, not again per config.
+    assert compile_paths(paths) is paths.index
+    for key in ["reports/a.csv", "x/daily_1.csv", "x/weekly.csv"]:
+        entry = compile_paths(paths).match(key)
+        expected = plain.match(key)
+        if expected is None:
+            assert entry is None
+            continue
+        assert entry.index == expected.index
+        assert entry.schema.equals(expected.schema)
+        assert entry.fingerprint == expected.fingerprint
+        assert entry.projected == expected.projected
+
+
+def _s3_session(objects, calls):
+    client = mock.MagicMock(name="mock_client")
+
+    def get_object(Bucket, Key, **kwargs):
+        calls.append(Key)
+        if (Bucket, Key) not in objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        body = mock.MagicMock()
+        body.read.return_value = objects[(Bucket, Key)]
+        return {"Body": body, "ETag": "\"abc\""}
+
+    def head_object(Bucket, Key, IfNoneMatch=None):
+        if IfNoneMatch == "\"abc\"":
+            raise ClientError({"Error": {"Code": "304"},
+                               "ResponseMetadata": {"HTTPStatusCode": 304}}, "HeadObject")
+        return {"ETag": "\"abc\""}
+
+    def put_object(Bucket, Key, Body):
+        objects[(Bucket, Key)] = Body
+
+    client.get_object.side_effect = get_object
+    client.head_object.side_effect = head_object
+    client.put_object.side_effect = put_object
+    session = mock.MagicMock(name="mock_session")
+    session.client.return_value = client
+    return session
+
+
+def test_s3_loader_compiles_on_the_fly():
+    clear_cache()
+    objects = {("bucket", "my.json"): json.dumps(_config()).encode("utf-8")}
+    calls = []
+    session = _s3_session(objects, calls)
+    config = S3JsonLoader("bucket", "my.json", compiled=True).load(session)
+    compiled_key = artifact_key("my.json", "\"abc\"")
+    assert ("bucket", compiled_key) in objects
+    assert list(config["paths"]) == _config()["paths"]
+    # Another container finds the artifact, and doesn't need the json.
+    calls.clear()
+    loader = CachedLoader(S3JsonLoader("bucket", "my.json", compiled=True), ttl=0)
+    assert compile_paths(loader.load(session)["paths"]).match("reports/a.csv").index == 0
+    assert calls == [compiled_key]
+    # Unchanged, nothing more is downloaded.
+    loader.load(session)
+    assert calls == [compiled_key]
+    clear_cache()
+
+
+def test_s3_loader_falls_back_on_invalid_config():
+    config = {"paths": [{"pattern": "reports/.*"}]}
+    objects = {("bucket", "my.json"): json.dumps(config).encode("utf-8")}
+    session = _s3_session(objects, [])
+    assert S3JsonLoader("bucket", "my.json", compiled=True).load(session) == config
+    assert len(objects) == 1
+
+
+def test_compile_cli(tmp_path):
+    source = tmp_path / "schema.json"
+    source.write_text(json.dumps(_config()))
+    assert main([str(source)]) == 0
+    compiled = read_artifact((tmp_path / "schema.json.arrow").read_bytes())
+    assert len(compiled["paths"]) == 2
+    source.write_text(json.dumps({"paths": [{"pattern": "x"}]}))
+    assert main([str(source), "--check"]) == 1
+
+
+def test_compile_cli_s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    monkeypatch.setenv("AWS_REGION", "us-east-1")
+    clear_pools()
+    try:
+        with mock_aws():
+            client = boto3.client("s3", region_name="us-east-1")
+            client.create_bucket(Bucket="schemas")
+            client.put_object(Bucket="schemas", Key="schema.json",
+                              Body=json.dumps(_config()).encode("utf-8"))
+            assert main(["s3://schemas/schema.json", "--check"]) == 0
+            assert main(["s3://schemas/schema.json"]) == 0
+            etag = client.head_object(Bucket="schemas", Key="schema.json")["ETag"]
+            body = client.get_object(Bucket="schemas",
+                                     Key=artifact_key("schema.json", etag))["Body"].read()
+            assert len(read_artifact(body)["paths"]) == 2
+    finally:
+        clear_pools()
+
+
+def test_fetch_compiled_config_replaced():
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="schemas")
+        old = client.put_object(Bucket="schemas", Key="schema.json",
+                                Body=json.dumps(_config()).encode("utf-8"))["ETag"]
+        # Replaced after its ETag was looked up.
+        config = _config()
+        del config["paths"][1]
+        new = client.put_object(Bucket="schemas", Key="schema.json",
+                                Body=json.dumps(config).encode("utf-8"))["ETag"]
+        loaded, etag = fetch_compiled(client, "schemas", "schema.json", old)
+        assert etag == new
+        assert len(loaded["paths"]) == 1
+        keys = [item["Key"] for item in client.list_objects_v2(Bucket="schemas")["Contents"]]
+        assert artifact_key("schema.json", new) in keys
+        assert artifact_key("schema.json", old) not in keys
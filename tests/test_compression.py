@@ -0,0 +1,48 @@
+from csv_validator.compression import codec_from_magic, decompressing_stream
+from csv_validator.compression import MAGIC_SIZE, detect_codec, split_extension
+
+import io
+
+import pyarrow
+
+
+def _compress(content, codec):
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.CompressedOutputStream(sink, codec) as out:
+        out.write(content)
+    return sink.getvalue().to_pybytes()
+
+
+def test_split_extension():
+    assert split_extension("a/b.csv") == ("csv", None)
+    assert split_extension("a/b.csv.gz") == ("csv", "gz")
+    assert split_extension("a/b.CSV.GZIP") == ("CSV", "gzip")
+    assert split_extension("a.b/c.csv.zst") == ("csv", "zst")
+    assert split_extension("a/b.gz") == ("gz", None)
+    assert split_extension("a/b.tar.bz2") == ("tar", "bz2")
+
+
+def test_detect_codec():
+    for codec in ["gzip", "zstd", "bz2"]:
+        data = _compress(b"id|alpha\n", codec)[:MAGIC_SIZE]
+        assert codec_from_magic(data, printable=True) == codec
+        assert detect_codec("a/b.csv.gz", data) == codec
+    # Binary magic bytes win over a plain extension.
+    assert detect_codec("a/b.csv", _compress(b"id\n", "gzip")[:MAGIC_SIZE]) == "gzip"
+    assert detect_codec("a/b.csv", _compress(b"id\n", "zstd")[:MAGIC_SIZE]) == "zstd"
+    # bz2's are printable, a plain csv can start with them.
+    assert detect_codec("a/b.csv", b"BZh91AY&SY") is None
+    assert detect_codec("a/b.csv", b"BZh|id|a\n1") is None
+    assert detect_codec("a/b.csv.bz2", b"BZh|id|a\n1") is None
+    assert detect_codec("a/b.csv.gz", b"id|a") is None
+    # Empty files fall back to the extension.
+    assert detect_codec("a/b.csv.gz", b"") == "gzip"
+    assert detect_codec("a/b.csv", b"") is None
+
+
+def test_decompressing_stream():
+    content = b"id|alpha\n1|1.5\n" * 1000
+    for codec in ["gzip", "zstd", "bz2"]:
+        data = _compress(content, codec)
+        stream = decompressing_stream(io.BytesIO(data), codec)
+        assert stream.read() == content
@@ -1,8 +1,12 @@
 import json
 import os
+import threading
 import unittest.mock as mock
 
-from csv_validator.config import S3JsonLoader
+from csv_validator.config import (CachedLoader, ConfigLoader, S3JsonLoader,
+                                  cache_stats, clear_cache)
+
+from botocore.exceptions import ClientError
 
 import pytest
 
@@ -31,3 +35,96 @@ def test_s3_json_loader(simple_schema_raw):
     loader = S3JsonLoader(bucket, key)
     result = loader.load(session)
     assert result == json.loads(simple_schema_raw)
+
+
+def _mock_session(body, etag="\"abc\""):
+    mock_stream = mock.MagicMock()
+    mock_stream.read.return_value = body
+    mock_client = mock.MagicMock(name="mock_client")
+    mock_client.get_object.return_value = {"Body": mock_stream, "ETag": etag}
+    session = mock.MagicMock(name="mock_session")
+    session.client.return_value = mock_client
+    return session, mock_client
+
+
+def test_cached_loader_hits(simple_schema_raw):
+    clear_cache()
+    session, client = _mock_session(simple_schema_raw)
+    loader = CachedLoader(S3JsonLoader("bucket", "my.json"), ttl=60)
+    assert loader.load(session) == json.loads(simple_schema_raw)
+    # A new loader for the same object (i.e. the next invocation) hits.
+    loader = CachedLoader(S3JsonLoader("bucket", "my.json"), ttl=60)
+    assert loader.load(session) == json.loads(simple_schema_raw)
+    assert client.get_object.call_count == 1
+    assert cache_stats() == {"hits": 1, "misses": 1, "revalidations": 0}
+
+
+def test_cached_loader_revalidates(simple_schema_raw):
+    clear_cache()
+    session, client = _mock_session(simple_schema_raw)
+    loader = CachedLoader(S3JsonLoader("bucket", "my.json"), ttl=0)
+    loader.load(session)
+    # Unchanged, S3 answers 304 Not Modified.
+    client.get_object.side_effect = ClientError(
+        {"Error": {"Code": "304"}, "ResponseMetadata": {"HTTPStatusCode": 304}},
+        "GetObject"
+    )
+    assert loader.load(session) == json.loads(simple_schema_raw)
+    client.get_object.assert_called_with(Bucket="bucket", Key="my.json",
+                                         IfNoneMatch="\"abc\"")
+    # Changed, the new config is loaded.
+    client.get_object.side_effect = None
+    client.get_object.return_value["Body"].read.return_value = b'{"paths": []}'
+    assert loader.load(session) == {"paths": []}
+    assert cache_stats() == {"hits": 0, "misses": 2, "revalidations": 1}
+    clear_cache()
+
+
+class _BlockingLoader(ConfigLoader):
+    """Returns its name as config once released."""
+    def __init__(self, name, release):
+        self.name = name
+        self.release = release
+        self.started = threading.Event()
+        self.calls = 0
+
+    def cache_key(self):
+        return self.name
+
+    def load_if_changed(self, session, version):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(10)
+        return {"name": self.name}, "v1"
+
+
+def test_cached_loader_fetches_outside_the_lock():
+    clear_cache()
+    release = threading.Event()
+    slow = _BlockingLoader("slow", release)
+    results = []
+
+    def load():
+        results.append(CachedLoader(slow, ttl=60).load(None))
+
+    threads = [threading.Thread(target=load) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    assert slow.started.wait(5)
+    # Another config loads while the slow fetch is in flight.
+    fast = _BlockingLoader("fast", threading.Event())
+    fast.release.set()
+    other = threading.Thread(target=CachedLoader(fast, ttl=60).load,
+                             args=(None,))
+    other.start()
+    other.join(2)
+    assert not other.is_alive()
+    assert fast.calls == 1
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    # Concurrent loads of the same key share one fetch.
+    assert slow.calls == 1
+    assert results == [{"name": "slow"}] * 3
+    assert cache_stats() == {"hits": 2, "misses": 2, "revalidations": 0}
+    clear_cache()
@@ -0,0 +1,108 @@
+from csv_validator.constraints import ConstraintSet
+from csv_validator.patterns import PathEntry
+
+import datetime
+
+import pyarrow
+import pytest
+
+
+FIELDS = [
+    {"name": "id", "type": "int64", "nullable": False},
+    {"name": "amount", "type": "double", "nullable": True},
+    {"name": "code", "type": "string", "nullable": True},
+    {"name": "start", "type": "date32", "nullable": True},
+    {"name": "end", "type": "date32", "nullable": True}
+]
+
+
+def _path(constraints=None, **field_constraints):
+    fields = []
+    for field in FIELDS:
+        field = dict(field)
+        if field["name"] in field_constraints:
+            field["constraints"] = field_constraints[field["name"]]
+        fields.append(field)
+    path = {"pattern": ".*", "delimiter": ",", "primary_key": "id",
+            "fields": fields}
+    if constraints is not None:
+        path["constraints"] = constraints
+    return path
+
+
+def _batch():
+    schema = PathEntry(0, _path()).schema
+    return pyarrow.record_batch([
+        pyarrow.array([1, 2, 3, 4]),
+        pyarrow.array([10.0, -1.0, None, 250.0]),
+        pyarrow.array(["ABC", "XYZ", "abc", None]),
+        pyarrow.array([datetime.date(2024, 1, 1), datetime.date(2024, 2, 1),
+                       None, datetime.date(2023, 6, 1)], pyarrow.date32()),
+        pyarrow.array([datetime.date(2024, 1, 5), datetime.date(2024, 1, 1),
+                       datetime.date(2024, 1, 1), datetime.date(2023, 7, 1)],
+                      pyarrow.date32())
+    ], schema=schema)
+
+
+def _violations(path):
+    constraints = ConstraintSet(path, PathEntry(0, path).schema)
+    return {name: mask.to_pylist()
+            for name, mask in constraints.evaluate(_batch())}
+
+
+def test_field_constraints():
+    violations = _violations(_path(
+        amount={"non_negative": True, "max": 100},
+        code={"regex": "[A-Z]{3}", "enum": ["ABC", "DEF"], "max_length": 3}
+    ))
+    assert violations == {
+        "amount.non_negative": [False, True, False, False],
+        "amount.max": [False, False, False, True],
+        # The regex has to match the whole value.
+        "code.regex": [False, False, True, False],
+        "code.enum": [False, True, True, False],
+        "code.max_length": [False, False, False, False]
+    }
+    # Nulls only fail not_null.
+    assert _violations(_path(code={"not_null": True, "min_length": 1})) == {
+        "code.not_null": [False, False, False, True],
+        "code.min_length": [False, False, False, False]
+    }
+
+
+def test_cross_column_constraints():
+    violations = _violations(_path([
+        {"name": "ends_after_start",
+         "check": {"column": "end", "ge": {"column": "start"}}},
+        {"name": "xyz_from_2024", "when": {"column": "code", "eq": "XYZ"},
+         "check": {"column": "start", "ge": "2024-03-01"}},
+        {"check": {"any": [{"column": "amount", "lt": 100},
+                           {"not": {"column": "code", "in": ["ABC", "XYZ"]}}]}}
+    ]))
+    assert violations == {
+        "ends_after_start": [False, True, False, False],
+        "xyz_from_2024": [False, True, False, False],
+        "constraint 2": [False, False, False, False]
+    }
+
+
+def test_constraint_columns_projected():
+    path = _path([{"check": {"column": "end", "ge": {"column": "start"}}}],
+                 amount={"min": 0})
+    for field in path["fields"]:
+        field["check"] = "presence"
+    entry = PathEntry(0, path)
+    assert entry.constraints.columns == {"amount", "start", "end"}
+    assert entry.projected == ["id", "amount", "start", "end"]
+    assert PathEntry(0, _path()).constraints is None
+
+
+def test_invalid_constraints():
+    schema = PathEntry(0, _path()).schema
+    with pytest.raises(ValueError, match="unknown column: missing"):
+        ConstraintSet(_path([{"check": {"column": "missing", "eq": 1}}]), schema)
+    with pytest.raises(ValueError, match="Unknown constraint on amount"):
+        ConstraintSet(_path(amount={"between": [0, 1]}), schema)
+    with pytest.raises(ValueError, match="exactly one operator"):
+        ConstraintSet(_path([{"check": {"column": "id", "gt": 0, "lt": 5}}]),
+                      schema)
@@ -0,0 +1,147 @@
+import email
+import time
+import unittest.mock as mock
+
+from csv_validator.digest import DigestNotifier, FileSpool, S3Spool, digest_rows
+from csv_validator.digest import MemorySpool, digest_spool
+
+import boto3
+from moto import mock_aws
+from moto.core import DEFAULT_ACCOUNT_ID
+from moto.ses.models import ses_backends
+
+import pytest
+
+
+SENDER = "me@example.com"
+
+
+def _results(key, name="ValidateSchema", status="FAILED", output="bad value"):
+    return [("SUCCESS", "FileFormatValidator", "File format", "", "data", key),
+            (status, name, "Validate the schema", output, "data", key)]
+
+
+def _pattern_of(key):
+    return "reports/.*" if key.startswith("reports/") else None
+
+
+@pytest.fixture
+def ses():
+    # moto's in-process SES, which keeps what it was sent.
+    with mock_aws():
+        session = boto3.session.Session(region_name="us-east-1",
+                                        aws_access_key_id="test",
+                                        aws_secret_access_key="test")
+        session.client("ses").verify_email_identity(EmailAddress=SENDER)
+        yield session, ses_backends[DEFAULT_ACCOUNT_ID]["us-east-1"]
+
+
+def _attachments(raw):
+    message = email.message_from_string(raw)
+    return message["Subject"], {part.get_filename(): part.get_payload()
+                                for part in message.walk() if part.get_filename()}
+
+
+def test_digest_rows():
+    records = [
+        {"name": "ValidateSchema", "pattern": "reports/.*", "bucket": "data",
+         "key": f"reports/{i}.csv", "output": "bad", "at": 100 + i}
+        for i in range(3)
+    ] + [{"name": "FileFormatValidator", "pattern": "x/", "bucket": "data",
+          "key": "x/a.txt", "output": "", "at": 50}]
+    rows = digest_rows(records)
+    assert [row[:4] for row in rows] == [("ValidateSchema", "reports/.*", 3, 3),
+                                         ("FileFormatValidator", "x/", 1, 1)]
+    assert rows[0][6] == "reports/0.csv"
+
+
+def test_digest_flushes_on_window(ses, tmp_path):
+    session, backend = ses
+    spool = FileSpool(str(tmp_path / "spool.jsonl"))
+    notifier = DigestNotifier(SENDER, ["you@example.com"], session, spool,
+                              window_seconds=60, pattern_of=_pattern_of)
+    for i in range(5):
+        notifier.notify(_results(f"reports/{i}.csv"))
+    # Delivered twice, counted once.
+    notifier.notify(_results("reports/0.csv"))
+    notifier.notify(_results("other/a.txt", name="FileFormatValidator"))
+    # Nothing failed, nothing to add.
+    notifier.notify(_results("reports/9.csv", status="SUCCESS"))
+    assert backend.sent_message_count == 0
+    assert spool.summary()[0] == 7
+    # The spool outlives the process, e.g. a restarted lambda.
+    spool = FileSpool(str(tmp_path / "spool.jsonl"))
+    notifier = DigestNotifier(SENDER, ["you@example.com"], session, spool,
+                              window_seconds=60, pattern_of=_pattern_of)
+    assert notifier.flush_if_due(now=spool.summary()[1] + 61) == 7
+    assert backend.sent_message_count == 1
+    subject, attachments = _attachments(backend.sent_messages[0].raw_data)
+    assert subject == "S3 File Notification Digest: 6 failures in 6 files"
+    digest = attachments["digest.csv"].splitlines()
+    assert digest[1].startswith("ValidateSchema,reports/.*,5,5,")
+    assert digest[2].startswith("FileFormatValidator,other/,1,1,")
+    assert len(attachments["failures.csv"].splitlines()) == 7
+    assert spool.summary() == (0, None)
+    assert (tmp_path / "spool.jsonl").read_text() == ""
+
+
+def test_digest_flushes_on_size(ses):
+    session, backend = ses
+    notifier = DigestNotifier(SENDER, ["you@example.com"], session, max_failures=3)
+    notifier.notify(_results("reports/1.csv"))
+    notifier.notify(_results("reports/2.csv"))
+    assert backend.sent_message_count == 0
+    notifier.notify(_results("reports/3.csv"))
+    assert backend.sent_message_count == 1
+
+
+def test_digest_keeps_failures_when_send_fails():
+    session = mock.MagicMock(name="mock_session")
+    session.client.return_value.send_email.side_effect = RuntimeError("throttled")
+    notifier = DigestNotifier(SENDER, ["you@example.com"], session, max_failures=1)
+    with pytest.raises(RuntimeError):
+        notifier.notify(_results("reports/1.csv"))
+    assert notifier.spool.summary()[0] == 1
+
+
+def test_s3_spool(ses):
+    session, backend = ses
+    session.client("s3").create_bucket(Bucket="spool")
+    # S3 has to be asked for, it needs the role to write to the bucket.
+    assert isinstance(digest_spool(None, session), MemorySpool)
+    spool = digest_spool("s3://spool/digest", session)
+    assert isinstance(spool, S3Spool)
+    assert spool.prefix == "digest/"
+    first = DigestNotifier(SENDER, ["you@example.com"], session, spool)
+    second = DigestNotifier(SENDER, ["you@example.com"], session, S3Spool("spool", "digest/", session))
+    first.notify(_results("reports/1.csv"))
+    second.notify(_results("reports/2.csv"))
+    count, oldest = spool.summary()
+    assert count == 2
+    # Another flush in progress holds the lock.
+    assert spool.lock()
+    assert second.flush() == 0
+    spool.unlock()
+    assert second.flush_if_due(now=oldest + 300) == 2
+    assert backend.sent_message_count == 1
+    assert spool.summary() == (0, None)
+    keys = session.client("s3").list_objects_v2(Bucket="spool").get("Contents", [])
+    assert keys == []
+
+
+def test_s3_spool_stale_lock(ses):
+    session, _ = ses
+    client = session.client("s3")
+    client.create_bucket(Bucket="spool")
+    assert S3Spool("spool", "digest/", session).lock()
+    # A fresh lock isn't taken over.
+    assert not S3Spool("spool", "digest/", session).lock()
+    # Two containers find the same stale lock, only one takes it over.
+    stale = client.head_object(Bucket="spool", Key="digest/flush.lock")
+    racing = mock.MagicMock(wraps=client)
+    racing.head_object.return_value = stale
+    racing_session = mock.MagicMock()
+    racing_session.client.return_value = racing
+    with mock.patch("csv_validator.digest.time.time", return_value=time.time() + 600):
+        assert [S3Spool("spool", "digest/", racing_session).lock()
+                for _ in range(2)] == [True, False]
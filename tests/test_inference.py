@@ -0,0 +1,125 @@
+import gzip
+import json
+import sys
+
+import unittest.mock as mock
+
+from csv_validator.inference import infer_file, infer_schema, join_kinds, widen
+from csv_validator.rules import SUCCESS, ValidateSchema
+
+import pyarrow
+import pyarrow.csv as csv
+import pyarrow.fs
+
+
+def _types(inferred):
+    return {field["name"]: (field["type"], field["nullable"])
+            for field in inferred["fields"]}
+
+
+def test_join_kinds():
+    assert join_kinds("null", "int64") == "int64"
+    assert join_kinds("int64", "double") == "double"
+    assert join_kinds("date32[day]", "timestamp[s]") == "timestamp[s]"
+    assert join_kinds("int64", "bool") == "string"
+    assert join_kinds("double", "date32[day]") == "string"
+
+
+def test_widen():
+    assert widen("null", pyarrow.array(["1", "2"])) == "int64"
+    assert widen("int64", pyarrow.array(["1.5"])) == "double"
+    assert widen("double", pyarrow.array(["3"])) == "double"
+    assert widen("int64", pyarrow.array(["abc"])) == "string"
+    assert widen("null", pyarrow.array(["true", "False"])) == "bool"
+    assert widen("null", pyarrow.array(["2020-01-31"])) == "date32[day]"
+    assert widen("date32[day]", pyarrow.array(["2020-01-31 10:00:00"])) == "timestamp[s]"
+    assert widen("timestamp[s]", pyarrow.array(["2020-01-31 10:00:00.25"])) == "timestamp[ns]"
+    # Types are what the csv reader makes of the values, not a cast.
+    assert widen("null", pyarrow.array([" 1", "2 "])) == "int64"
+    assert widen("null", pyarrow.array([" 1.5"])) == "double"
+    assert widen("null", pyarrow.array(["true", "tRue"])) == "string"
+
+
+def test_inferred_schema_validates_its_sample(tmp_path):
+    rows = [f"{i}, {i}.5,{'tRue' if i % 3 else 'false'},{i % 2 or ' 1'}" for i in range(100)]
+    (tmp_path / "testb" / "reports").mkdir(parents=True)
+    path = tmp_path / "testb" / "reports" / "a.csv"
+    path.write_text("id,amount,flag,odd\n" + "\n".join(rows) + "\n")
+    inferred = infer_schema([str(path)], ",")
+    assert _types(inferred) == {"id": ("int64", False), "amount": ("double", False),
+                                "flag": ("string", False), "odd": ("int64", False)}
+    rule = ValidateSchema("", "", mock.MagicMock(), filesystem=pyarrow.fs.SubTreeFileSystem(
+        str(tmp_path), pyarrow.fs.LocalFileSystem()))
+    rule.paths = [{"pattern": "reports/.*", "delimiter": ",", "primary_key": "id",
+                   "fields": inferred["fields"]}]
+    assert rule.check_file("testb", "reports/a.csv") == (SUCCESS, "")
+
+
+def test_types_widen_across_batches(tmp_path):
+    rows = [f"{i},{i},2020-01-{i % 28 + 1:02d},{i % 2}" for i in range(2000)]
+    # Late values a single block would never have seen.
+    rows[1500] = "1500,1.5,2020-01-02 03:04:05,"
+    path = tmp_path / "a.csv"
+    path.write_text("id,amount,when,flag\n" + "\n".join(rows) + "\n")
+    inferred = infer_schema([str(path)], ",")
+    assert inferred["rows"] == 2000
+    assert _types(inferred) == {
+        "id": ("int64", False),
+        "amount": ("double", False),
+        "when": ("timestamp[s]", False),
+        "flag": ("int64", True),
+    }
+    # "flag" repeats and has a null, "when" repeats.
+    assert inferred["primary_key_candidates"] == ["id", "amount"]
+    # Small blocks, so the file is read in many batches.
+    inference = infer_file(str(path), ",", block_size=1024)
+    assert inference["kinds"] == ["int64", "double", "timestamp[s]", "int64"]
+    # The whole file reads with the inferred types.
+    types = {name: pyarrow.type_for_alias(kind) for name, (kind, _) in _types(inferred).items()}
+    csv.read_csv(str(path), convert_options=csv.ConvertOptions(column_types=types))
+
+
+def test_sample_rows(tmp_path):
+    path = tmp_path / "a.csv"
+    path.write_text("id,code\n1,10\n2,20\n3,x\n")
+    inferred = infer_schema([str(path)], ",", sample_rows=2)
+    assert inferred["rows"] == 2
+    assert _types(inferred)["code"] == ("int64", False)
+
+
+def test_merge_files(tmp_path):
+    first = tmp_path / "a.csv"
+    first.write_text("id|name|other\n1|a|\n2|b|\n")
+    second = tmp_path / "b.csv.gz"
+    with gzip.open(second, "wt") as f:
+        f.write("id|name|other\n3|a|\n4|c|x\n")
+    inferred = infer_schema([str(first), str(second)], "|", workers=2)
+    assert inferred["rows"] == 4
+    assert _types(inferred) == {
+        "id": ("int64", False),
+        "name": ("string", False),
+        "other": ("string", True),
+    }
+    # "name" is unique within each file, but not across them.
+    assert inferred["primary_key_candidates"] == ["id"]
+
+
+def test_schema_from_file_output(tmp_path, monkeypatch):
+    sys.path.insert(0, "bin")
+    try:
+        import schema_from_file
+    finally:
+        sys.path.remove("bin")
+    path = tmp_path / "a.csv"
+    path.write_text("code,id\n1,1\n1,2\n")
+    output = tmp_path / "out.json"
+    monkeypatch.chdir(tmp_path)
+    schema_from_file.main(["-i", str(path), "-o", str(output), "-p", "a.*"])
+    schema_from_file.main(["-i", str(path), "-o", str(output), "-k", "code"])
+    assert not (tmp_path / "schema.json").exists()
+    paths = json.loads(output.read_text())["paths"]
+    assert [entry["primary_key"] for entry in paths] == ["id", "code"]
+    assert paths[0]["fields"] == [
+        {"name": "code", "type": "int64", "nullable": False},
+        {"name": "id", "type": "int64", "nullable": False},
+    ]
@@ -0,0 +1,79 @@
+import threading
+import unittest.mock as mock
+
+from csv_validator.memory import MIN_BLOCK_SIZE, MemoryBudget, MemoryWatermark
+from csv_validator.memory import default_budget
+
+
+def test_reader_settings_without_pressure():
+    budget = MemoryBudget(None)
+    assert budget.reader_settings(None, True) == (1024 * 1024, True)
+    budget = MemoryBudget(1024 ** 3)
+    with mock.patch.object(budget, "used", return_value=0):
+        assert budget.reader_settings(2 * 1024 * 1024, False) == (2 * 1024 * 1024, False)
+
+
+def test_reader_settings_under_pressure():
+    budget = MemoryBudget(100 * 1024 * 1024)
+    with mock.patch.object(budget, "used", return_value=98 * 1024 * 1024):
+        assert budget.reader_settings(4 * 1024 * 1024, True) == (512 * 1024, False)
+    with mock.patch.object(budget, "used", return_value=200 * 1024 * 1024):
+        assert budget.reader_settings(4 * 1024 * 1024, True) == (MIN_BLOCK_SIZE, False)
+
+
+def test_concurrent_scans_share_the_budget():
+    budget = MemoryBudget(100 * 1024 * 1024)
+    barrier = threading.Barrier(4, timeout=5)
+    block_sizes = []
+
+    def scan():
+        barrier.wait()
+        block_sizes.append(budget.reader_settings(8 * 1024 * 1024, False)[0])
+        # Everything is reserved until every scan has its settings.
+        barrier.wait()
+        budget.release()
+
+    with mock.patch.object(budget, "used", return_value=0):
+        threads = [threading.Thread(target=scan) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    # Each would get 8 MB blocks alone (32 MB of the 100), together they
+    # fit in the budget and the later ones get smaller blocks.
+    assert sum(block_sizes) * 4 <= 100 * 1024 * 1024
+    assert sorted(block_sizes, reverse=True)[:2] == [8 * 1024 * 1024] * 2
+    assert min(block_sizes) < 8 * 1024 * 1024
+    assert budget.reserved == 0
+
+
+def test_ranged_concurrency():
+    budget = MemoryBudget(100 * 1024 * 1024)
+    with mock.patch.object(budget, "used", return_value=36 * 1024 * 1024):
+        assert budget.ranged_concurrency(8 * 1024 * 1024, 8) == 2
+    with mock.patch.object(budget, "used", return_value=100 * 1024 * 1024):
+        assert budget.ranged_concurrency(8 * 1024 * 1024, 8) == 1
+
+
+def test_default_budget(monkeypatch):
+    monkeypatch.delenv("MEMORY_BUDGET_MB", raising=False)
+    monkeypatch.delenv("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", raising=False)
+    assert default_budget() is None
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", "1000")
+    assert default_budget() == 800 * 1024 * 1024
+    monkeypatch.setenv("MEMORY_BUDGET_MB", "512")
+    assert default_budget() == 512 * 1024 * 1024
+
+
+def test_watermark():
+    pool = mock.MagicMock()
+    pool.bytes_allocated.side_effect = [10, 50, 20, 20]
+    pool.max_memory.return_value = 99
+    watermark = MemoryWatermark(pool)
+    watermark.sample()
+    watermark.sample()
+    stats = watermark.as_stats()
+    assert stats["arrow_peak_bytes"] == 50
+    assert stats["arrow_pool_max_memory"] == 99
+    assert stats["peak_rss"] > 0
+    assert stats["process_peak_rss"] > 0
@@ -0,0 +1,42 @@
+from csv_validator.metrics import MetricsEmitter, emf_record, with_throughput
+
+import io
+import json
+
+
+def test_with_throughput():
+    stats = {"rows": 1000, "bytes_fetched": 4000, "seconds": 4, "scan_seconds": 2}
+    assert with_throughput(stats) == dict(stats, rows_per_second=500,
+                                          bytes_per_second=2000)
+    assert with_throughput({"seconds": 0.5}) == {"seconds": 0.5}
+    assert with_throughput({"rows": 5, "seconds": 0}) == {"rows": 5, "seconds": 0}
+
+
+def test_emf_record():
+    record = emf_record({"rows": 10, "scan_seconds": 0.5, "sampled": True,
+                         "codec": "gzip"}, {"Rule": "ValidateSchema"},
+                        namespace="Test", timestamp=1700000000.5)
+    assert record["_aws"] == {
+        "Timestamp": 1700000000500,
+        "CloudWatchMetrics": [{
+            "Namespace": "Test",
+            "Dimensions": [["Rule"]],
+            "Metrics": [{"Name": "rows", "Unit": "Count"},
+                        {"Name": "scan_seconds", "Unit": "Seconds"}]
+        }]
+    }
+    # Values are in the record itself, metrics or not.
+    assert record["Rule"] == "ValidateSchema"
+    assert record["sampled"] is True
+    assert record["codec"] == "gzip"
+
+
+def test_metrics_emitter():
+    out = io.StringIO()
+    emitter = MetricsEmitter("Test", out)
+    emitter.emit({"rows": 1, "quarantine_errors": {"id": 1}}, {"Rule": "a"})
+    emitter.emit({"notify_seconds": 0.1}, {"Suite": "ValidationSuite"})
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [line["_aws"]["CloudWatchMetrics"][0]["Dimensions"] for line in lines] == \
+        [[["Rule"]], [["Suite"]]]
+    assert lines[0]["quarantine_errors"] == {"id": 1}
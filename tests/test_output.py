@@ -0,0 +1,119 @@
+import unittest.mock as mock
+
+from csv_validator.clients import pool
+from csv_validator.output import ValidatedOutput, output_key, resolve_location
+
+import boto3
+import pyarrow
+import pyarrow.fs
+import pyarrow.parquet as pq
+import pytest
+from moto import mock_aws
+from moto.settings import S3_UPLOAD_PART_MIN_SIZE
+
+
+def _local_fs(tmp_path):
+    return pyarrow.fs.SubTreeFileSystem(str(tmp_path),
+                                        pyarrow.fs.LocalFileSystem())
+
+
+def _batch():
+    return pyarrow.record_batch([pyarrow.array([1, 2]), pyarrow.array([1.5, 2.5])],
+                                names=["id", "alpha"])
+
+
+def test_output_key():
+    assert output_key("reports/a.csv") == "reports/a.parquet"
+    assert output_key("reports/a.csv.gz") == "reports/a.parquet"
+    assert output_key("reports/a.CSV", "arrow") == "reports/a.arrow"
+    assert output_key("reports/a.txt") == "reports/a.txt.parquet"
+    with pytest.raises(KeyError):
+        output_key("reports/a.csv", "orc")
+
+
+def test_resolve_location(tmp_path):
+    local = _local_fs(tmp_path)
+    assert resolve_location("out/prefix", local) == (local, "out/prefix")
+    filesystem, path = resolve_location(f"file://{tmp_path}/out", local)
+    assert isinstance(filesystem, pyarrow.fs.LocalFileSystem)
+    assert path == f"{tmp_path}/out"
+    # S3 locations share the container's filesystem.
+    assert resolve_location("s3://bucket/out", local) == (pool().filesystem(),
+                                                          "bucket/out")
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_validated_output_commit(tmp_path, fmt):
+    local = _local_fs(tmp_path)
+    output = ValidatedOutput(local, f"out/reports/a.{fmt}", fmt)
+    output.write(_batch())
+    output.write(_batch())
+    # Nothing shows up until the output is committed.
+    assert not (tmp_path / "out" / "reports" / f"a.{fmt}").exists()
+    output.commit()
+    output.abort()
+    if fmt == "parquet":
+        table = pq.read_table(str(tmp_path / "out" / "reports" / "a.parquet"))
+    else:
+        with pyarrow.memory_map(str(tmp_path / "out" / "reports" / "a.arrow")) as f:
+            table = pyarrow.ipc.open_file(f).read_all()
+    assert table.num_rows == 4
+    assert table.column_names == ["id", "alpha"]
+    assert [p.name for p in (tmp_path / "out" / "reports").iterdir()] == [f"a.{fmt}"]
+
+
+def test_validated_output_abort(tmp_path):
+    local = _local_fs(tmp_path)
+    output = ValidatedOutput(local, "out/a.parquet")
+    output.write(_batch())
+    output.abort()
+    assert not (tmp_path / "out" / "a.parquet").exists()
+    assert list((tmp_path / "out").iterdir()) == []
+    # An empty file is still written with the schema it was given.
+    schema = _batch().schema
+    output = ValidatedOutput(local, "out/empty.parquet", schema=schema)
+    output.commit()
+    assert pq.read_table(str(tmp_path / "out" / "empty.parquet")).schema == schema
+    with pytest.raises(ValueError):
+        ValidatedOutput(local, "out/a.orc", "orc")
+
+
+def _s3_output(client, key, part_size):
+    filesystem = mock.MagicMock(type_name="s3")
+    output = ValidatedOutput(filesystem, f"outb/{key}", "arrow", client=client)
+    output.write(_batch())
+    output.upload.part_size = part_size
+    return output
+
+
+def test_validated_output_s3():
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1",
+                              aws_access_key_id="test", aws_secret_access_key="test")
+        client.create_bucket(Bucket="outb")
+        # Written straight to the key in parts, nothing shows up until the
+        # upload is completed and nothing is staged or moved.
+        batch = pyarrow.record_batch([pyarrow.array(range(800000)),
+                                      pyarrow.array([0.5] * 800000)],
+                                     names=["id", "alpha"])
+        output = _s3_output(client, "a.arrow", S3_UPLOAD_PART_MIN_SIZE)
+        output.write(batch)
+        assert output.upload.upload_id is not None
+        assert "Contents" not in client.list_objects_v2(Bucket="outb")
+        output.commit()
+        output.filesystem.move.assert_not_called()
+        body = client.get_object(Bucket="outb", Key="a.arrow")["Body"].read()
+        assert pyarrow.ipc.open_file(pyarrow.BufferReader(body)).read_all().num_rows == 800002
+        # Small output is a single put.
+        output = _s3_output(client, "small.arrow", S3_UPLOAD_PART_MIN_SIZE)
+        output.commit()
+        assert output.upload.upload_id is None
+        body = client.get_object(Bucket="outb", Key="small.arrow")["Body"].read()
+        assert pyarrow.ipc.open_file(pyarrow.BufferReader(body)).read_all().num_rows == 2
+        # Aborting throws the parts away.
+        output = _s3_output(client, "b.arrow", S3_UPLOAD_PART_MIN_SIZE)
+        output.write(batch)
+        output.abort()
+        keys = [o["Key"] for o in client.list_objects_v2(Bucket="outb")["Contents"]]
+        assert keys == ["a.arrow", "small.arrow"]
+        assert "Uploads" not in client.list_multipart_uploads(Bucket="outb")
@@ -0,0 +1,74 @@
+import re
+
+from csv_validator.patterns import PathIndex, compile_paths, literal_prefix
+
+import pytest
+
+
+@pytest.mark.parametrize("pattern,prefix", [
+    ("reports/.*", "reports/"),
+    ("^reports/daily\\.csv", "reports/daily.csv"),
+    ("uploads/file.*\\.txt", "uploads/file"),
+    ("data/ab?c", "data/a"),
+    ("data/\\d+/x", "data/"),
+    (".*\\.csv", ""),
+    ("reports/a|uploads/b", ""),
+])
+def test_literal_prefix(pattern, prefix):
+    assert literal_prefix(pattern) == prefix
+
+
+def _paths(*patterns):
+    return [{"pattern": pattern} for pattern in patterns]
+
+
+def _first_match(paths, key):
+    for index, path in enumerate(paths):
+        if re.match(path["pattern"], key):
+            return index
+    return None
+
+
+@pytest.mark.parametrize("key", [
+    "reports/2020/a.csv",
+    "reports/daily.csv",
+    "uploads/x.csv",
+    "uploads/x.txt",
+    "other/x.csv",
+    "other/x.txt",
+])
+def test_match_is_first_in_config_order(key):
+    paths = _paths(
+        "reports/daily\\.csv",
+        ".*\\.txt",
+        "reports/.*",
+        "uploads/.*",
+        ".*\\.csv",
+    )
+    entry = PathIndex(paths).match(key)
+    expected = _first_match(paths, key)
+    assert (entry.index if entry else None) == expected
+
+
+def test_match_falls_back_for_backreferences():
+    paths = _paths("(a)\\1/.*", "(?i)REPORTS/.*", "reports/.*")
+    index = PathIndex(paths)
+    assert index.combined is None
+    assert index.match("aa/x.csv").index == 0
+    assert index.match("Reports/x.csv").index == 1
+    assert index.match("b/x.csv") is None
+
+
+def test_compile_paths_reuses_index():
+    paths = [{
+        "pattern": "reports/.*",
+        "delimiter": "|",
+        "primary_key": "id",
+        "fields": [{"name": "id", "type": "int64", "nullable": False}]
+    }]
+    index = compile_paths(paths)
+    assert compile_paths(paths) is index
+    entry = index.match("reports/a.csv")
+    assert entry.schema is entry.schema
+    assert entry.convert_options is entry.convert_options
+    assert compile_paths(list(paths)) is not index
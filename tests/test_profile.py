@@ -0,0 +1,98 @@
+from csv_validator.profile import HASH_CHUNK_BYTES, HLL_REGISTERS, SKETCH_SAMPLE
+from csv_validator.profile import HyperLogLog, Profiler, QuantileSketch
+from csv_validator.profile import hash_values, string_hashes
+
+import datetime
+import math
+import random
+
+import pyarrow
+import pyarrow.compute as pc
+
+
+def test_string_hashes():
+    values = pyarrow.array(["ab", "xab", "ab", "", "a", "a\0"])
+    hashes = string_hashes(values).to_pylist()
+    assert hashes[0] == hashes[2]
+    assert len(set(hashes)) == 5
+    # Slices hash the same as the values they hold.
+    assert string_hashes(values.slice(1)).to_pylist() == hashes[1:]
+
+
+def test_string_hashes_chunked():
+    values = [f"value-{i}" for i in range(200000)]
+    values[1000] = "x" * (HASH_CHUNK_BYTES + 5)
+    array = pyarrow.array(values)
+    hashes = string_hashes(array)
+    assert len(hashes) == len(values)
+    # Hashed in chunks, every value hashes the same as it does alone.
+    for index in [0, 999, 1000, 1001, 25000, 60001, 199999]:
+        assert hashes[index] == string_hashes(array.slice(index, 1))[0]
+    assert len(pc.unique(hashes)) == len(values)
+
+
+def test_hash_values_types():
+    for values in [pyarrow.array([1, 2, 3]), pyarrow.array([1.5, -0.5, 2.0]),
+                   pyarrow.array([True, False, True]),
+                   pyarrow.array([datetime.date(2020, 1, d) for d in (1, 2, 3)]),
+                   pyarrow.array([datetime.datetime(2020, 1, 1, h) for h in (1, 2, 3)]),
+                   pyarrow.array(["a", "b", "c"])]:
+        hashes = hash_values(values)
+        assert hashes.type == pyarrow.uint64()
+        assert len(pc.unique(hashes)) == len(pc.unique(values))
+
+
+def test_hyperloglog():
+    for values in [range(200000), [random.getrandbits(60) for _ in range(200000)],
+                   [f"key-{i}" for i in range(200000)]]:
+        hll = HyperLogLog()
+        array = pyarrow.array(values)
+        for start in range(0, len(array), 30000):
+            hll.add(array.slice(start, 30000))
+        # The standard error is 1.04 / sqrt(registers), allow 6 of them.
+        assert abs(hll.estimate() / len(array) - 1) < 6 * 1.04 / math.sqrt(HLL_REGISTERS)
+    # Small counts are close to exact, repeats aren't counted twice.
+    hll = HyperLogLog()
+    hll.add(pyarrow.array([1, 2, 3, 1, 2, 3]))
+    hll.add(pyarrow.array([3, 4]))
+    assert hll.estimate() == 4
+
+
+def test_quantile_sketch():
+    n, size = 400000, 50000
+    values = list(range(n))
+    random.shuffle(values)
+    sketch = QuantileSketch()
+    for start in range(0, n, size):
+        sketch.add(pyarrow.array(values[start:start + size]))
+    qs = [0.01, 0.5, 0.99]
+    # Batches are sampled, so each quantile is off by the sampling error
+    # of its rank: within 6 standard errors, short of a one in 10^8 miss.
+    sampled = n // ((size // SKETCH_SAMPLE) | 1)
+    for q, estimate in zip(qs, sketch.quantiles(qs)):
+        error = 6 * math.sqrt(q * (1 - q) / sampled) * n
+        assert abs(estimate - q * n) < error
+    assert QuantileSketch().quantiles([0.5]) == []
+
+
+def test_profiler():
+    profiler = Profiler()
+    for _ in range(2):
+        profiler.add(pyarrow.record_batch(
+            [pyarrow.array([1, 2, None]), pyarrow.array(["a", "abcd", None]),
+             pyarrow.array([datetime.date(2020, 1, 1)] * 3)],
+            names=["id", "name", "day"]))
+    profile = profiler.as_dict()
+    assert profile["rows"] == 6
+    column = profile["columns"]["id"]
+    assert (column["type"], column["count"], column["nulls"]) == ("int64", 6, 2)
+    assert (column["min"], column["max"], column["distinct"]) == (1, 2, 2)
+    assert column["quantiles"]["0.5"] in (1, 2)
+    # Lengths 1 and 4 fall in the buckets starting at 1 and 3.
+    assert profile["columns"]["name"]["length_histogram"] == {"0": 0, "1": 2, "3": 2}
+    assert profile["columns"]["day"]["min"] == "2020-01-01"
+    # Only the columns asked for are profiled.
+    profiler = Profiler(["name"])
+    profiler.add(pyarrow.record_batch([pyarrow.array([1]), pyarrow.array(["a"])],
+                                      names=["id", "name"]))
+    assert list(profiler.as_dict()["columns"]) == ["name"]
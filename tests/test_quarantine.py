@@ -0,0 +1,58 @@
+from csv_validator.quarantine import Quarantine, invalid_rows
+
+import pyarrow
+import pyarrow.csv as csv
+import pyarrow.fs
+
+
+def _local_fs(tmp_path):
+    return pyarrow.fs.SubTreeFileSystem(str(tmp_path),
+                                        pyarrow.fs.LocalFileSystem())
+
+
+def test_invalid_rows():
+    column = pyarrow.array(["1", "x", "3", "4", "y", None, "7"])
+    found = invalid_rows(column, pyarrow.int64())
+    assert [index for index, _ in found] == [1, 4]
+    assert "'x'" in found[0][1]
+    assert invalid_rows(pyarrow.array(["1.5", None]), pyarrow.float64()) == []
+    # Values that look right but aren't (out of range) are found too.
+    column = pyarrow.array(["1", "256", "NA", "b", " 2", "0x10"] * 1000)
+    found = invalid_rows(column, pyarrow.uint8())
+    assert [index for index, _ in found][:2] == [1, 3]
+    assert len(found) == 2000
+
+
+def test_quarantine_convert(tmp_path):
+    schema = pyarrow.schema([("id", pyarrow.int64()), ("alpha", pyarrow.float64()),
+                             ("name", pyarrow.string())])
+    q = Quarantine(schema, _local_fs(tmp_path), "q/a.quarantine.txt")
+    batch = pyarrow.record_batch(
+        [pyarrow.array(["1", "2", "x", "NA"]), pyarrow.array(["1.5", "y", "z", ""]),
+         pyarrow.array(["a", "", "c", "NA"])],
+        names=["id", "alpha", "name"])
+    converted, offsets = q.convert(batch, 10)
+    assert converted.schema == schema
+    # Null values are read as null like the csv reader does, except for
+    # string columns.
+    assert converted.to_pydict() == {"id": [1, None], "alpha": [1.5, None],
+                                     "name": ["a", "NA"]}
+    # The rows left keep their offsets in the file.
+    assert offsets.to_pylist() == [10, 13]
+    assert q.finish() == 2
+    assert q.column_errors == {"id": 1, "alpha": 2}
+    assert q.summary() == "alpha: 2, id: 1"
+    written = csv.read_csv(str(tmp_path / "q" / "a.quarantine.txt"))
+    # One line per bad value, column by column.
+    assert written.column("row").to_pylist() == [12, 11, 12]
+    assert written.column("column").to_pylist() == ["id", "alpha", "alpha"]
+    assert written.column("value").to_pylist() == ["x", "y", "z"]
+
+
+def test_quarantine_clean(tmp_path):
+    schema = pyarrow.schema([("id", pyarrow.int64())])
+    q = Quarantine(schema, _local_fs(tmp_path), "q/a.quarantine.txt")
+    q.convert(pyarrow.record_batch([pyarrow.array(["1"])], names=["id"]), 0)
+    assert q.finish() == 0
+    # Nothing is written for a clean file.
+    assert not (tmp_path / "q").exists()
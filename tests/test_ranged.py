@@ -0,0 +1,38 @@
+from csv_validator.ranged import RangedReader, last_row_end
+
+import pyarrow
+import pyarrow.csv as csv
+import pytest
+
+
+def test_last_row_end():
+    data = b'1,a\n2,b\n3,c'
+    assert last_row_end(data, False) == 8
+    assert last_row_end(b"no newline", False) == 0
+    # The last newline is inside a quoted field.
+    data = b'1,"a"\n2,"b\nc'
+    assert last_row_end(data, True) == 6
+    # Escaped quotes don't change the state.
+    data = b'1,"a""x"\n2,"b'
+    assert last_row_end(data, True) == 9
+    assert last_row_end(b'1,"a\nb\nc', True) == 0
+
+
+@pytest.mark.parametrize("part_size", [7, 16, 64, 1024])
+def test_ranged_reader_matches_stream(part_size):
+    rows = [f'{i},"value {i}\nline two, with ""quotes"""' for i in range(50)]
+    content = ("id,text\n" + "\n".join(rows) + "\n").encode("utf-8")
+    parse_options = csv.ParseOptions(newlines_in_values=True)
+    convert_options = csv.ConvertOptions(
+        column_types={"id": pyarrow.int64(), "text": pyarrow.string()})
+    expected = csv.read_csv(pyarrow.py_buffer(content),
+                            parse_options=parse_options,
+                            convert_options=convert_options)
+    reader = RangedReader(pyarrow.BufferReader(content), len(content),
+                          part_size=part_size, concurrency=3)
+    header = reader.peek_header()
+    assert header == b"id,text\n"
+    tables = list(reader.read(["id", "text"], parse_options,
+                              convert_options, len(header)))
+    assert pyarrow.concat_tables(tables).equals(expected)
+    assert reader.bytes_fetched >= len(content)
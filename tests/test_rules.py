@@ -1,8 +1,23 @@
+import asyncio
+import io
+import json
+import threading
+import time
 import unittest.mock as mock
 
+from csv_validator.cache import MemoryCache, result_key
+from csv_validator.metrics import MetricsEmitter
 from csv_validator.rules import FileFormatValidator, Rule, SUCCESS, ValidateSchema, ValidationSuite
-from csv_validator.rules import NoMatchingSchemaException
+from csv_validator.rules import ColumnOrderException, ConstraintViolationException
+from csv_validator.rules import DuplicatePrimaryKeyException
+from csv_validator.rules import EmptyPrimaryKeyException
+from csv_validator.rules import NoMatchingSchemaException, QuarantineLimitException
+from csv_validator.rules import WrongDelimiterException
+from csv_validator.rules import ScanStream
 
+import pyarrow.csv
+import pyarrow.fs
+import pyarrow.parquet
 import pyarrow.lib
 import pytest
 
@@ -104,6 +119,16 @@ def test_file_format_validator():
     v = FileFormatValidator("", "")
     v.validate(mock.MagicMock(), event)
     assert v.results[0][0] == "SUCCESS"
+    # Check compressed csv passes, but not any compressed file.
+    for key, status in [("reports/myfile.csv.gz", "SUCCESS"),
+                        ("reports/myfile.csv.zst", "SUCCESS"),
+                        ("reports/myfile.csv.bz2", "SUCCESS"),
+                        ("reports/myfile.xls.gz", "FAILED"),
+                        ("reports/myfile.gz", "FAILED")]:
+        event["Records"][0]["s3"]["object"]["key"] = key
+        v = FileFormatValidator("", "")
+        v.validate(mock.MagicMock(), event)
+        assert v.results[0][0] == status
 
 
 def test_get_schema():
@@ -139,3 +164,724 @@ def test_get_schema():
     r.paths = paths
     with pytest.raises(NoMatchingSchemaException):
         r.get_schema("items/stuff.csv")
+
+
+def _write_csv(tmp_path, key, content):
+    path = tmp_path / "testb" / key
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return path
+
+
+def _local_fs(tmp_path):
+    return pyarrow.fs.SubTreeFileSystem(str(tmp_path),
+                                        pyarrow.fs.LocalFileSystem())
+
+
+def _path(fields, **extra):
+    path = {
+        "pattern": "reports/.*",
+        "delimiter": "|",
+        "primary_key": "id",
+        "fields": [
+            {"name": name, "type": dtype, "nullable": True}
+            for name, dtype in fields
+        ]
+    }
+    path.update(extra)
+    return path
+
+
+def _compress(content, codec):
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.CompressedOutputStream(sink, codec) as out:
+        out.write(content)
+    return sink.getvalue().to_pybytes()
+
+
+def _scan(rule, key, path):
+    rule.paths = [path]
+    schema = rule.get_schema(key)
+    rule.scan_file("testb", key, schema)
+
+
+def test_scan_file_single_pass(tmp_path):
+    content = b"id|alpha\n1|1.5\n2|2.5\n"
+    _write_csv(tmp_path, "reports/a.csv", content)
+    local = _local_fs(tmp_path)
+    filesystem = mock.MagicMock(wraps=local)
+    r = ValidateSchema("", "", mock.MagicMock(), filesystem=filesystem)
+    _scan(r, "reports/a.csv", _path([("id", "int64"), ("alpha", "double")]))
+    filesystem.open_input_stream.assert_called_once_with("testb/reports/a.csv",
+                                                         compression=None)
+    assert r.stats["testb/reports/a.csv"]["bytes_fetched"] == len(content)
+
+
+def test_scan_file_header_checks(tmp_path):
+    _write_csv(tmp_path, "reports/order.csv", b"alpha|id\n1.5|1\n")
+    _write_csv(tmp_path, "reports/delim.csv", b"id,alpha\n1,1.5\n")
+    r = ValidateSchema("", "", mock.MagicMock(), filesystem=_local_fs(tmp_path))
+    path = _path([("id", "int64"), ("alpha", "double")])
+    with pytest.raises(ColumnOrderException):
+        _scan(r, "reports/order.csv", path)
+    with pytest.raises(WrongDelimiterException):
+        _scan(r, "reports/delim.csv", path)
+
+
+def test_scan_file_missing_primary_key(tmp_path):
+    _write_csv(tmp_path, "reports/pk.csv",
+               b"id|region|alpha\n1|east|1.5\n| |2.5\n3||3.5\n4|west|\n")
+    r = ValidateSchema("", "", mock.MagicMock(), filesystem=_local_fs(tmp_path))
+    fields = [("id", "int64"), ("region", "string"), ("alpha", "double")]
+    # Nulls in a non-string key are caught.
+    with pytest.raises(EmptyPrimaryKeyException, match=r"rows: 1\)"):
+        _scan(r, "reports/pk.csv", _path(fields))
+    # Whitespace only and empty strings are caught.
+    with pytest.raises(EmptyPrimaryKeyException, match=r"rows: 1, 2\)"):
+        _scan(r, "reports/pk.csv", _path(fields, primary_key="region"))
+    # Composite keys fail if any of the columns is missing.
+    with pytest.raises(EmptyPrimaryKeyException, match=r"rows: 1, 2\)"):
+        _scan(r, "reports/pk.csv", _path(fields, primary_key=["id", "region"]))
+    # Nullable columns outside the key are fine.
+    _write_csv(tmp_path, "reports/ok.csv", b"id|region|alpha\n1|east|\n")
+    _scan(r, "reports/ok.csv", _path(fields))
+
+
+def test_scan_file_duplicate_primary_key(tmp_path):
+    _write_csv(tmp_path, "reports/dup.csv",
+               b"id|region\n1|east\n2|east\n1|west\n3|west\n")
+    r = ValidateSchema("", "", mock.MagicMock(), filesystem=_local_fs(tmp_path))
+    fields = [("id", "int64"), ("region", "string")]
+    # Uniqueness isn't checked unless the path asks for it.
+    _scan(r, "reports/dup.csv", _path(fields))
+    unique = {"memory_budget_mb": 1, "spill_dir": str(tmp_path)}
+    with pytest.raises(DuplicatePrimaryKeyException, match=r"1 duplicate rows"):
+        _scan(r, "reports/dup.csv", _path(fields, unique_primary_key=unique))
+    _scan(r, "reports/dup.csv", _path(fields, primary_key=["id", "region"],
+                                      unique_primary_key=unique))
+
+
+def _event(bucket, *keys):
+    return {
+        "Records": [
+            {"s3": {"bucket": {"name": bucket}, "object": {"key": key}}}
+            for key in keys
+        ]
+    }
+
+
+def test_validate_records_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+
+    def check(bucket, key):
+        # Both records have to be in flight at once to get past here.
+        barrier.wait()
+        return ("SUCCESS", "") if key.endswith(".csv") else ("FAILED", "bad")
+
+    r = MockRuleOk("r", "rule")
+    r.concurrency = 2
+    r.validate_records(_event("testb", "a.txt", "b.csv"), check)
+    assert [row[0] for row in r.results] == ["FAILED", "SUCCESS"]
+    assert [row[5] for row in r.results] == ["a.txt", "b.csv"]
+    assert "seconds" in r.stats["testb/b.csv"]
+
+
+def test_validate_schema_checks_every_record(tmp_path):
+    _write_csv(tmp_path, "reports/bad.csv", b"id|alpha\n1|x\n")
+    _write_csv(tmp_path, "reports/good.csv", b"id|alpha\n1|1.5\n")
+    loader = mock.MagicMock()
+    loader.load.return_value = {
+        "paths": [_path([("id", "int64"), ("alpha", "double")])]
+    }
+    r = ValidateSchema("", "", loader, filesystem=_local_fs(tmp_path))
+    event = _event("testb", "reports/bad.csv", "other/x.csv", "reports/good.csv")
+    r.validate(mock.MagicMock(), event)
+    assert [row[0] for row in r.results] == ["FAILED", "FAILED", "SUCCESS"]
+    assert r.results[1][3] == "No schema matches key: other/x.csv"
+
+
+def test_scan_file_ranged(tmp_path):
+    rows = "".join(f"{i}|{i}.5\n" for i in range(500))
+    _write_csv(tmp_path, "reports/big.csv", ("id|alpha\n" + rows).encode())
+    _write_csv(tmp_path, "reports/bad.csv",
+               ("id|alpha\n" + rows + "|1.5\n").encode())
+    r = ValidateSchema("", "", mock.MagicMock(), filesystem=_local_fs(tmp_path))
+    path = _path([("id", "int64"), ("alpha", "double")],
+                 ranged_read={"part_size_mb": 0.001, "concurrency": 4})
+    _scan(r, "reports/big.csv", path)
+    assert r.stats["testb/reports/big.csv"]["ranged_gets"] > 4
+    with pytest.raises(EmptyPrimaryKeyException, match=r"rows: 500\)"):
+        _scan(r, "reports/bad.csv", path)
+
+
+def test_scan_file_sample(tmp_path):
+    rows = "".join(f"{i}|{i}.5\n" for i in range(1000))
+    content = ("id|alpha\n" + rows + "x|oops\n").encode()
+    _write_csv(tmp_path, "reports/big.csv", content)
+    local = _local_fs(tmp_path)
+    fields = [("id", "int64"), ("alpha", "double")]
+    # A row budget stops before the bad row at the end.
+    loader = mock.MagicMock()
+    loader.load.return_value = {"paths": [_path(fields, sample={"rows": 100})]}
+    r = ValidateSchema("", "", loader, filesystem=local)
+    r.validate(mock.MagicMock(), _event("testb", "reports/big.csv"))
+    assert r.results[0][0] == "SUCCESS"
+    assert r.results[0][3] == "sampled: first 100 rows checked"
+    # A byte budget only fetches that much, cut back to whole rows.
+    filesystem = mock.MagicMock(wraps=local)
+    r = ValidateSchema("", "", mock.MagicMock(), filesystem=filesystem)
+    _scan(r, "reports/big.csv", _path(fields, sample={"mb": 0.001}))
+    stats = r.stats["testb/reports/big.csv"]
+    assert stats["bytes_fetched"] == 1048
+    assert stats["sampled"]
+    filesystem.open_input_stream.assert_not_called()
+    # With sampling turned off the whole file is scanned.
+    r = ValidateSchema("", "", loader, filesystem=local, sampling=False)
+    r.validate(mock.MagicMock(), _event("testb", "reports/big.csv"))
+    assert r.results[0][0] == "FAILED"
+
+
+def test_scan_file_sample_short_file(tmp_path):
+    # The whole file fits in the first bytes peeked for magic bytes.
+    _write_csv(tmp_path, "reports/short.csv", b"id\n1\n2\nx\n")
+    r = ValidateSchema("", "", mock.MagicMock(), filesystem=_local_fs(tmp_path))
+    _scan(r, "reports/short.csv", _path([("id", "int64")], sample={"rows": 1}))
+    assert r.stats["testb/reports/short.csv"]["rows"] == 1
+    # Same for a file opened ahead of its scan.
+    r = ValidateSchema("", "", mock.MagicMock(), filesystem=_local_fs(tmp_path))
+    r._opened["testb/reports/short.csv"] = r.open_stream(
+        _local_fs(tmp_path), "testb/reports/short.csv")
+    _scan(r, "reports/short.csv", _path([("id", "int64")], sample={"rows": 2}))
+    assert r.stats["testb/reports/short.csv"]["rows"] == 2
+
+
+def test_scan_file_releases_memory(tmp_path):
+    _write_csv(tmp_path, "reports/a.csv", b"id|alpha\n1|1.5\n")
+    _write_csv(tmp_path, "reports/b.csv", b"id|alpha\n1|x\n")
+    loader = mock.MagicMock()
+    loader.load.return_value = {"paths": [_path([("id", "int64"), ("alpha", "double")])]}
+    r = ValidateSchema("", "", loader, filesystem=_local_fs(tmp_path),
+                       memory_budget=1024 ** 4)
+    r.validate(mock.MagicMock(), _event("testb", "reports/a.csv", "reports/b.csv"))
+    assert [row[0] for row in r.results] == [SUCCESS, "FAILED"]
+    # What the scans reserved is given back, whether they passed or not.
+    assert r.memory.reserved == 0
+
+
+def test_scan_stream_limit_after_peek():
+    raw = ScanStream(io.BytesIO(b"h\n1\n2\n3\n"))
+    raw.peek(6)
+    raw.limit(max_lines=2)
+    assert raw.read() == b"h\n1\n"
+    raw = ScanStream(io.BytesIO(b"h\n1\n2\n3\n"))
+    raw.peek(8)
+    raw.limit(max_bytes=5)
+    assert raw.read() == b"h\n1\n"
+
+
+class _ChunkedStream(io.BytesIO):
+    # Returns at most `chunk` bytes per read, like a network stream.
+    def __init__(self, content, chunk):
+        super().__init__(content)
+        self.chunk = chunk
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.chunk:
+            size = self.chunk
+        return super().read(size)
+
+
+def test_scan_stream_byte_budget_whole_lines():
+    content = b"h\n" + b"".join(b"%05d\n" % i for i in range(10))
+
+    def read_all(raw, size):
+        data = b""
+        while True:
+            read = raw.read(size)
+            if not read:
+                return data
+            assert size < 0 or len(read) <= size
+            data += read
+
+    for chunk in range(1, 9):
+        for budget in range(1, len(content) + 3):
+            expected = content[:content.rfind(b"\n", 0, budget) + 1]
+            # Lines that end past the budget are never returned in part,
+            # whatever the reads are cut into.
+            for size in (-1, 3):
+                raw = ScanStream(_ChunkedStream(content, chunk), max_bytes=budget)
+                assert read_all(raw, size) == expected, (chunk, budget, size)
+            raw = ScanStream(_ChunkedStream(content, chunk))
+            raw.peek(4)
+            raw.limit(max_bytes=budget)
+            assert read_all(raw, -1) == expected, (chunk, budget)
+
+
+def test_scan_file_presence_only_columns(tmp_path):
+    rows = "".join(f"{i}|{i}.5|not a number\n" for i in range(100))
+    _write_csv(tmp_path, "reports/wide.csv", ("id|alpha|beta\n" + rows).encode())
+    r = ValidateSchema("", "", mock.MagicMock(), filesystem=_local_fs(tmp_path))
+    path = _path([("id", "int64"), ("alpha", "double"), ("beta", "double")])
+    with pytest.raises(pyarrow.lib.ArrowInvalid):
+        _scan(r, "reports/wide.csv", path)
+    # Only converted columns are materialized.
+    path["fields"][2]["check"] = "presence"
+    _scan(r, "reports/wide.csv", path)
+    stats = r.stats["testb/reports/wide.csv"]
+    assert stats["bytes_materialized"] == 100 * 8 * 2
+    assert stats["bytes_not_materialized"] == 100 * 8
+    # Presence only columns still have to be in the header.
+    _write_csv(tmp_path, "reports/short.csv", b"id|alpha|gamma\n1|1.5|x\n")
+    with pytest.raises(ColumnOrderException):
+        _scan(r, "reports/short.csv", path)
+    # Primary key columns are always converted.
+    path["fields"][0]["check"] = "presence"
+    _write_csv(tmp_path, "reports/pk.csv", b"id|alpha|beta\n|1.5|x\n")
+    with pytest.raises(EmptyPrimaryKeyException):
+        _scan(r, "reports/pk.csv", path)
+    _write_csv(tmp_path, "reports/missing.csv", b"id|alpha\n1|1.5\n")
+    with pytest.raises(ColumnOrderException, match="column beta is missing"):
+        _scan(r, "reports/missing.csv", path)
+
+
+def test_scan_file_reader_settings(tmp_path):
+    _write_csv(tmp_path, "reports/a.csv", b"id|alpha\n1|1.5\n2|2.5\n")
+    r = ValidateSchema("", "", mock.MagicMock(), filesystem=_local_fs(tmp_path))
+    reader = {"block_size_mb": 0.25, "use_threads": False}
+    _scan(r, "reports/a.csv", _path([("id", "int64"), ("alpha", "double")],
+                                    reader=reader))
+    stats = r.stats["testb/reports/a.csv"]
+    assert stats["block_size"] == 256 * 1024
+    assert stats["use_threads"] is False
+    assert stats["peak_rss"] > 0
+    assert "arrow_peak_bytes" in stats
+
+
+@pytest.mark.parametrize("codec,extension", [("gzip", "gz"), ("zstd", "zst"),
+                                             ("bz2", "bz2")])
+def test_scan_file_compressed(tmp_path, codec, extension):
+    rows = "".join(f"{i}|{i}.5\n" for i in range(1000))
+    content = ("id|alpha\n" + rows).encode()
+    compressed = _compress(content, codec)
+    _write_csv(tmp_path, f"reports/a.csv.{extension}", compressed)
+    local = _local_fs(tmp_path)
+    fields = [("id", "int64"), ("alpha", "double")]
+    r = ValidateSchema("", "", mock.MagicMock(), filesystem=local)
+    _scan(r, f"reports/a.csv.{extension}", _path(fields))
+    stats = r.stats[f"testb/reports/a.csv.{extension}"]
+    assert stats["codec"] == codec
+    assert stats["rows"] == 1000
+    assert stats["bytes_fetched"] == len(compressed)
+    assert stats["bytes_decompressed"] == len(content)
+    if codec != "bz2":
+        # Binary magic bytes are trusted over a missing extension, and
+        # ranged reads fall back to streaming.
+        _write_csv(tmp_path, "reports/b.csv", compressed)
+        _scan(r, "reports/b.csv", _path(fields, ranged_read=True))
+        assert r.stats["testb/reports/b.csv"]["codec"] == codec
+    # Header problems are found in the decompressed data.
+    header = _compress(b"id,alpha\n1,1.5\n", codec)
+    _write_csv(tmp_path, f"reports/c.csv.{extension}", header)
+    with pytest.raises(WrongDelimiterException):
+        _scan(r, f"reports/c.csv.{extension}", _path(fields))
+
+
+def test_scan_file_bz2_lookalike_header(tmp_path):
+    # bz2's magic bytes are printable, a plain csv can start with them.
+    _write_csv(tmp_path, "reports/b.csv", b"BZh91AY&SY|alpha\n1|1.5\n")
+    r = ValidateSchema("", "", mock.MagicMock(), filesystem=_local_fs(tmp_path))
+    fields = [("BZh91AY&SY", "int64"), ("alpha", "double")]
+    _scan(r, "reports/b.csv", _path(fields, primary_key="BZh91AY&SY"))
+    assert "codec" not in r.stats["testb/reports/b.csv"]
+    assert r.stats["testb/reports/b.csv"]["rows"] == 1
+
+
+def test_scan_file_compressed_sample(tmp_path):
+    rows = "".join(f"{i}|{i}.5\n" for i in range(1000))
+    content = ("id|alpha\n" + rows + "x|oops\n").encode()
+    _write_csv(tmp_path, "reports/big.csv.gz",
+               _compress(content, "gzip"))
+    r = ValidateSchema("", "", mock.MagicMock(), filesystem=_local_fs(tmp_path))
+    fields = [("id", "int64"), ("alpha", "double")]
+    # The byte budget applies to the decompressed data.
+    _scan(r, "reports/big.csv.gz", _path(fields, sample={"mb": 0.001}))
+    stats = r.stats["testb/reports/big.csv.gz"]
+    assert stats["sampled"]
+    assert stats["rows"] < 1000
+    _scan(r, "reports/big.csv.gz", _path(fields, sample={"rows": 10}))
+    assert r.stats["testb/reports/big.csv.gz"]["rows"] == 10
+
+
+def test_scan_file_output(tmp_path):
+    _write_csv(tmp_path, "reports/a.csv", b"id|alpha|beta\n1|1.5|x\n2|2.5|y\n")
+    local = _local_fs(tmp_path)
+    fields = [("id", "int64"), ("alpha", "double"), ("beta", "string")]
+    path = _path(fields, output={"location": "out"})
+    path["fields"][2]["check"] = "presence"
+    r = ValidateSchema("", "", mock.MagicMock(), filesystem=local)
+    _scan(r, "reports/a.csv", path)
+    assert r.stats["testb/reports/a.csv"]["output"] == "out/reports/a.parquet"
+    # Presence only columns are read too, the output holds every column.
+    table = pyarrow.parquet.read_table(str(tmp_path / "out/reports/a.parquet"))
+    assert table.column_names == ["id", "alpha", "beta"]
+    assert table.column("id").to_pylist() == [1, 2]
+    assert table.column("beta").to_pylist() == ["x", "y"]
+    # Nothing is written for a file that fails.
+    _write_csv(tmp_path, "reports/b.csv", b"id|alpha|beta\n1|1.5|x\n|2.5|y\n")
+    with pytest.raises(EmptyPrimaryKeyException):
+        _scan(r, "reports/b.csv", path)
+    assert not (tmp_path / "out/reports/b.parquet").exists()
+    # Or for a sampled scan.
+    _scan(r, "reports/a.csv", _path(fields, output={"location": "out2"},
+                                    sample={"rows": 1}))
+    assert not (tmp_path / "out2").exists()
+
+
+@pytest.mark.parametrize("ranged_read", [False, True])
+def test_scan_file_quarantine(tmp_path, ranged_read):
+    content = b"id|alpha\n1|1.5\nx|2.5\n3|3.5|extra\n4|oops\n5|5.5\n"
+    _write_csv(tmp_path, "reports/a.csv", content)
+    fields = [("id", "int64"), ("alpha", "double")]
+    loader = mock.MagicMock()
+    path = _path(fields, quarantine=True, ranged_read=ranged_read)
+    loader.load.return_value = {"paths": [path]}
+    # Fail fast only reports the first error.
+    r = ValidateSchema("", "", mock.MagicMock(), filesystem=_local_fs(tmp_path))
+    with pytest.raises(pyarrow.lib.ArrowInvalid):
+        _scan(r, "reports/a.csv", _path(fields))
+    # Quarantine mode goes through the whole file.
+    r = ValidateSchema("", "", loader, filesystem=_local_fs(tmp_path))
+    r.validate(mock.MagicMock(), _event("testb", "reports/a.csv"))
+    assert r.results[0][0] == "FAILED"
+    assert r.results[0][3] == ("Quarantined 3 rows to testb/reports/a.quarantine.txt "
+                               "(alpha: 1, id: 1, unparsed: 1), stopped after 4 rows")
+    stats = r.stats["testb/reports/a.csv"]
+    assert stats["quarantine_errors"] == {"id": 1, "alpha": 1, "": 1}
+    written = pyarrow.csv.read_csv(str(tmp_path / "testb/reports/a.quarantine.txt"))
+    assert sorted(written.column("value").to_pylist()) == ["3|3.5|extra", "oops", "x"]
+    # Up to max_rows can be quarantined with the rest of the file passing,
+    # and written to another location.
+    path["quarantine"] = {"max_rows": 3, "location": "quarantined"}
+    path["output"] = {"location": "out"}
+    r = ValidateSchema("", "", loader, filesystem=_local_fs(tmp_path))
+    r.validate(mock.MagicMock(), _event("testb", "reports/a.csv"))
+    assert r.results[0][0] == "SUCCESS"
+    assert r.results[0][3].startswith(
+        "Quarantined 3 rows to quarantined/reports/a.quarantine.txt")
+    assert (tmp_path / "quarantined/reports/a.quarantine.txt").exists()
+    table = pyarrow.parquet.read_table(str(tmp_path / "out/reports/a.parquet"))
+    assert table.column("id").to_pylist() == [1, 5]
+
+
+def test_scan_file_quarantine_stops_early(tmp_path):
+    rows = "".join(f"{i}|x{i}\n" for i in range(5000))
+    _write_csv(tmp_path, "reports/a.csv", ("id|alpha\n" + rows).encode())
+    path = _path([("id", "int64"), ("alpha", "double")],
+                 quarantine={"max_rows": 10}, reader={"block_size_mb": 1024 / 1024 / 1024})
+    r = ValidateSchema("", "", mock.MagicMock(), filesystem=_local_fs(tmp_path))
+    # The scan stops at the batch that goes over the limit.
+    with pytest.raises(QuarantineLimitException, match="stopped after"):
+        _scan(r, "reports/a.csv", path)
+    stats = r.stats["testb/reports/a.csv"]
+    assert 10 < stats["quarantined_rows"] < 5000
+    assert stats["quarantine_stopped_at"] == stats["quarantined_rows"]
+
+
+def test_scan_file_quarantine_agrees(tmp_path):
+    fields = [("id", "int64"), ("alpha", "double"), ("flag", "bool"),
+              ("day", "date32")]
+    rows = [" 1| 1.5|true| 2020-01-01", "2 |nan|False|2020-01-02", "3|NA|1|",
+            "x|1.5|true|2020-01-01", "4| |true|2020-01-01", "5|1.5|tRue|2020-01-01",
+            "6|1.5|true|2020-01-01 ", "7|inf|0|2020-1-1"]
+    # Every row either passes or fails in both modes, and a file that
+    # passes reads the same either way.
+    for row in rows:
+        content = f"id|alpha|flag|day\n{row}\n".encode("utf-8")
+        _write_csv(tmp_path, "reports/a.csv", content)
+        r = ValidateSchema("", "", mock.MagicMock(), filesystem=_local_fs(tmp_path))
+        try:
+            _scan(r, "reports/a.csv", _path(fields, output={"location": "fast"}))
+            expected = pyarrow.parquet.read_table(str(tmp_path / "fast/reports/a.parquet"))
+        except pyarrow.lib.ArrowInvalid:
+            expected = None
+        r = ValidateSchema("", "", mock.MagicMock(), filesystem=_local_fs(tmp_path))
+        try:
+            _scan(r, "reports/a.csv", _path(fields, quarantine=True,
+                                            output={"location": "slow"}))
+            assert expected is not None, row
+            table = pyarrow.parquet.read_table(str(tmp_path / "slow/reports/a.parquet"))
+            assert table.equals(expected), row
+        except QuarantineLimitException:
+            assert expected is None, row
+
+
+def test_scan_file_profile(tmp_path):
+    rows = "".join(f"{i}|{i % 10}.5\n" for i in range(1000))
+    _write_csv(tmp_path, "reports/a.csv", ("id|alpha\n" + rows).encode())
+    fields = [("id", "int64"), ("alpha", "double")]
+    r = ValidateSchema("", "", mock.MagicMock(), filesystem=_local_fs(tmp_path))
+    _scan(r, "reports/a.csv", _path(fields, profile=True))
+    assert r.stats["testb/reports/a.csv"]["profile"] == "testb/reports/a.profile.json"
+    profile = json.loads((tmp_path / "testb/reports/a.profile.json").read_text())
+    assert profile["rows"] == 1000
+    assert profile["columns"]["alpha"]["distinct"] == 10
+    assert profile["columns"]["id"]["max"] == 999
+    # Columns and location can be picked, and failed files aren't profiled.
+    _write_csv(tmp_path, "reports/b.csv", b"id|alpha\n|1.5\n")
+    path = _path(fields, profile={"columns": ["alpha"], "location": "profiles"})
+    _scan(r, "reports/a.csv", path)
+    profile = json.loads((tmp_path / "profiles/reports/a.profile.json").read_text())
+    assert list(profile["columns"]) == ["alpha"]
+    with pytest.raises(EmptyPrimaryKeyException):
+        _scan(r, "reports/b.csv", path)
+    assert not (tmp_path / "profiles/reports/b.profile.json").exists()
+
+
+def _constrained_path(alpha_max, closed_alpha):
+    path = _path([("id", "int64"), ("alpha", "double"), ("state", "string")],
+                 reader={"block_size_mb": 128 / 1024 / 1024})
+    path["fields"][1]["constraints"] = {"non_negative": True, "max": alpha_max}
+    path["fields"][2]["constraints"] = {"enum": ["open", "closed"]}
+    path["constraints"] = [{"name": "closed_alpha",
+                            "when": {"column": "state", "eq": "closed"},
+                            "check": closed_alpha}]
+    return path
+
+
+def test_scan_file_constraints(tmp_path):
+    rows = "".join(f"{i}|{i % 10}.5|{'closed' if i % 3 == 0 else 'open'}\n"
+                   for i in range(40))
+    _write_csv(tmp_path, "reports/a.csv", ("id|alpha|state\n" + rows).encode())
+    r = ValidateSchema("", "", mock.MagicMock(), filesystem=_local_fs(tmp_path))
+    _scan(r, "reports/a.csv",
+          _constrained_path(9.5, {"column": "alpha", "ge": 0.5}))
+    # Failures are reported with their rows, across batches.
+    r.paths = [_constrained_path(8.5, {"column": "alpha", "gt": 3})]
+    status, message = r.check_file("testb", "reports/a.csv")
+    assert message == ("Constraint failed: alpha.max (rows: 9, 19, 29, 39); "
+                       "closed_alpha (rows: 0, 12, 21, 30)")
+    batches = r.stats["testb/reports/a.csv"]["batches"]
+    assert batches > 1
+    # The file fails as soon as enough rows are found to report.
+    with pytest.raises(ConstraintViolationException,
+                       match=r"alpha.max \(rows: 1, 2, 3, 4, 5, 6, 7, 8, 9, 11\)$"):
+        _scan(r, "reports/a.csv",
+              _constrained_path(1, {"column": "alpha", "ge": 0.5}))
+    assert r.stats["testb/reports/a.csv"]["batches"] < batches
+
+
+def test_scan_file_quarantine_offsets(tmp_path):
+    content = b"id|alpha|state\n0|1.5|open\nx|1.5|open\n|1.5|open\n3|9.5|open\n"
+    _write_csv(tmp_path, "reports/a.csv", content)
+    r = ValidateSchema("", "", mock.MagicMock(), filesystem=_local_fs(tmp_path))
+    path = _constrained_path(8.5, {"column": "alpha", "ge": 0.5})
+    path["quarantine"] = {"max_rows": 1}
+    path["primary_key"] = "state"
+    # Rows after a quarantined one are reported where they are in the file.
+    with pytest.raises(ConstraintViolationException, match=r"alpha.max \(rows: 3\)"):
+        _scan(r, "reports/a.csv", path)
+    path["primary_key"] = "id"
+    with pytest.raises(EmptyPrimaryKeyException, match=r"\(rows: 2\)"):
+        _scan(r, "reports/a.csv", path)
+
+
+def test_validation_suite_async():
+    rules = [MockRuleOk("r1", "first rule"), MockRuleFailure("r2", "second", "fail"),
+             MockRuleOk("r3", "never run")]
+    sent = threading.Event()
+    notifier = mock.MagicMock()
+    notifier.notify.side_effect = lambda results: sent.wait(5)
+    suite = ValidationSuite(rules, notifier)
+
+    async def run():
+        results = await suite.validate_async(_event("testb", "testkey"), mock.MagicMock())
+        # The results come back without waiting on the notification.
+        assert not sent.is_set()
+        sent.set()
+        await suite.wait_for_notification()
+        return results
+
+    results = asyncio.run(run())
+    assert [row[1] for row in results] == ["r1", "r2"]
+    notifier.notify.assert_called_once_with(results)
+    assert rules[2].results == []
+
+
+def _opening_filesystem(tmp_path, opened):
+    local = _local_fs(tmp_path)
+    filesystem = mock.MagicMock(wraps=local)
+
+    def open_input_stream(path, compression=None):
+        stream = local.open_input_stream(path, compression=compression)
+        opened.append(stream)
+        return stream
+
+    filesystem.open_input_stream.side_effect = open_input_stream
+    return filesystem
+
+
+def test_validate_schema_async(tmp_path):
+    content = b"id|alpha\n1|1.5\n2|2.5\n"
+    _write_csv(tmp_path, "reports/a.csv", content)
+    _write_csv(tmp_path, "reports/b.csv", b"id|alpha\n1|x\n")
+    opened = []
+    filesystem = _opening_filesystem(tmp_path, opened)
+    loader = mock.MagicMock()
+
+    def load(session):
+        # Only returns once both files are open, so fails unless the
+        # config and the files are fetched at the same time.
+        deadline = time.monotonic() + 5
+        while len(opened) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(opened) == 2
+        return {"paths": [_path([("id", "int64"), ("alpha", "double")])]}
+
+    loader.load.side_effect = load
+    r = ValidateSchema("", "", loader, filesystem=filesystem)
+    asyncio.run(r.validate_async(mock.MagicMock(),
+                                 _event("testb", "reports/a.csv", "reports/b.csv")))
+    assert [row[0] for row in r.results] == [SUCCESS, "FAILED"]
+    assert r.results[1][5] == "reports/b.csv"
+    # Each file was opened once and read on from where prefetch left off.
+    assert filesystem.open_input_stream.call_count == 2
+    assert r.stats["testb/reports/a.csv"]["bytes_fetched"] == len(content)
+    assert all(stream.closed for stream in opened)
+
+
+def test_validation_suite_async_releases_prefetch(tmp_path):
+    _write_csv(tmp_path, "reports/a.csv", b"id|alpha\n1|1.5\n")
+    _write_csv(tmp_path, "reports/a.txt", b"id|alpha\n1|1.5\n")
+    opened = []
+    loader = mock.MagicMock()
+    loader.load.side_effect = RuntimeError("never needed")
+    rules = [FileFormatValidator("format", ""),
+             ValidateSchema("", "", loader,
+                            filesystem=_opening_filesystem(tmp_path, opened))]
+    suite = ValidationSuite(rules, mock.MagicMock())
+    event = _event("testb", "reports/a.csv", "reports/a.txt")
+
+    async def run():
+        results = await suite.validate_async(event, mock.MagicMock())
+        await suite.wait_for_notification()
+        return results
+
+    results = asyncio.run(run())
+    assert [row[0] for row in results] == [SUCCESS, "FAILED"]
+    assert len(opened) == 2
+    assert all(stream.closed for stream in opened)
+
+
+def test_validation_suite_metrics(tmp_path):
+    _write_csv(tmp_path, "reports/a.csv", b"id|alpha\n1|1.5\n2|2.5\n")
+    loader = mock.MagicMock()
+    loader.load.return_value = {"paths": [_path([("id", "int64"), ("alpha", "double")])]}
+    out = io.StringIO()
+    rules = [FileFormatValidator("format", ""),
+             ValidateSchema("schema", "", loader, filesystem=_local_fs(tmp_path))]
+    suite = ValidationSuite(rules, mock.MagicMock(), MetricsEmitter(stream=out))
+    suite.validate(_event("testb", "reports/a.csv"), mock.MagicMock())
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [(r.get("Rule") or r.get("Suite"), r.get("key")) for r in records] == [
+        ("format", None), ("format", "reports/a.csv"),
+        ("schema", None), ("schema", "reports/a.csv"), ("ValidationSuite", None)
+    ]
+    assert "config_seconds" in records[2]
+    scan = records[3]
+    assert scan["status"] == SUCCESS
+    assert (scan["rows"], scan["batches"]) == (2, 1)
+    metrics = {m["Name"] for m in scan["_aws"]["CloudWatchMetrics"][0]["Metrics"]}
+    assert {"resolve_seconds", "header_seconds", "scan_seconds", "seconds",
+            "rows_per_second", "bytes_per_second"} <= metrics
+    assert "notify_seconds" in records[4]
+
+
+def _etag_event(bucket, *keys_and_etags):
+    event = _event(bucket, *[key for key, _ in keys_and_etags])
+    for record, (_, etag) in zip(event["Records"], keys_and_etags):
+        record["s3"]["object"]["eTag"] = etag
+    return event
+
+
+def test_validate_schema_result_cache(tmp_path):
+    _write_csv(tmp_path, "reports/a.csv", b"id|alpha\n1|1.5\n")
+    _write_csv(tmp_path, "reports/b.csv", b"id|alpha\n1|x\n")
+    _write_csv(tmp_path, "reports/copy/a.csv", b"id|alpha\n1|1.5\n")
+    loader = mock.MagicMock()
+    loader.load.return_value = {"paths": [_path([("id", "int64"), ("alpha", "double")])]}
+    cache = MemoryCache()
+    r = ValidateSchema("schema", "", loader, filesystem=_local_fs(tmp_path),
+                       result_cache=cache)
+    r.validate(mock.MagicMock(), _etag_event("testb", ("reports/a.csv", "e1"),
+                                             ("reports/b.csv", "e2")))
+    assert r.timings["cache_misses"] == 2
+    # A copy of a under another prefix and a re-upload of b aren't read.
+    r = ValidateSchema("schema", "", loader, filesystem=_local_fs(tmp_path),
+                       result_cache=cache)
+    with mock.patch.object(r, "scan_file") as scan_file:
+        r.validate(mock.MagicMock(), _etag_event("testb", ("reports/copy/a.csv", '"e1"'),
+                                                 ("reports/b.csv", "e2")))
+    scan_file.assert_not_called()
+    assert [row[0] for row in r.results] == [SUCCESS, "FAILED"]
+    assert r.stats["testb/reports/b.csv"]["cache_hit"] is True
+    assert r.timings["cache_hits"] == 2
+    assert r.timings["cache_hit_rate"] == 100
+
+
+def test_validate_schema_async_prefetch_window(tmp_path):
+    for name in "abc":
+        _write_csv(tmp_path, f"reports/{name}.csv", b"id|alpha\n1|1.5\n")
+    loader = mock.MagicMock()
+    loader.load.return_value = {"paths": [_path([("id", "int64"), ("alpha", "double")])]}
+    cache = MemoryCache()
+    opened = []
+    r = ValidateSchema("schema", "", loader, concurrency=2, result_cache=cache,
+                       filesystem=_opening_filesystem(tmp_path, opened))
+    asyncio.run(r.validate_async(mock.MagicMock(), _etag_event("testb", ("reports/c.csv", "e3"))))
+
+    async def run(event):
+        r.prefetch(mock.MagicMock(), event)
+        # Only the files checked first are opened ahead, and not those the
+        # result cache may answer.
+        assert sorted(r._opening) == ["testb/reports/a.csv"]
+        await r.validate_async(mock.MagicMock(), event)
+
+    # a and b have no ETag, so can't be answered from the cache.
+    event = _etag_event("testb", ("reports/c.csv", "e3"), ("reports/a.csv", ""),
+                        ("reports/b.csv", ""))
+    opened.clear()
+    asyncio.run(run(event))
+    assert [row[0] for row in r.results][-3:] == [SUCCESS] * 3
+    # c came from the cache, a and b were each opened once.
+    assert r.stats["testb/reports/c.csv"]["cache_hit"] is True
+    assert len(opened) == 2
+    assert all(stream.closed for stream in opened)
+
+
+def test_validate_schema_result_cache_misses(tmp_path):
+    _write_csv(tmp_path, "reports/a.csv", b"id|alpha\n1|1.5\n")
+    loader = mock.MagicMock()
+    loader.load.return_value = {"paths": [_path([("id", "int64"), ("alpha", "double")])]}
+    cache = MemoryCache()
+    event = _etag_event("testb", ("reports/a.csv", "e1"))
+    r = ValidateSchema("schema", "", loader, filesystem=_local_fs(tmp_path),
+                       result_cache=cache)
+    r.validate(mock.MagicMock(), event)
+    # A changed config entry isn't answered from the cache.
+    loader.load.return_value = {"paths": [_path([("id", "int64"), ("alpha", "string")])]}
+    r = ValidateSchema("schema", "", loader, filesystem=_local_fs(tmp_path),
+                       result_cache=cache)
+    r.validate(mock.MagicMock(), event)
+    assert r.timings["cache_misses"] == 1
+    # Nor are errors that aren't down to the file, which aren't cached.
+    r = ValidateSchema("schema", "", loader, filesystem=_local_fs(tmp_path),
+                       result_cache=cache)
+    with mock.patch.object(r, "scan_file", side_effect=OSError("S3 is down")):
+        r.validate(mock.MagicMock(), _etag_event("testb", ("reports/a.csv", "e3")))
+    assert cache.get(result_key("schema", "e3", r.resolve("reports/a.csv").fingerprint,
+                                True)) is None
+    # Nor files without an ETag in their record.
+    r = ValidateSchema("schema", "", loader, filesystem=_local_fs(tmp_path),
+                       result_cache=cache)
+    r.validate(mock.MagicMock(), _event("testb", "reports/a.csv"))
+    assert r.timings["cache_misses"] == 0
@@ -0,0 +1,25 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+
+from bench.bench_startup import LAZY_MODULES
+
+
+def _run(code, **env):
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True,
+                            text=True, check=True, env={**os.environ, **env})
+    return result.stdout.strip()
+
+
+def test_handler_import_is_lazy():
+    code = ("import json, sys, csv_validator.handler; "
+            f"print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))")
+    assert json.loads(_run(code)) == []
+
+
+def test_log_level():
+    code = "import logging, csv_validator.handler; print(logging.getLogger().level)"
+    assert _run(code) == str(logging.INFO)
+    assert _run(code, LOG_LEVEL="warning") == str(logging.WARNING)
@@ -0,0 +1,77 @@
+import random
+
+from csv_validator.uniqueness import DuplicateCounter, UniqueKeyTracker, key_array
+
+import pyarrow
+
+
+def _feed(tracker, keys, batch_size):
+    for start in range(0, len(keys), batch_size):
+        tracker.add(pyarrow.array(keys[start:start + batch_size]))
+    return tracker.finish()
+
+
+def test_duplicate_counter_across_chunks():
+    counter = DuplicateCounter()
+    counter.consume(pyarrow.array([1, 2, 2]))
+    counter.consume(pyarrow.array([2, 3, 4, 4]))
+    counter.consume(pyarrow.array([5]))
+    assert counter.duplicate_rows == 3
+    assert counter.duplicate_keys == 2
+    assert counter.samples == [2, 4]
+
+
+def test_unique_in_memory():
+    keys = list(range(1000))
+    random.Random(1).shuffle(keys)
+    counter = _feed(UniqueKeyTracker(), keys, 100)
+    assert counter.duplicate_rows == 0
+    counter = _feed(UniqueKeyTracker(), keys + [5, 5, 7], 100)
+    assert counter.duplicate_rows == 3
+    assert counter.duplicate_keys == 2
+    assert counter.samples == [5, 7]
+
+
+def test_spill_overlapping_runs(tmp_path):
+    keys = [f"k{i}" for i in range(5000)] + ["k10", "k4000", "k4000"]
+    random.Random(2).shuffle(keys)
+    tracker = UniqueKeyTracker(memory_budget=4096, spill_dir=str(tmp_path))
+    counter = _feed(tracker, keys, 250)
+    assert tracker.spills > 1
+    assert counter.duplicate_rows == 3
+    assert counter.duplicate_keys == 2
+    assert sorted(counter.samples) == ["k10", "k4000"]
+    # Spill files are cleaned up.
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_spill_disjoint_runs(tmp_path):
+    keys = list(range(5000)) + [4999]
+    tracker = UniqueKeyTracker(memory_budget=4096, spill_dir=str(tmp_path))
+    counter = _feed(tracker, keys, 250)
+    assert tracker.spills > 1
+    assert counter.duplicate_rows == 1
+    assert counter.samples == [4999]
+
+
+def test_null_keys_ignored(tmp_path):
+    keys = [None] + list(range(3000)) + [None, 7, None]
+    tracker = UniqueKeyTracker(memory_budget=4096, spill_dir=str(tmp_path))
+    # The first batch holds a null key and spills.
+    counter = _feed(tracker, keys, 600)
+    assert tracker.spills > 1
+    assert tracker.rows == 3001
+    assert counter.duplicate_rows == 1
+    assert counter.samples == [7]
+    counter = _feed(UniqueKeyTracker(), [None, None, 1], 2)
+    assert counter.duplicate_rows == 0
+
+
+def test_composite_key_array():
+    batch = pyarrow.record_batch(
+        [pyarrow.array(["a", "a"]), pyarrow.array([1, 2])],
+        names=["region", "id"]
+    )
+    keys = key_array(batch, ["region", "id"])
+    assert keys.to_pylist() == ["a\x1f1", "a\x1f2"]
+    assert key_array(batch, ["id"]).to_pylist() == [1, 2]